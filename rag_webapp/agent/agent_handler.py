@@ -1,23 +1,37 @@
 # In agents/agent_executor.py
 
 import os
-from langchain.agents import create_openai_tools_agent, AgentType, AgentExecutor, initialize_agent, create_react_agent, create_structured_chat_agent
-from langchain.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferWindowMemory
-from langchain import hub # hub is where we get pre-made prompts
-from icecream import ic
-ic.configureOutput(prefix=f'Debug | ', includeContext=True)
-
-# Import your tools
-from .agent_tools import query_document_tool, list_documents_tool, compare_documents_tool
-
-def create_agent_with_memory():
+import queue
+import threading
+from contextlib import contextmanager
+
+from .memory import get_memory_store, to_langchain_messages
+
+# LangChain, the Gemini client and the tools (which pull in the whole RAG
+# pipeline) are imported inside create_agent_executor, so importing this
+# module is cheap and works offline.
+
+# Agent executors per process. They hold no conversation state, so any of
+# them can serve any session; the pool only bounds concurrent agent runs.
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "2"))
+
+_agent_pool = None
+_agent_pool_lock = threading.Lock()
+
+def create_agent_executor():
     """
-    Creates a modern, conversational "Tools Agent" with memory that is
-    compatible with Google models and supports multi-argument tools.
+    Creates a modern, conversational "Tools Agent" that is compatible with
+    Google models and supports multi-argument tools.
+
+    The executor has no memory of its own: the conversation so far is passed
+    in as chat_history on every invoke (see run_agent).
     """
+    from langchain.agents import AgentExecutor, create_structured_chat_agent
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    from .agent_tools import query_document_tool, list_documents_tool, compare_documents_tool
+    from .prompts import structured_chat_prompt
+
     gemini_api_key = os.getenv("GEMINI_API_KEY")
     if not gemini_api_key:
         raise ValueError("GEMINI_API_KEY not found in environment variables.")
@@ -28,27 +42,85 @@ def create_agent_with_memory():
         google_api_key=gemini_api_key,
     )
 
-    prompt = hub.pull("hwchase17/structured-chat-agent")
+    # Vendored copy of hub "hwchase17/structured-chat-agent" (no network call)
+    prompt = structured_chat_prompt()
 
     tools = [query_document_tool, list_documents_tool, compare_documents_tool]
 
     agent = create_structured_chat_agent(llm, tools, prompt)
 
-    # 4. Set up the memory
-    memory = ConversationBufferWindowMemory(
-        k=5,
-        memory_key="chat_history",
-        input_key="input",
-        return_messages=True
-    )
-
-    # 5. Create the final AgentExecutor.
+    # Create the final AgentExecutor.
     agent_executor = AgentExecutor(
         agent=agent,
         tools=tools,
         verbose=True,
         handle_parsing_errors=True,
-        memory=memory
     )
 
     return agent_executor
+
+class AgentExecutorPool:
+    """A fixed number of agent executors, created on first checkout."""
+
+    def __init__(self, size, factory=create_agent_executor):
+        self.size = max(1, size)
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def executor(self):
+        """Checks an executor out for the duration of the block, waiting if all are busy."""
+        try:
+            executor = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    executor = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                executor = self._idle.get()
+        try:
+            yield executor
+        finally:
+            self._idle.put(executor)
+
+def get_agent_pool():
+    """Creates the executor pool on first use and returns the same one afterwards."""
+    global _agent_pool
+    if _agent_pool is None:
+        with _agent_pool_lock:
+            if _agent_pool is None:
+                _agent_pool = AgentExecutorPool(AGENT_POOL_SIZE)
+    return _agent_pool
+
+def run_agent(session_id, user_input):
+    """
+    Runs the agent for one turn of a session's conversation.
+
+    The session's recent history is loaded from the memory store, passed to
+    a pooled executor, and the new exchange is appended afterwards, so the
+    conversation survives across requests, workers and restarts.
+
+    Returns:
+        dict: The agent's result, with 'input' and 'output'.
+    """
+    store = get_memory_store()
+    history = to_langchain_messages(store.load(session_id))
+
+    with get_agent_pool().executor() as executor:
+        result = executor.invoke({"input": user_input, "chat_history": history})
+
+    store.append(session_id, [
+        {"role": "human", "content": user_input},
+        {"role": "ai", "content": str(result.get("output", ""))},
+    ])
+    return result
@@ -1,14 +1,16 @@
 # agent_tools.py
 
+from typing import List
+
 from langchain_core.tools import tool
-from neo4j import GraphDatabase
 from icecream import ic
 import json
 import os
 
 # We import the functions we want to turn into tools
-from rag_pipeline.core import ask_question_to_rag, get_list_of_ingested_docs, compare_documents_on_topic
+from rag_pipeline.core import ask_question_to_rag, get_list_of_ingested_docs, compare_documents
 from rag_pipeline.utils import get_llm_model
+from rag_pipeline.schema import ensure_schema
 
 # --- LAZY-LOADED DRIVER FOR THE AGENT ---
 # This ensures the agent's tools get a fresh, reliable connection
@@ -26,23 +28,28 @@ def get_agent_neo4j_driver():
         NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
         if not all([NEO4J_URI, NEO4J_PASSWORD]):
             raise ValueError("Agent tools cannot connect: Neo4j secrets are missing.")
+        from neo4j import GraphDatabase
+
         _agent_driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
         _agent_driver.verify_connectivity()
+        ensure_schema(_agent_driver)
     return _agent_driver
 
 # --- AGENT TOOLS ---
 # Each tool now gets the driver "just-in-time" when it's called.
 
 @tool
-def compare_documents_tool(document1: str, document2: str, topic: str) -> str:
+def compare_documents_tool(filenames: List[str], topic: str) -> str:
     """
-    Use this tool to compare and contrast what two different documents say about a specific topic.
-    The input is the filename of the first document, the filename of the second document, and the topic to compare.
-    For example: compare_documents_tool("report-A.pdf", "whitepaper-B.pdf", "bipropellant valves")
+    Use this tool to compare and contrast what two or more documents say about a specific topic.
+    The input is a list of the document filenames to compare, and the topic to compare.
+    For example: compare_documents_tool(["report-A.pdf", "whitepaper-B.pdf", "spec-C.pdf"], "bipropellant valves")
     """
     print(f"--- [Agent Tool] Executing compare_documents_tool on topic: '{topic}' ---")
+    if len(filenames) < 2:
+        return "Please give at least two document filenames to compare."
     driver = get_agent_neo4j_driver()
-    return compare_documents_on_topic(driver, document1, document2, topic)
+    return compare_documents(driver, filenames, topic)
 
 @tool
 def query_document_tool(question: str, filename: str) -> str:
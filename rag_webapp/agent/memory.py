@@ -0,0 +1,131 @@
+# agent/memory.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Where per-session agent conversations live. With REDIS_URL set every web
+# worker shares them; without it each process keeps its own (development only).
+REDIS_URL = os.getenv("REDIS_URL", "")
+# Messages kept per session (a user turn and an agent turn are two messages)
+AGENT_MEMORY_MAX_MESSAGES = int(os.getenv("AGENT_MEMORY_MAX_MESSAGES", "10"))
+# A conversation idle for this long is dropped
+AGENT_MEMORY_IDLE_SECONDS = int(os.getenv("AGENT_MEMORY_IDLE_SECONDS", "3600"))
+# Sessions the in-process store keeps before evicting the least recently used
+AGENT_MEMORY_MAX_SESSIONS = int(os.getenv("AGENT_MEMORY_MAX_SESSIONS", "1000"))
+
+_memory_store = None
+_memory_store_lock = threading.Lock()
+
+
+class ChatMemoryStore:
+    """
+    Bounded conversation history per session.
+
+    Messages are stored as {"role": "human" | "ai", "content": str}. Only the
+    last max_messages are kept, and a session that is idle for idle_seconds
+    is forgotten.
+    """
+
+    def __init__(self, max_messages=10, idle_seconds=3600):
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+
+    def load(self, session_id):
+        """Returns the session's messages, oldest first."""
+        raise NotImplementedError
+
+    def append(self, session_id, messages):
+        """Adds messages to the session and refreshes its idle timer."""
+        raise NotImplementedError
+
+    def clear(self, session_id):
+        raise NotImplementedError
+
+
+class RedisChatMemoryStore(ChatMemoryStore):
+    """Keeps each session in a Redis list, trimmed to max_messages, that expires when idle."""
+
+    KEY_PREFIX = "agent:history:"
+
+    def __init__(self, url, max_messages=10, idle_seconds=3600):
+        super().__init__(max_messages, idle_seconds)
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def load(self, session_id):
+        return [json.loads(item) for item in self.client.lrange(self.KEY_PREFIX + session_id, 0, -1)]
+
+    def append(self, session_id, messages):
+        key = self.KEY_PREFIX + session_id
+        pipe = self.client.pipeline()
+        pipe.rpush(key, *[json.dumps(message) for message in messages])
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.idle_seconds)
+        pipe.execute()
+
+    def clear(self, session_id):
+        self.client.delete(self.KEY_PREFIX + session_id)
+
+
+class LocalChatMemoryStore(ChatMemoryStore):
+    """An in-process store for development, bounded to max_sessions least recently used sessions."""
+
+    def __init__(self, max_messages=10, idle_seconds=3600, max_sessions=1000):
+        super().__init__(max_messages, idle_seconds)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        # session_id -> (last used, messages)
+        self._sessions = OrderedDict()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if time.monotonic() - entry[0] > self.idle_seconds:
+                del self._sessions[session_id]
+                return []
+            return list(entry[1])
+
+    def append(self, session_id, messages):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[1] if entry and time.monotonic() - entry[0] <= self.idle_seconds else []
+            history = (history + list(messages))[-self.max_messages:]
+            self._sessions[session_id] = (time.monotonic(), history)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+def get_memory_store():
+    """Returns the process-wide conversation store: Redis if REDIS_URL is set, in-process otherwise."""
+    global _memory_store
+    if _memory_store is None:
+        with _memory_store_lock:
+            if _memory_store is None:
+                if REDIS_URL:
+                    _memory_store = RedisChatMemoryStore(
+                        REDIS_URL, AGENT_MEMORY_MAX_MESSAGES, AGENT_MEMORY_IDLE_SECONDS
+                    )
+                else:
+                    print("--- [Agent] REDIS_URL not set, keeping conversations in this process ---")
+                    _memory_store = LocalChatMemoryStore(
+                        AGENT_MEMORY_MAX_MESSAGES, AGENT_MEMORY_IDLE_SECONDS, AGENT_MEMORY_MAX_SESSIONS
+                    )
+    return _memory_store
+
+
+def to_langchain_messages(messages):
+    """Converts stored messages to the HumanMessage/AIMessage list the agent prompt expects."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return [HumanMessage(content=m["content"]) if m["role"] == "human" else AIMessage(content=m["content"])
+            for m in messages]
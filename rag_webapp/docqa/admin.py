@@ -1,3 +1,31 @@
-from django.contrib import admin
+import os
+
+from django.contrib import admin, messages
+
+from .models import IngestionJob
+from .tasks import discard_failed_upload, retry_ingestion_job
 
 # Register your models here.
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'status', 'pages', 'chunks_written', 'duration_seconds', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('filename',)
+    readonly_fields = ('stage_timings', 'created_at', 'started_at', 'finished_at', 'updated_at')
+    actions = ['retry_jobs', 'discard_uploads']
+
+    @admin.action(description="Retry selected failed jobs")
+    def retry_jobs(self, request, queryset):
+        retried = sum(retry_ingestion_job(job) for job in queryset.filter(status=IngestionJob.FAILED))
+        self.message_user(request, f"{retried} job(s) queued again.", messages.SUCCESS)
+        skipped = queryset.count() - retried
+        if skipped:
+            self.message_user(request, f"{skipped} job(s) skipped: not failed, or the upload is gone.",
+                              messages.WARNING)
+
+    @admin.action(description="Delete the uploads of selected failed jobs")
+    def discard_uploads(self, request, queryset):
+        discarded = sum(discard_failed_upload(job) for job in queryset.filter(status=IngestionJob.FAILED)
+                        if os.path.exists(job.file_path))
+        self.message_user(request, f"Deleted {discarded} upload(s).", messages.SUCCESS)
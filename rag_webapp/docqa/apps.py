@@ -1,6 +1,31 @@
+import os
+import shutil
+import sys
+
 from django.apps import AppConfig
 
 
 class DocqaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'docqa'
+
+    def ready(self):
+        # The qcluster process forks its workers after startup, so models
+        # loaded here are shared with them copy-on-write (see PRELOAD_MODELS).
+        if sys.argv[1:2] == ['qcluster']:
+            # The cluster's workers write their metrics to files in
+            # PROMETHEUS_MULTIPROC_DIR; start from an empty one, before
+            # anything is recorded, and serve the sum on QCLUSTER_METRICS_PORT.
+            multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+            if multiproc_dir:
+                shutil.rmtree(multiproc_dir, ignore_errors=True)
+                os.makedirs(multiproc_dir, exist_ok=True)
+            metrics_port = int(os.getenv('QCLUSTER_METRICS_PORT', '9100'))
+            if metrics_port:
+                from rag_pipeline.metrics import start_metrics_server
+
+                start_metrics_server(metrics_port)
+
+            from rag_pipeline.warmup import preload_models
+
+            preload_models()
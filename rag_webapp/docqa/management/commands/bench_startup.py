@@ -0,0 +1,82 @@
+# docqa/management/commands/bench_startup.py
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Libraries that must only be imported on first use, never at startup
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "docling",
+    "google.generativeai",
+    "langchain",
+    "langchain_google_genai",
+]
+
+# Loads Django and the URLconf (and with it every view module), then reports
+# which heavy libraries got imported along the way
+_IMPORT_PROBE = """
+import sys, django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Times 'manage.py check' in fresh processes, lists the slowest imports, and fails "
+        "if startup exceeds --max-seconds or imports a model library eagerly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="How many times to run 'manage.py check'.")
+        parser.add_argument("--max-seconds", type=float, default=3.0,
+                            help="Fail if the median 'manage.py check' takes longer than this.")
+        parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list.")
+
+    def _run(self, *args):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "rag_webapp.settings"))
+        return subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True)
+
+    def handle(self, *args, **options):
+        timings = []
+        for _ in range(options["runs"]):
+            start = time.perf_counter()
+            result = self._run("manage.py", "check")
+            timings.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                raise CommandError(f"'manage.py check' failed:\n{result.stderr}")
+        median = statistics.median(timings)
+        self.stdout.write(f"manage.py check: median {median:.2f} s, max {max(timings):.2f} s over {len(timings)} runs")
+
+        # -X importtime writes "import time: self [us] | cumulative | name" lines to stderr
+        result = self._run("-X", "importtime", "-c", _IMPORT_PROBE.format(modules=HEAVY_MODULES))
+        if result.returncode != 0:
+            raise CommandError(f"Import probe failed:\n{result.stderr}")
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            # Nested imports are indented past the single separating space
+            if not name[1:].startswith(" "):
+                imports.append((int(cumulative), name.strip()))
+        self.stdout.write("Slowest top-level imports:")
+        for cumulative, name in sorted(imports, reverse=True)[:options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+        eager = [name for name in result.stdout.strip().split(",") if name]
+        if eager:
+            raise CommandError(f"Startup imports model libraries eagerly: {', '.join(eager)}")
+        if median > options["max_seconds"]:
+            raise CommandError(f"'manage.py check' took {median:.2f} s, over the {options['max_seconds']:.2f} s budget")
+        self.stdout.write(self.style.SUCCESS("Startup is within budget."))
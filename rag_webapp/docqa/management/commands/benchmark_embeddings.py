@@ -0,0 +1,72 @@
+# docqa/management/commands/benchmark_embeddings.py
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_pipeline.utils import (
+    create_neo4j_driver,
+    encode_texts,
+    load_embedding_model,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_THREADS,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures embedding throughput (ingestion, embeddings/sec) and single-query encode "
+        "latency for each embedding backend. The embedding cache is bypassed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", default="torch,onnx,int8",
+                            help="Comma-separated backends to compare.")
+        parser.add_argument("--texts", type=int, default=512,
+                            help="How many stored chunk texts to embed for the throughput run.")
+        parser.add_argument("--queries", type=int, default=50, help="Single-query encodes to time.")
+        parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+        parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS)
+
+    def handle(self, *args, **options):
+        driver = create_neo4j_driver()
+        try:
+            with driver.session(database="neo4j") as session:
+                texts = [record["text"] for record in session.run(
+                    "MATCH (c:Chunk) WHERE c.text IS NOT NULL RETURN c.text AS text LIMIT $limit",
+                    limit=options["texts"]
+                )]
+        finally:
+            driver.close()
+        if not texts:
+            raise CommandError("No chunks in the database. Ingest a document first.")
+
+        queries = [text[:200] for text in texts[:options["queries"]]]
+
+        for backend in [b.strip() for b in options["backends"].split(",") if b.strip()]:
+            try:
+                model = load_embedding_model(backend, options["threads"])
+            except (ImportError, ValueError) as e:
+                self.stderr.write(f"{backend:>6}: skipped ({e})")
+                continue
+
+            # Warm up, so one-off initialisation is not timed
+            encode_texts(model, texts[:8], options["batch_size"])
+
+            start = time.perf_counter()
+            encode_texts(model, texts, options["batch_size"])
+            throughput = len(texts) / (time.perf_counter() - start)
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                encode_texts(model, [query])
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+            self.stdout.write(
+                f"{backend:>6}: {throughput:.1f} embeddings/sec over {len(texts)} chunks, "
+                f"query p50 {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms"
+            )
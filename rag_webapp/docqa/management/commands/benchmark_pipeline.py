@@ -0,0 +1,338 @@
+# docqa/management/commands/benchmark_pipeline.py
+
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_pipeline import utils
+from rag_pipeline.core import (
+    ask_question_to_rag,
+    delete_document,
+    process_and_ingest_pdf,
+    HYBRID_CANDIDATES,
+    HYBRID_FUSION,
+    PIPELINE_PAGES_PER_WINDOW,
+)
+from rag_pipeline.metrics import INGEST_STAGE_SECONDS, QUERY_STAGE_SECONDS, collect_stage_samples
+from rag_pipeline.timing import StageTimer
+
+DEFAULT_PDF = os.path.join(settings.MEDIA_ROOT, "europe-on-humanoids.pdf")
+
+DEFAULT_QUESTIONS = [
+    "What is the document about?",
+    "Which companies are building humanoid robots?",
+    "What are the main challenges for humanoid robots in Europe?",
+    "How large is the market for humanoid robots expected to be?",
+    "What role does artificial intelligence play in humanoid robots?",
+    "What does the document recommend to policy makers?",
+]
+
+# Benchmark documents are stored under this prefix, so they never collide
+# with real uploads and can be cleaned up afterwards
+BENCHMARK_PREFIX = "benchmark-"
+NEO4J_CONTAINER_PASSWORD = "benchmark-password"
+
+
+def percentiles(samples):
+    """Returns count and p50/p95/p99 (nearest rank) of a list of seconds, in milliseconds."""
+    ordered = sorted(samples)
+
+    def rank(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 2)
+
+    return {"count": len(ordered), "p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def build_corpus(pdf_path, scale, output_path):
+    """
+    Writes a synthetic corpus: the PDF repeated scale times.
+
+    Every page is stamped with its copy number, so no two pages (and no two
+    corpora) have the same text or content hash, and nothing is skipped as
+    already ingested.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as source, fitz.open() as corpus:
+        for copy in range(1, scale + 1):
+            first = corpus.page_count
+            corpus.insert_pdf(source)
+            for page_number in range(first, corpus.page_count):
+                corpus[page_number].insert_text(
+                    (36, 24), f"Benchmark corpus {scale}x, copy {copy}, page {page_number + 1}.", fontsize=6
+                )
+        corpus.save(output_path)
+        return corpus.page_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingests a PDF and synthetic scaled-up copies of it, then asks questions about each. "
+        "Reports pages/sec, chunks/sec, embeddings/sec, per-stage query latency (p50/p95/p99) "
+        "and peak RSS, and saves the results as JSON. Gemini is replaced by a deterministic "
+        "local stub unless --llm gemini is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pdf", default=DEFAULT_PDF, help="The PDF the corpora are built from.")
+        parser.add_argument("--scales", default="1,4",
+                            help="Comma-separated corpus sizes, as multiples of the PDF.")
+        parser.add_argument("--questions", help="File with one question per line. Defaults to a built-in set.")
+        parser.add_argument("--rounds", type=int, default=3, help="Times each question is asked per corpus.")
+        parser.add_argument("--llm", choices=["stub", "gemini"], default="stub")
+        parser.add_argument("--llm-latency-ms", type=float, default=utils.LLM_STUB_LATENCY_MS,
+                            help="Simulated time to first token of the stub LLM.")
+        parser.add_argument("--llm-tokens-per-second", type=float, default=utils.LLM_STUB_TOKENS_PER_SECOND,
+                            help="Simulated generation speed of the stub LLM (0 for instant).")
+        parser.add_argument("--neo4j-container", action="store_true",
+                            help="Run against a throwaway Neo4j started with docker instead of NEO4J_URI.")
+        parser.add_argument("--neo4j-image", default="neo4j:5-community")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark documents afterwards.")
+        parser.add_argument("--output", help="Where to save the JSON results. "
+                                             "Defaults to .cache/benchmarks/<time>-<commit>.json.")
+        parser.add_argument("--baseline", help="A previous results file to compare against.")
+
+    # --- Neo4j ---
+
+    def _start_neo4j_container(self, image):
+        name = f"rag-benchmark-neo4j-{os.getpid()}"
+        try:
+            subprocess.run(
+                ["docker", "run", "-d", "--rm", "--name", name, "-p", "127.0.0.1::7687",
+                 "-e", f"NEO4J_AUTH=neo4j/{NEO4J_CONTAINER_PASSWORD}", image],
+                check=True, capture_output=True, text=True
+            )
+            port = subprocess.run(
+                ["docker", "port", name, "7687/tcp"], check=True, capture_output=True, text=True
+            ).stdout.split()[0].rsplit(":", 1)[1]
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CommandError(f"Could not start a Neo4j container: {getattr(e, 'stderr', None) or e}")
+
+        os.environ.update(NEO4J_URI=f"bolt://127.0.0.1:{port}", NEO4J_USER="neo4j",
+                          NEO4J_PASSWORD=NEO4J_CONTAINER_PASSWORD)
+        self.stdout.write(f"Started Neo4j container {name} on port {port}, waiting for it to accept connections...")
+        return name
+
+    def _connect(self, wait_seconds):
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            try:
+                return utils.create_neo4j_driver()
+            except ValueError as e:
+                raise CommandError(str(e))
+            except Exception as e:
+                if time.monotonic() > deadline:
+                    raise CommandError(f"Could not connect to Neo4j: {e}")
+                time.sleep(2)
+
+    # --- Phases ---
+
+    def _isolate_caches(self, options, cache_dir):
+        """Swaps the process-wide models and caches for benchmark ones, so results do not depend on past runs."""
+        from rag_pipeline.embedding_cache import EmbeddingCache
+        from rag_pipeline.retrieval_cache import RetrievalCache, ScoreCache
+
+        if options["llm"] == "stub":
+            from rag_pipeline.llm_stub import StubGenerativeModel
+
+            utils.LLM_MODEL = utils.create_llm_client(StubGenerativeModel(
+                latency_ms=options["llm_latency_ms"],
+                tokens_per_second=options["llm_tokens_per_second"]
+            ))
+        else:
+            utils.LLM_MODEL = utils.create_llm_client(utils.load_llm_model("gemini"))
+
+        # Every chunk and question is embedded and reranked for real
+        utils.EMBEDDING_CACHE = EmbeddingCache(utils.EMBEDDING_MODEL_NAME, utils.EMBEDDING_DIMENSIONS,
+                                               cache_dir=None, max_memory_items=0)
+        utils.RETRIEVAL_CACHE = RetrievalCache(max_items=0, stamp_dir=os.path.join(cache_dir, "retrieval"))
+        utils.RERANK_SCORE_CACHE = ScoreCache(max_items=0)
+
+    def _ingest(self, driver, corpus_path, filename, pages):
+        delete_document(driver, filename)
+        embeddings_before = utils.get_embedding_cache().misses
+        timer = StageTimer(INGEST_STAGE_SECONDS)
+
+        start = time.perf_counter()
+        summary = process_and_ingest_pdf(driver, corpus_path, filename, timer=timer)
+        seconds = time.perf_counter() - start
+        if summary["status"] != "ingested":
+            raise CommandError(f"'{filename}' was not ingested: {summary}")
+
+        stage_seconds = timer.as_dict()
+        embeddings = utils.get_embedding_cache().misses - embeddings_before
+        return {
+            "pages": pages,
+            "chunks": summary["chunks_written"],
+            "embeddings": embeddings,
+            "seconds": round(seconds, 3),
+            "pages_per_sec": round(pages / seconds, 3),
+            "chunks_per_sec": round(summary["chunks_written"] / seconds, 3),
+            # Embedding throughput of the model itself, from the embedding stage's busy time
+            "embeddings_per_sec": round(embeddings / stage_seconds["embedding"], 1)
+            if stage_seconds.get("embedding") else None,
+            "stage_seconds": stage_seconds,
+        }
+
+    def _query(self, driver, filename, questions, rounds):
+        start = time.perf_counter()
+        with collect_stage_samples(QUERY_STAGE_SECONDS) as samples:
+            for _ in range(rounds):
+                for question in questions:
+                    ask_question_to_rag(driver, question, filename)
+        seconds = time.perf_counter() - start
+        asked = rounds * len(questions)
+        return {
+            "questions": asked,
+            "queries_per_sec": round(asked / seconds, 3),
+            "stage_ms": {stage: percentiles(values) for stage, values in sorted(samples.items())},
+        }
+
+    # --- Reporting ---
+
+    def _settings_snapshot(self, options):
+        return {
+            "llm": options["llm"],
+            "llm_latency_ms": options["llm_latency_ms"] if options["llm"] == "stub" else None,
+            "llm_tokens_per_second": options["llm_tokens_per_second"] if options["llm"] == "stub" else None,
+            "entity_extractor": os.getenv("ENTITY_EXTRACTOR", "gemini").lower(),
+            "embedding_backend": utils.EMBEDDING_BACKEND,
+            "embedding_batch_size": utils.EMBEDDING_BATCH_SIZE,
+            "reranker_backend": utils.RERANKER_BACKEND,
+            "vector_store": utils.VECTOR_STORE_BACKEND,
+            "question_entity_source": utils.QUESTION_ENTITY_SOURCE,
+            "pipeline_pages_per_window": PIPELINE_PAGES_PER_WINDOW,
+            "hybrid_candidates": HYBRID_CANDIDATES,
+            "hybrid_fusion": HYBRID_FUSION,
+            "neo4j": "container" if options["neo4j_container"] else "NEO4J_URI",
+        }
+
+    def _git_commit(self):
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else "unknown"
+
+    def _report(self, results):
+        for corpus in results["corpora"]:
+            ingestion = corpus["ingestion"]
+            self.stdout.write(
+                f"{corpus['name']}: {ingestion['pages']} pages, {ingestion['chunks']} chunks in "
+                f"{ingestion['seconds']:.1f} s -> {ingestion['pages_per_sec']:.2f} pages/sec, "
+                f"{ingestion['chunks_per_sec']:.2f} chunks/sec, {ingestion['embeddings_per_sec']} embeddings/sec"
+            )
+            self.stdout.write(f"  ingestion stages (s): {ingestion['stage_seconds']}")
+            for stage, stats in corpus["queries"]["stage_ms"].items():
+                self.stdout.write(
+                    f"  {stage:>18}: p50 {stats['p50']:9.2f} ms  p95 {stats['p95']:9.2f} ms  "
+                    f"p99 {stats['p99']:9.2f} ms  (n={stats['count']})"
+                )
+            self.stdout.write(f"  peak RSS after this corpus: {corpus['peak_rss_mb']} MB")
+
+    def _compare(self, results, baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        previous = {corpus["name"]: corpus for corpus in baseline.get("corpora", [])}
+        self.stdout.write(f"Compared with {baseline_path} (commit {baseline.get('git_commit')}):")
+
+        def change(new, old):
+            return f"{(new - old) / old * 100:+.1f}%" if new is not None and old else "n/a"
+
+        for corpus in results["corpora"]:
+            old = previous.get(corpus["name"])
+            if old is None:
+                continue
+            self.stdout.write(
+                f"  {corpus['name']}: pages/sec "
+                f"{change(corpus['ingestion']['pages_per_sec'], old['ingestion']['pages_per_sec'])}, "
+                f"embeddings/sec "
+                f"{change(corpus['ingestion']['embeddings_per_sec'], old['ingestion']['embeddings_per_sec'])}"
+            )
+            old_stages = old["queries"]["stage_ms"]
+            for stage, stats in corpus["queries"]["stage_ms"].items():
+                if stage in old_stages:
+                    self.stdout.write(f"    {stage:>18}: p95 {change(stats['p95'], old_stages[stage]['p95'])}")
+        self.stdout.write(
+            f"  peak RSS: {change(results['peak_rss_mb'], baseline.get('peak_rss_mb'))}"
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options["pdf"]):
+            raise CommandError(f"PDF not found: {options['pdf']}")
+        try:
+            scales = sorted({int(scale) for scale in options["scales"].split(",") if scale.strip()})
+        except ValueError:
+            raise CommandError(f"--scales must be comma-separated integers, got '{options['scales']}'")
+        if not scales or scales[0] < 1:
+            raise CommandError("--scales must be positive integers.")
+        if options["questions"]:
+            with open(options["questions"]) as f:
+                questions = [line.strip() for line in f if line.strip()]
+        else:
+            questions = DEFAULT_QUESTIONS
+
+        container = self._start_neo4j_container(options["neo4j_image"]) if options["neo4j_container"] else None
+        filenames = []
+        try:
+            driver = self._connect(wait_seconds=120 if container else 0)
+            with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as work_dir:
+                self._isolate_caches(options, work_dir)
+                results = {
+                    "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "git_commit": self._git_commit(),
+                    "pdf": os.path.basename(options["pdf"]),
+                    "settings": self._settings_snapshot(options),
+                    "corpora": [],
+                }
+                try:
+                    for scale in scales:
+                        filename = f"{BENCHMARK_PREFIX}{scale}x-{os.path.basename(options['pdf'])}"
+                        filenames.append(filename)
+                        corpus_path = os.path.join(work_dir, filename)
+                        pages = build_corpus(options["pdf"], scale, corpus_path)
+
+                        self.stdout.write(f"Ingesting {filename} ({pages} pages)...")
+                        ingestion = self._ingest(driver, corpus_path, filename, pages)
+                        self.stdout.write(f"Asking {len(questions)} questions x {options['rounds']} rounds...")
+                        queries = self._query(driver, filename, questions, options["rounds"])
+                        results["corpora"].append({
+                            "name": f"{scale}x",
+                            "scale": scale,
+                            "ingestion": ingestion,
+                            "queries": queries,
+                            "peak_rss_mb": peak_rss_mb(),
+                        })
+                finally:
+                    if not options["keep"]:
+                        for filename in filenames:
+                            delete_document(driver, filename)
+                    driver.close()
+        finally:
+            if container:
+                subprocess.run(["docker", "stop", container], capture_output=True)
+
+        results["peak_rss_mb"] = peak_rss_mb()
+        self._report(results)
+
+        output = options["output"] or os.path.join(
+            utils.CACHE_ROOT, "benchmarks",
+            f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{results['git_commit']}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {output}"))
+
+        if options["baseline"]:
+            self._compare(results, options["baseline"])
@@ -0,0 +1,26 @@
+# docqa/management/commands/build_faiss_index.py
+
+from django.core.management.base import BaseCommand
+
+from rag_pipeline.core import get_list_of_ingested_docs
+from rag_pipeline.utils import create_neo4j_driver, EMBEDDING_DIMENSIONS, FAISS_INDEX_DIR
+from rag_pipeline.vector_store import FaissVectorStore
+
+
+class Command(BaseCommand):
+    help = "Builds the local FAISS indexes from the chunk embeddings stored in Neo4j."
+
+    def add_arguments(self, parser):
+        parser.add_argument("documents", nargs="*", help="Filenames to index (default: all documents).")
+
+    def handle(self, *args, **options):
+        store = FaissVectorStore(EMBEDDING_DIMENSIONS, FAISS_INDEX_DIR)
+        driver = create_neo4j_driver()
+        try:
+            documents = options["documents"] or get_list_of_ingested_docs(driver)
+            for filename in documents:
+                count = store.sync_from_neo4j(driver, filename)
+                self.stdout.write(f"{filename}: indexed {count} chunks")
+        finally:
+            driver.close()
+        self.stdout.write(self.style.SUCCESS(f"FAISS indexes written to {FAISS_INDEX_DIR}"))
@@ -0,0 +1,67 @@
+# docqa/management/commands/compare_vector_stores.py
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_pipeline.core import get_list_of_ingested_docs
+from rag_pipeline.utils import (
+    create_neo4j_driver,
+    EMBEDDING_DIMENSIONS,
+    FAISS_INDEX_DIR,
+    VECTOR_OVERFETCH_FACTOR,
+)
+from rag_pipeline.vector_store import FaissVectorStore, Neo4jVectorStore
+
+
+class Command(BaseCommand):
+    help = (
+        "Times document-scoped vector search in Neo4j and in FAISS, using stored chunk "
+        "embeddings as queries, and reports how many of Neo4j's hits FAISS also returns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=20, help="Queries per document.")
+        parser.add_argument("--top-k", type=int, default=5)
+
+    def handle(self, *args, **options):
+        stores = [
+            Neo4jVectorStore(overfetch_factor=VECTOR_OVERFETCH_FACTOR),
+            FaissVectorStore(EMBEDDING_DIMENSIONS, FAISS_INDEX_DIR),
+        ]
+        top_k = options["top_k"]
+        latencies = {store.name: [] for store in stores}
+        overlaps = []
+
+        driver = create_neo4j_driver()
+        try:
+            documents = [d for d in get_list_of_ingested_docs(driver) if stores[1].has_document(d)]
+            if not documents:
+                raise CommandError("No document has a FAISS index. Run 'python manage.py build_faiss_index' first.")
+
+            for filename in documents:
+                with driver.session(database="neo4j") as session:
+                    embeddings = [record["embedding"] for record in session.run(
+                        "MATCH (:Document {filename: $filename})-[:HAS_CHUNK]->(c:Chunk) RETURN c.embedding AS embedding",
+                        filename=filename
+                    )]
+                for embedding in random.sample(embeddings, min(options["queries"], len(embeddings))):
+                    results = {}
+                    for store in stores:
+                        start = time.perf_counter()
+                        hits = store.search(driver, embedding, filename, top_k)
+                        latencies[store.name].append((time.perf_counter() - start) * 1000)
+                        results[store.name] = {hit["chunk_id"] for hit in hits}
+                    if results["neo4j"]:
+                        overlaps.append(len(results["neo4j"] & results["faiss"]) / len(results["neo4j"]))
+        finally:
+            driver.close()
+
+        for name, values in latencies.items():
+            values.sort()
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            self.stdout.write(f"{name:>6}: {len(values)} queries, p50 {statistics.median(values):.3f} ms, p95 {p95:.3f} ms")
+        if overlaps:
+            self.stdout.write(f"FAISS top-{top_k} overlap with Neo4j: {statistics.mean(overlaps):.1%}")
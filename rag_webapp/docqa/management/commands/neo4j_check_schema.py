@@ -0,0 +1,27 @@
+# docqa/management/commands/neo4j_check_schema.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_pipeline.schema import check_schema
+from rag_pipeline.utils import create_neo4j_driver
+
+
+class Command(BaseCommand):
+    help = "Reports Neo4j indexes and constraints that are missing. Exits non-zero if any are."
+
+    def handle(self, *args, **options):
+        driver = create_neo4j_driver()
+        try:
+            report = check_schema(driver)
+        finally:
+            driver.close()
+
+        self.stdout.write(f"Schema version: {report['version']} (expected {report['expected_version']})")
+        for name in report["missing_indexes"]:
+            self.stdout.write(self.style.ERROR(f"Missing index: {name}"))
+        for name in report["missing_constraints"]:
+            self.stdout.write(self.style.ERROR(f"Missing constraint: {name}"))
+
+        if report["missing_indexes"] or report["missing_constraints"] or report["version"] < report["expected_version"]:
+            raise CommandError("Neo4j schema is incomplete. Run 'python manage.py neo4j_migrate'.")
+        self.stdout.write(self.style.SUCCESS("Neo4j schema is complete."))
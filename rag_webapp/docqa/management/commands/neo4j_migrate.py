@@ -0,0 +1,22 @@
+# docqa/management/commands/neo4j_migrate.py
+
+from django.core.management.base import BaseCommand
+
+from rag_pipeline.schema import apply_schema, SCHEMA_VERSION
+from rag_pipeline.utils import create_neo4j_driver
+
+
+class Command(BaseCommand):
+    help = "Applies pending Neo4j schema migrations (constraints and indexes)."
+
+    def handle(self, *args, **options):
+        driver = create_neo4j_driver()
+        try:
+            applied = apply_schema(driver)
+        finally:
+            driver.close()
+
+        if applied:
+            for version, description in applied:
+                self.stdout.write(f"Applied migration {version}: {description}")
+        self.stdout.write(self.style.SUCCESS(f"Neo4j schema is at version {SCHEMA_VERSION}."))
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('file_path', models.CharField(max_length=1024)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('skipped', 'Skipped (duplicate)'), ('failed', 'Failed')], db_index=True, default='queued', max_length=16)),
+                ('error', models.TextField(blank=True)),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('pages_changed', models.PositiveIntegerField(default=0)),
+                ('chunks_written', models.PositiveIntegerField(default=0)),
+                ('shards', models.PositiveIntegerField(default=0)),
+                ('shards_done', models.PositiveIntegerField(default=0)),
+                ('stage_timings', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+SWEEP_FUNC = 'docqa.tasks.fail_stale_ingestion_jobs'
+
+
+def schedule_sweep(apps, schema_editor):
+    # Every 5 minutes, on whichever cluster picks the schedule up; the sweep is idempotent
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.update_or_create(
+        func=SWEEP_FUNC,
+        defaults={'name': 'Fail stale ingestion jobs', 'schedule_type': 'I', 'minutes': 5, 'repeats': -1},
+    )
+
+
+def unschedule_sweep(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.filter(func=SWEEP_FUNC).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docqa', '0001_initial'),
+        ('django_q', '__latest__'),
+    ]
+
+    operations = [
+        migrations.RunPython(schedule_sweep, unschedule_sweep),
+    ]
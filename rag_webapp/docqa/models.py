@@ -1,3 +1,71 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+class IngestionJob(models.Model):
+    """One uploaded PDF going through ingestion, with counts and per-stage timings."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (SKIPPED, 'Skipped (duplicate)'),
+        (FAILED, 'Failed'),
+    ]
+    FINISHED = (COMPLETED, SKIPPED, FAILED)
+
+    filename = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=1024)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True)
+
+    pages = models.PositiveIntegerField(default=0)
+    pages_changed = models.PositiveIntegerField(default=0)
+    chunks_written = models.PositiveIntegerField(default=0)
+    shards = models.PositiveIntegerField(default=0)
+    shards_done = models.PositiveIntegerField(default=0)
+    # Busy seconds per stage (see rag_pipeline.timing.INGESTION_STAGES)
+    stage_timings = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def duration_seconds(self):
+        """Seconds from start to finish, or so far for a running job."""
+        if not self.started_at:
+            return None
+        return round(((self.finished_at or timezone.now()) - self.started_at).total_seconds(), 3)
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'filename': self.filename,
+            'status': self.status,
+            'error': self.error,
+            'pages': self.pages,
+            'pages_changed': self.pages_changed,
+            'chunks_written': self.chunks_written,
+            'shards': self.shards,
+            'shards_done': self.shards_done,
+            'stage_timings': self.stage_timings,
+            'duration_seconds': self.duration_seconds,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat(),
+        }
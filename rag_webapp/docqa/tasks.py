@@ -2,55 +2,328 @@
 
 # Import everything this function needs
 import os
-from neo4j import GraphDatabase
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django_q.brokers import get_broker
+from django_q.tasks import async_task
 
 # You'll need to import your actual pipeline functions from rag_pipeline
-from rag_pipeline.core import process_and_ingest_pdf
+from rag_pipeline.core import (
+    process_and_ingest_pdf,
+    compute_content_hash,
+    find_document_by_hash,
+    get_pdf_page_count,
+    get_stored_pages,
+    ingest_pdf_pages,
+    complete_ingestion
+)
+from rag_pipeline.schema import ensure_schema
+from rag_pipeline.metrics import INGEST_STAGE_SECONDS
+from rag_pipeline.timing import StageTimer, merge_timings
+from rag_pipeline.utils import create_neo4j_driver
+
+from .models import IngestionJob
+
+# PDFs with more pages than this are split into shards of this many pages,
+# ingested in parallel on the bulk queue. Smaller ones run as a single task.
+INGEST_SHARD_PAGES = int(os.getenv("INGEST_SHARD_PAGES", "16"))
+# How long the bookkeeping of a sharded ingestion is kept in Redis
+INGEST_JOB_TTL_SECONDS = 24 * 3600
+# A running job that has made no progress for this long (e.g. a shard was
+# killed by the task timeout or a worker crash) is marked failed by
+# fail_stale_ingestion_jobs. Keep it above Q_TIMEOUT plus Django-Q's retry
+# delay, so unacknowledged shards get their second chance first.
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "1800"))
+
+# One Neo4j driver per worker process, shared by every task it runs
+_driver = None
+
+def get_worker_driver():
+    global _driver
+    if _driver is None:
+        _driver = create_neo4j_driver()
+    return _driver
+
+def _job_key(job_id, name):
+    return f"ingest:{job_id}:{name}"
+
+def _job_keys(job_id):
+    """Every Redis key of a sharded ingestion's bookkeeping."""
+    return [_job_key(job_id, name) for name in ("shards", "done", "failed", "finalizing", "pages", "stored", "timings")]
+
+def _remove_upload(pdf_filepath):
+    # Clean up the temporarily saved file
+    if os.path.exists(pdf_filepath):
+        print(f"--- [Django-Q] Cleaning up temporary file: {pdf_filepath} ---")
+        os.remove(pdf_filepath)
+
+def _fail_job(job, error):
+    """Marks a job failed. The upload is kept for retry_ingestion_job or discard_failed_upload."""
+    IngestionJob.objects.filter(pk=job.pk).update(
+        status=IngestionJob.FAILED,
+        error=f"{type(error).__name__}: {error}",
+        finished_at=timezone.now()
+    )
+
+def retry_ingestion_job(job):
+    """
+    Queues a failed job's upload for ingestion again, under the same job.
+
+    Pages that were stored before the failure and did not change are
+    skipped, so only the rest is redone.
+
+    Returns:
+        bool: False if the job is not failed (e.g. already retried) or its upload is gone.
+    """
+    if not os.path.exists(job.file_path):
+        return False
+    # Claim the job atomically, so a double click queues it once
+    claimed = IngestionJob.objects.filter(pk=job.pk, status=IngestionJob.FAILED).update(
+        status=IngestionJob.QUEUED, error='', pages=0, pages_changed=0, chunks_written=0,
+        shards=0, shards_done=0, stage_timings={}, started_at=None, finished_at=None,
+        updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+    async_task('docqa.tasks.ingestion_task', job.file_path, job.filename, job.pk)
+    print(f"--- [Django-Q] Retrying ingestion of '{job.filename}' (job {job.pk}) ---")
+    return True
+
+def discard_failed_upload(job):
+    """Deletes the upload a failed job kept for retrying. Returns False if the job is not failed."""
+    if job.status != IngestionJob.FAILED:
+        return False
+    _remove_upload(job.file_path)
+    return True
 
 # This is our background task. It's just a regular Python function.
 
-def ingestion_task(pdf_filepath):
+def ingestion_task(pdf_filepath, filename=None, job_id=None):
     """
-    A single function that runs the entire ingestion pipeline for a given PDF.
-    This will be executed in the background by Django-Q.
+    Entry point for an uploaded PDF, run on the interactive queue.
+
+    Small PDFs are ingested right here. Larger ones are split into page-range
+    shards that the bulk queue's workers ingest in parallel; once every shard
+    has reported, finalize_ingestion_task is queued. One huge upload therefore
+    never occupies a worker for its whole duration.
+
+    Progress, counts and stage timings are recorded on the IngestionJob
+    (created here if the caller did not). Errors mark the job failed and are
+    re-raised, so Django-Q records the task as failed too.
     """
     print(f"--- [Django-Q] Starting Ingestion Task for: {pdf_filepath} ---")
-    
-    # --- Neo4j Connection (The worker needs its own connection) ---
-    NEO4J_URI = os.getenv("NEO4J_URI")
-    NEO4J_USER = "neo4j"
-    NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-
-    #driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-    driver = None
-    
-    filename = os.path.basename(pdf_filepath)
-    
+    filename = filename or os.path.basename(pdf_filepath)
+    if job_id is None:
+        job = IngestionJob.objects.create(filename=filename, file_path=pdf_filepath)
+    else:
+        job = IngestionJob.objects.get(pk=job_id)
+    job.status = IngestionJob.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at', 'updated_at'])
+
     try:
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+        driver = get_worker_driver()
+        page_count = get_pdf_page_count(pdf_filepath)
+
+        if page_count <= INGEST_SHARD_PAGES:
+            timer = StageTimer(INGEST_STAGE_SECONDS)
+            summary = process_and_ingest_pdf(driver, pdf_filepath, filename, timer=timer)
+            IngestionJob.objects.filter(pk=job.pk).update(
+                status=IngestionJob.SKIPPED if summary["status"] == "skipped" else IngestionJob.COMPLETED,
+                pages=summary.get("pages", 0),
+                pages_changed=summary.get("pages_changed", 0),
+                chunks_written=summary.get("chunks_written", 0),
+                stage_timings=timer.as_dict(),
+                finished_at=timezone.now()
+            )
+            _remove_upload(pdf_filepath)
+            print(f"--- [Django-Q] Successfully Ingested: {filename} ({summary}) ---")
+            return summary
+
+        # Make sure the indexes and constraints exist before ingesting (once per process)
+        ensure_schema(driver)
+        content_hash = compute_content_hash(pdf_filepath)
+        existing = find_document_by_hash(driver, content_hash)
+        if existing:
+            print(f"--- '{filename}' is identical to already ingested '{existing}', skipping ---")
+            IngestionJob.objects.filter(pk=job.pk).update(status=IngestionJob.SKIPPED, finished_at=timezone.now())
+            _remove_upload(pdf_filepath)
+            return {"status": "skipped", "filename": filename, "duplicate_of": existing}
 
-        print(f"--- [Django-Q] verifying-connectivity ---")
+        stored_pages = get_stored_pages(driver, filename)
+        shards = [(first, min(first + INGEST_SHARD_PAGES - 1, page_count))
+                  for first in range(1, page_count + 1, INGEST_SHARD_PAGES)]
+        IngestionJob.objects.filter(pk=job.pk).update(pages=page_count, shards=len(shards), updated_at=timezone.now())
 
-        driver.verify_connectivity()
+        # A retried job starts from clean bookkeeping
+        redis = get_broker().connection
+        pipe = redis.pipeline()
+        pipe.delete(*_job_keys(job.pk))
+        pipe.set(_job_key(job.pk, "shards"), len(shards), ex=INGEST_JOB_TTL_SECONDS)
+        if stored_pages:
+            # The finalize step needs the page numbers only; each shard gets its own slice
+            pipe.sadd(_job_key(job.pk, "stored"), *stored_pages)
+            pipe.expire(_job_key(job.pk, "stored"), INGEST_JOB_TTL_SECONDS)
+        pipe.execute()
 
-        print(f"--- [Django-Q] Connectivity verified ---")
+        bulk_broker = get_broker(settings.Q_BULK_QUEUE)
+        for first_page, last_page in shards:
+            shard_stored_pages = {page: stored for page, stored in stored_pages.items()
+                                  if first_page <= page <= last_page}
+            async_task(
+                'docqa.tasks.ingest_shard_task',
+                job.pk, pdf_filepath, filename, content_hash, shard_stored_pages, first_page, last_page,
+                broker=bulk_broker,
+                group=f"ingest-{job.pk}"
+            )
+        print(f"--- [Django-Q] Split '{filename}' ({page_count} pages) into {len(shards)} shards, job {job.pk} ---")
+        return {"status": "sharded", "filename": filename, "job_id": job.pk, "shards": len(shards)}
 
-        process_and_ingest_pdf(driver, pdf_filepath)
-        filename = os.path.basename(pdf_filepath)
-        print(f"--- [Django-Q] Successfully Ingested: {filename} ---")
-    
     except Exception as e:
-        filename = os.path.basename(pdf_filepath)
         print(f"--- [Django-Q] ERROR during ingestion for {filename}: {e} ---")
-        # You could add more robust error handling here
-    
-    finally:
-        if driver:
-            driver.close()
-        # Clean up the temporarily saved file
-        if os.path.exists(pdf_filepath):
-            print(f"--- [Django-Q] Cleaning up temporary file: {pdf_filepath} ---")
-            os.remove(pdf_filepath)
+        _fail_job(job, e)
+        raise
 
+    finally:
         print(f"--- [Django-Q] Ingestion Task for {filename} finished. ---")
+
+def _finalize_when_complete(redis, job_id, pdf_filepath, filename, content_hash):
+    """Queues finalize_ingestion_task once every shard has reported, exactly once."""
+    pipe = redis.pipeline()
+    pipe.get(_job_key(job_id, "shards"))
+    pipe.scard(_job_key(job_id, "done"))
+    pipe.scard(_job_key(job_id, "failed"))
+    shards, done, failed = pipe.execute()
+    if not shards or done + failed < int(shards):
+        return
+    if redis.set(_job_key(job_id, "finalizing"), 1, nx=True, ex=INGEST_JOB_TTL_SECONDS):
+        async_task(
+            'docqa.tasks.finalize_ingestion_task',
+            job_id, pdf_filepath, filename, content_hash,
+            broker=get_broker(settings.Q_INTERACTIVE_QUEUE)
+        )
+
+def ingest_shard_task(job_id, pdf_filepath, filename, content_hash, stored_pages, first_page, last_page):
+    """
+    Ingests one page range of a sharded upload, run on the bulk queue.
+
+    Each shard reports by adding its first page to the job's "done" or
+    "failed" set in Redis, so a shard that Django-Q runs twice is counted
+    once; its counts and stage timings are only added to the job the first
+    time it succeeds. Once both sets together hold every shard, the finalize
+    step is queued. A shard killed before it reports never completes the
+    sets; fail_stale_ingestion_jobs fails such jobs.
+
+    Args:
+        stored_pages: What get_stored_pages() returned for this shard's pages only.
+    """
+    print(f"--- [Django-Q] Ingesting pages {first_page}-{last_page} of '{filename}' (job {job_id}) ---")
+    redis = get_broker().connection
+    done_key, failed_key = _job_key(job_id, "done"), _job_key(job_id, "failed")
+    timer = StageTimer(INGEST_STAGE_SECONDS)
+    try:
+        result = ingest_pdf_pages(get_worker_driver(), pdf_filepath, filename, stored_pages, first_page, last_page,
+                                  timer=timer)
+        if result["pages_seen"]:
+            redis.sadd(_job_key(job_id, "pages"), *result["pages_seen"])
+            redis.expire(_job_key(job_id, "pages"), INGEST_JOB_TTL_SECONDS)
+    except Exception as e:
+        print(f"--- [Django-Q] ERROR ingesting pages {first_page}-{last_page} of {filename}: {e} ---")
+        if not redis.sismember(done_key, first_page):
+            redis.sadd(failed_key, first_page)
+            redis.expire(failed_key, INGEST_JOB_TTL_SECONDS)
+        IngestionJob.objects.filter(pk=job_id).update(
+            error=f"Pages {first_page}-{last_page}: {type(e).__name__}: {e}",
+            updated_at=timezone.now()
+        )
+        raise
+    else:
+        # The pages are stored; from here on a failure must not mark the shard failed
+        pipe = redis.pipeline()
+        pipe.sadd(done_key, first_page)
+        pipe.srem(failed_key, first_page)
+        pipe.expire(done_key, INGEST_JOB_TTL_SECONDS)
+        first_report = pipe.execute()[0]
+        if first_report:
+            timings_key = _job_key(job_id, "timings")
+            pipe = redis.pipeline()
+            for stage, seconds in timer.as_dict().items():
+                pipe.hincrbyfloat(timings_key, stage, seconds)
+            pipe.expire(timings_key, INGEST_JOB_TTL_SECONDS)
+            pipe.execute()
+            IngestionJob.objects.filter(pk=job_id, status=IngestionJob.RUNNING).update(
+                pages_changed=F('pages_changed') + len(result["pages_changed"]),
+                chunks_written=F('chunks_written') + result["chunks_written"],
+                shards_done=F('shards_done') + 1,
+                updated_at=timezone.now()
+            )
+        return {"first_page": first_page, "last_page": last_page, "chunks_written": result["chunks_written"]}
+    finally:
+        _finalize_when_complete(redis, job_id, pdf_filepath, filename, content_hash)
+
+def finalize_ingestion_task(job_id, pdf_filepath, filename, content_hash):
+    """
+    Completes a sharded upload once every shard is done, run on the interactive queue.
+
+    If any shard failed the document is left unfinalized: it keeps no content
+    hash, so uploading it again re-runs only the pages that are incomplete.
+    """
+    redis = get_broker().connection
+    job = IngestionJob.objects.get(pk=job_id)
+    try:
+        failed = redis.scard(_job_key(job_id, "failed"))
+        if failed:
+            print(f"--- [Django-Q] {failed} shard(s) of '{filename}' failed; not finalizing (job {job_id}) ---")
+            IngestionJob.objects.filter(pk=job_id).update(status=IngestionJob.FAILED, finished_at=timezone.now())
+            return {"status": "failed", "filename": filename, "job_id": job_id, "failed_shards": failed}
+
+        pages_seen = {int(page) for page in redis.smembers(_job_key(job_id, "pages"))}
+        stored_pages = {int(page) for page in redis.smembers(_job_key(job_id, "stored"))}
+        shard_timings = {stage.decode() if isinstance(stage, bytes) else stage: float(seconds)
+                         for stage, seconds in redis.hgetall(_job_key(job_id, "timings")).items()}
+        timer = StageTimer(INGEST_STAGE_SECONDS)
+        with timer.stage("neo4j_write"):
+            complete_ingestion(get_worker_driver(), filename, content_hash, stored_pages, pages_seen)
+        IngestionJob.objects.filter(pk=job_id).update(
+            status=IngestionJob.COMPLETED,
+            pages=len(pages_seen),
+            stage_timings=merge_timings(job.stage_timings, shard_timings, timer.as_dict()),
+            finished_at=timezone.now()
+        )
+        _remove_upload(pdf_filepath)
+        print(f"--- [Django-Q] Successfully Ingested: {filename} ({len(pages_seen)} pages, job {job_id}) ---")
+        return {"status": "ingested", "filename": filename, "job_id": job_id, "pages": len(pages_seen)}
+    except Exception as e:
+        _fail_job(job, e)
+        raise
+    finally:
+        redis.delete(*_job_keys(job_id))
+
+def fail_stale_ingestion_jobs():
+    """
+    Marks running jobs that stopped making progress as failed, run every few minutes by a Django-Q schedule.
+
+    A shard killed by the task timeout or a worker crash never reports, so
+    its job would otherwise stay running forever. The upload is kept, so the
+    job can be retried like any other failed job.
+
+    Returns:
+        int: How many jobs were marked failed.
+    """
+    deadline = timezone.now() - timedelta(seconds=INGEST_STALE_SECONDS)
+    stale = list(IngestionJob.objects.filter(status=IngestionJob.RUNNING, updated_at__lt=deadline)
+                 .values_list('pk', flat=True))
+    if not stale:
+        return 0
+    failed = IngestionJob.objects.filter(pk__in=stale, status=IngestionJob.RUNNING, updated_at__lt=deadline).update(
+        status=IngestionJob.FAILED,
+        error=f"No progress for {INGEST_STALE_SECONDS} s: a task timed out or its worker died",
+        finished_at=timezone.now()
+    )
+    redis = get_broker().connection
+    redis.delete(*[key for job_id in stale for key in _job_keys(job_id)])
+    print(f"--- [Django-Q] Marked {failed} stale ingestion job(s) failed: {stale} ---")
+    return failed
@@ -5,6 +5,12 @@ from . import views
 urlpatterns = [
     path('', views.main_interface, name='main_interface'),
     path('api/get_documents/', views.get_documents_json, name='get_documents_json'),
+    path('api/ingestion_jobs/', views.ingestion_jobs_json, name='ingestion_jobs_json'),
+    path('api/ingestion_jobs/<int:job_id>/', views.ingestion_job_json, name='ingestion_job_json'),
+    path('api/ingestion_jobs/<int:job_id>/retry/', views.retry_ingestion_job_view, name='retry_ingestion_job'),
+    path('api/ask_stream/', views.ask_stream, name='ask_stream'),
+    path('metrics', views.metrics, name='metrics'),
+    path('api/ready/', views.readiness, name='readiness'),
     path('agent/', views.agent_view, name='agent_view'),
 ]
 
@@ -4,23 +4,33 @@ import os
 import json
 from django.shortcuts import render, redirect
 from django.core.files.storage import FileSystemStorage
-from django.http import JsonResponse
-from neo4j import GraphDatabase
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 from django.contrib import messages
 from django_q.tasks import async_task
 from django.views.decorators.csrf import csrf_exempt
-from agent.agent_handler import create_agent_with_memory
+from django.views.decorators.http import require_POST
+from agent.agent_handler import run_agent
 from icecream import ic
-from langchain_core.messages import HumanMessage, AIMessage
 
 load_dotenv()
 
-from rag_pipeline.core import ask_question_to_rag, get_list_of_ingested_docs
+from rag_pipeline.core import (
+    ask_question_to_rag,
+    get_list_of_ingested_docs,
+    retrieve_context,
+    stream_answer_with_context,
+    NO_CONTEXT_ANSWER
+)
+from rag_pipeline.schema import ensure_schema
+from rag_pipeline.warmup import model_status
+from rag_pipeline.metrics import render_metrics, CONTENT_TYPE_LATEST
 
-_driver = None
+from .models import IngestionJob
+from .tasks import retry_ingestion_job
 
-agent_executor = create_agent_with_memory()
+_driver = None
 
 @csrf_exempt
 def agent_view(request):
@@ -31,9 +41,11 @@ def agent_view(request):
 
         if user_input:
             try:
-                result = agent_executor.invoke({
-                    "input": user_input
-                    })
+                # Each browser session has its own conversation, kept in the
+                # shared memory store, so any worker can answer it
+                if not request.session.session_key:
+                    request.session.save()
+                result = run_agent(request.session.session_key, user_input)
                 return JsonResponse({
                    "input": result["input"],
                    "output": result["output"],
@@ -66,9 +78,12 @@ def get_neo4j_driver():
             if not all([NEO4J_URI, NEO4J_PASSWORD]):
                 raise ValueError("NEO4J_URI or NEO4J_PASSWORD secrets are not set.")
 
+            from neo4j import GraphDatabase
+
             _driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
             _driver.verify_connectivity()
             print("--- Neo4j connection successful ---")
+            ensure_schema(_driver)
         except Exception as e:
             print(f"--- FAILED to connect to Neo4j: {e} ---")
             raise e
@@ -103,12 +118,17 @@ def main_interface(request):
                 filename = fs.save(pdf_file.name, pdf_file)
                 uploaded_file_path = fs.path(filename)
 
+                # The storage may rename the file on disk to avoid collisions;
+                # the document is stored under the name the user uploaded.
+                job = IngestionJob.objects.create(filename=pdf_file.name, file_path=uploaded_file_path)
                 async_task(
                         'docqa.tasks.ingestion_task',
-                        uploaded_file_path
+                        uploaded_file_path,
+                        pdf_file.name,
+                        job.pk
                         )
 
-                messages.success(request, f"'{pdf_file.name}' has been submitted for processing. It will be available shortly.")
+                messages.success(request, f"'{pdf_file.name}' has been submitted for processing. Its progress is shown below.")
                 
                 # Redirect to the same page to show the updated doc list
                 return redirect('main_interface')
@@ -146,3 +166,93 @@ def get_documents_json(request):
         # Return an error as JSON if the database connection fails
         return JsonResponse({'error': str(e)}, status=500)
 
+def readiness(request):
+    """
+    Reports which models are loaded in this worker process.
+
+    Returns 503 until every model listed in PRELOAD_MODELS is resident, so a
+    load balancer or orchestrator can hold traffic back until then.
+    """
+    status = model_status()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
+
+def _sse(event, data):
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def ask_stream(request):
+    """
+    Answers a question as a stream of server-sent events.
+
+    The retrieved sources are sent as soon as retrieval finishes ('sources'),
+    followed by the answer as Gemini generates it ('token' events) and a
+    final 'done'. Run under ASGI, a slow generation does not hold a worker.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    question = request.POST.get('question', '').strip()
+    document = request.POST.get('document', '').strip()
+    if not (question and document):
+        return JsonResponse({"error": "A question and a document are required"}, status=400)
+
+    def retrieve():
+        return retrieve_context(get_neo4j_driver(), question, document)
+
+    async def events():
+        try:
+            # Retrieval is blocking (Neo4j, models), so it runs in a thread
+            chunks = await sync_to_async(retrieve, thread_sensitive=False)()
+            yield _sse("sources", [
+                {"page": chunk.get('page'), "chunkno": chunk.get('chunkno'), "text": chunk['text'][:300]}
+                for chunk in chunks
+            ])
+            if not chunks:
+                yield _sse("token", NO_CONTEXT_ANSWER)
+            else:
+                async for text in stream_answer_with_context(question, chunks):
+                    yield _sse("token", text)
+            yield _sse("done", {})
+        except Exception as e:
+            print(f"--- [Stream] Failed to answer '{question}': {e} ---")
+            yield _sse("error", {"error": "Server error"})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def ingestion_jobs_json(request):
+    """
+    Lists the most recent ingestion jobs, newest first, with their state,
+    counts and per-stage timings. The front end polls this while jobs run.
+    """
+    limit = request.GET.get('limit', '20')
+    limit = min(int(limit), 100) if limit.isdigit() else 20
+    jobs = IngestionJob.objects.all()[:limit]
+    return JsonResponse({'jobs': [job.to_dict() for job in jobs]})
+
+def ingestion_job_json(request, job_id):
+    """Returns the state, counts and per-stage timings of one ingestion job."""
+    try:
+        job = IngestionJob.objects.get(pk=job_id)
+    except IngestionJob.DoesNotExist:
+        return JsonResponse({'error': 'Unknown job'}, status=404)
+    return JsonResponse(job.to_dict())
+
+@require_POST
+def retry_ingestion_job_view(request, job_id):
+    """Queues a failed ingestion job again, from the upload it kept."""
+    try:
+        job = IngestionJob.objects.get(pk=job_id)
+    except IngestionJob.DoesNotExist:
+        return JsonResponse({'error': 'Unknown job'}, status=404)
+    if not retry_ingestion_job(job):
+        return JsonResponse({'error': 'Only failed jobs whose upload still exists can be retried'}, status=409)
+    job.refresh_from_db()
+    return JsonResponse(job.to_dict(), status=202)
+
+def metrics(request):
+    """Exposes the query and ingestion metrics in the Prometheus text format."""
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+# Picked up automatically by gunicorn when started from this directory.
+
+import os
+import shutil
+
+# With PRELOAD_MODELS set, the application (and the models) are loaded once
+# in the master process and shared with the forked workers copy-on-write.
+preload_app = bool(os.getenv("PRELOAD_MODELS", "").strip())
+
+# In multiprocess mode every worker writes its metrics to files here, and
+# /metrics adds them up. Start from an empty directory: files left over from
+# a previous run would be counted again. This runs before the app is loaded.
+multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+if multiproc_dir:
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    if preload_app:
+        from rag_pipeline.warmup import preload_models
+
+        preload_models()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from rag_pipeline.warmup import warm_models
+
+        warm_models()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges; its counters and histograms are kept
+    if multiproc_dir:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,37 +1,85 @@
-from docling.document_converter import DocumentConverter
-from sentence_transformers import SentenceTransformer
-from google.generativeai import configure, GenerativeModel
-from google.generativeai.types import GenerationConfig
+# The model libraries (docling, sentence_transformers, google.generativeai)
+# are only imported by the loaders in utils.py, on first use.
 from typing import List, Dict
-from sentence_transformers.cross_encoder import CrossEncoder
-from neo4j import GraphDatabase
 from icecream import ic
 ic.configureOutput(prefix=f'Debug | ', includeContext=True)
 import os
 import json
+import hashlib
+import re
+import time
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 from .utils import (
         get_llm_model,
         extract_entities_from_text,
+        extract_entities_from_chunks,
         get_docling_converter,
         get_reranker_model,
-        get_embedding_model
+        get_embedding_model,
+        embed_texts,
+        embed_query,
+        get_retrieval_cache,
+        get_vector_store,
+        get_entity_dictionary,
+        find_question_entities,
+        get_rerank_score_cache,
+        RERANKER_BACKEND,
+        RERANKER_BATCH_SIZE
 ) 
-
-def generate_answer_with_context(question: str, context_chunks: List[Dict]) -> str:
-    """
-    Generates an answer to the question using the provided context chunks and Gemini.
-
-    Args:
-        question: The user's question
-        context_chunks: List of relevant chunks (with 'text' and other metadata)
-
-    Returns:
-        The generated answer
-    """
-    # Initialize the Gemini model
-    model = get_llm_model()
-
+from .schema import ensure_schema
+from .pipeline import run_pipeline
+from .extractors import STOPWORDS
+from .retrieval_cache import normalize_question
+from .timing import StageTimer
+from .metrics import (
+    QUERY_STAGE_SECONDS,
+    INGEST_STAGE_SECONDS,
+    RERANK_CANDIDATES,
+    observe_stage,
+    time_stage,
+    record_cache_lookups
+)
+
+# Chunks per Neo4j write transaction, and how many documents
+# process_and_ingest_pdfs ingests at the same time.
+NEO4J_WRITE_BATCH_SIZE = int(os.getenv("NEO4J_WRITE_BATCH_SIZE", "100"))
+INGEST_MAX_PARALLEL_DOCUMENTS = int(os.getenv("INGEST_MAX_PARALLEL_DOCUMENTS", "2"))
+
+# Streaming ingestion: pages converted by Docling per step, and how many of
+# those windows may wait between two pipeline stages.
+PIPELINE_PAGES_PER_WINDOW = int(os.getenv("PIPELINE_PAGES_PER_WINDOW", "8"))
+PIPELINE_BUFFER_SIZE = int(os.getenv("PIPELINE_BUFFER_SIZE", "2"))
+
+# Hybrid retrieval: hits taken from each branch, how many fused candidates go
+# to the reranker, and how the branches are fused ("rrf" = reciprocal rank
+# fusion, "weighted" = weighted sum of min-max normalized branch scores).
+HYBRID_VECTOR_TOP_K = int(os.getenv("HYBRID_VECTOR_TOP_K", "10"))
+HYBRID_GRAPH_TOP_K = int(os.getenv("HYBRID_GRAPH_TOP_K", "10"))
+HYBRID_LEXICAL_TOP_K = int(os.getenv("HYBRID_LEXICAL_TOP_K", "10"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf").lower()
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_WEIGHTS = {
+    "vector": float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0")),
+    "graph": float(os.getenv("HYBRID_GRAPH_WEIGHT", "1.0")),
+    "lexical": float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0")),
+}
+
+# Document comparison: chunks per document fed to the synthesis prompt, and
+# how many documents are retrieved from at once.
+COMPARE_TOP_K = int(os.getenv("COMPARE_TOP_K", "4"))
+COMPARE_MAX_WORKERS = int(os.getenv("COMPARE_MAX_WORKERS", "4"))
+
+# Skip the CrossEncoder when the fused retrieval scores already separate the
+# top_k candidates from the rest: the top_k-th fusion score must be at least
+# this many times the next one. 0 disables the early exit.
+RERANK_EARLY_EXIT_RATIO = float(os.getenv("RERANK_EARLY_EXIT_RATIO", "0"))
+
+def build_answer_prompt(question: str, context_chunks: List[Dict]) -> str:
+    """Builds the answer prompt from the question and the retrieved chunks."""
     # Prepare the context by combining all relevant chunks
     context = "\n\n".join([f"Source (Page {chunk['page']}, Chunk {chunk['chunkno']}):\n{chunk['text']}"
                           for chunk in context_chunks])
@@ -47,14 +95,65 @@ def generate_answer_with_context(question: str, context_chunks: List[Dict]) -> s
     Question: {question}
 
     Answer:"""
+    return prompt
+
+def generate_answer_with_context(question: str, context_chunks: List[Dict]) -> str:
+    """
+    Generates an answer to the question using the provided context chunks and Gemini.
+
+    Args:
+        question: The user's question
+        context_chunks: List of relevant chunks (with 'text' and other metadata)
+
+    Returns:
+        The generated answer
+    """
+    # Initialize the Gemini model
+    model = get_llm_model()
+
+    prompt = build_answer_prompt(question, context_chunks)
 
     # Generate the response
-    response = model.generate_content(prompt)
+    with time_stage(QUERY_STAGE_SECONDS, "generation"):
+        response = model.generate_content(prompt, purpose="answer")
     
     #print(response)
 
     return response.text
 
+async def stream_answer_with_context(question: str, context_chunks: List[Dict]):
+    """
+    Streams the answer from Gemini as it is generated.
+
+    Uses the async streaming API, so an ASGI worker serves other requests
+    while it waits for tokens.
+
+    Yields:
+        str: Pieces of the answer text, in order.
+    """
+    model = get_llm_model()
+    prompt = build_answer_prompt(question, context_chunks)
+
+    start = time.perf_counter()
+    first_token = True
+    # The client counts the call and its tokens once the stream is consumed
+    response = await model.generate_content_async(prompt, stream=True, purpose="answer_stream")
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # A chunk without text parts (e.g. only safety ratings or the finish reason)
+            continue
+        if not text:
+            continue
+        if first_token:
+            first_token_seconds = time.perf_counter() - start
+            observe_stage(QUERY_STAGE_SECONDS, "first_token", first_token_seconds)
+            print(f"--- [Stream] First token after {first_token_seconds * 1000:.0f} ms ---")
+            first_token = False
+        yield text
+    observe_stage(QUERY_STAGE_SECONDS, "generation", time.perf_counter() - start)
+
 def query_llm(driver, question: str, filename: str, top_k: int = 4) -> str:
     """
     End-to-end function that:
@@ -88,12 +187,14 @@ def query_llm(driver, question: str, filename: str, top_k: int = 4) -> str:
 
     return answer
 
-def process_pdf_with_docling(pdf_path):
+def process_pdf_with_docling(pdf_path, page_range=None):
     """
     Processes a PDF file using Docling to extract its content into a structured format.
 
     Args:
         pdf_path (str): The file path to the PDF document.
+        page_range (tuple): Optional (first, last) page numbers, 1-based and
+            inclusive, to convert only part of the document.
 
     Returns:
         A dictionary representing the structured document content, or None if an error occurs.
@@ -114,7 +215,10 @@ def process_pdf_with_docling(pdf_path):
         # 2. Convert the document
         # Docling can take a file path directly.
         #print(f"Processing '{pdf_path}' with Docling...")
-        result = converter.convert(pdf_path)
+        if page_range:
+            result = converter.convert(pdf_path, page_range=page_range)
+        else:
+            result = converter.convert(pdf_path)
         #print("Conversion complete.")
         
         # 3. Export to a structured format (e.g., a Python dictionary or Markdown)
@@ -128,34 +232,86 @@ def process_pdf_with_docling(pdf_path):
         print(f"An error occurred while processing the PDF with Docling: {e}")
         return None
 
-def create_fixed_size_chunks(data, filename, chunk_size=1000, chunk_overlap=150):
+def get_pdf_page_count(pdf_path):
+    """Returns the number of pages in a PDF without converting it."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as pdf:
+        return pdf.page_count
 
-    page_chunks = {}
+def iter_pdf_page_windows(pdf_path, first_page=1, last_page=None, pages_per_window=None):
+    """
+    Converts a PDF with Docling a few pages at a time.
+
+    Yields:
+        list: (page_number, page_text) pairs for each window of pages, so only
+        one window's worth of Docling output is held in memory at a time.
+    """
+    pages_per_window = max(1, pages_per_window or PIPELINE_PAGES_PER_WINDOW)
+    last_page = last_page or get_pdf_page_count(pdf_path)
+
+    for start in range(first_page, last_page + 1, pages_per_window):
+        end = min(start + pages_per_window - 1, last_page)
+        docling_output = process_pdf_with_docling(pdf_path, page_range=(start, end))
+        if not docling_output:
+            raise ValueError(f"Docling failed to process pages {start}-{end} of the PDF.")
+        yield list(group_text_by_page(docling_output).items())
+
+def compute_content_hash(pdf_path):
+    """Returns the SHA-256 hex digest of a file, read in 1 MB blocks."""
+    sha = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def group_text_by_page(data):
+    """Collects the text blocks of a Docling document into one string per page."""
+    page_texts = {}
     for text_block in data.get('texts', []):
         if text_block.get('label') == 'text':
             prov = text_block.get('prov', [{}])[0]
             page_number = prov.get('page_no')
             content = text_block.get('text', '')
             if page_number and content:
-                page_chunks.setdefault(page_number, []).append(content.strip())
+                page_texts.setdefault(page_number, []).append(content.strip())
+
+    return {page_num: '\n\n'.join(texts) for page_num, texts in sorted(page_texts.items())}
+
+def chunk_page_text(page_num, page_content, filename, chunk_size=1000, chunk_overlap=150):
+    """
+    Splits the text of a single page into fixed-size, overlapping chunks.
+
+    Every chunk carries a stable id (filename, page, position on the page) and
+    the hash of the page it came from, so a later upload of a revised file can
+    tell which pages changed.
+    """
+    page_hash = hashlib.sha256(page_content.encode('utf-8')).hexdigest()
+
+    chunks = []
+    start_index = 0
+    while start_index < len(page_content):
+        end_index = min(start_index + chunk_size, len(page_content))
+        chunk_on_page = len(chunks) + 1
+        chunks.append({
+            "chunk_id": f"{filename}:{page_num}:{chunk_on_page}",
+            "page_number": page_num,
+            "page_hash": page_hash,
+            "text": page_content[start_index:end_index],
+            "chunk_on_page": chunk_on_page,
+            "source": filename
+        })
+        start_index += chunk_size - chunk_overlap
+
+    return chunks
+
+def create_fixed_size_chunks(data, filename, chunk_size=1000, chunk_overlap=150):
 
     final_chunks = []
-    for page_num, texts in sorted(page_chunks.items()):
-        page_content = '\n\n'.join(texts)
+    for page_num, page_content in group_text_by_page(data).items():
         if not page_content:
             continue
-
-        start_index = 0
-        while start_index < len(page_content):
-            end_index = min(start_index + chunk_size, len(page_content))
-            chunk = page_content[start_index:end_index]
-            final_chunks.append({
-                "page_number": page_num,
-                "text": chunk,
-                "chunk_on_page": len(final_chunks) + 1,
-                "source": filename
-            })
-            start_index += chunk_size - chunk_overlap
+        final_chunks.extend(chunk_page_text(page_num, page_content, filename, chunk_size, chunk_overlap))
 
     return final_chunks
 
@@ -168,282 +324,774 @@ def generate_embeddings(chunks):
 
     Returns:
         list: The same list of chunks, with an 'embedding' key added to each.
+        Embeddings are float32 rows of one contiguous array; they are only
+        turned into lists when written to Neo4j.
     """
-    # Load a pre-trained sentence transformer model.
-    # The first time you run this, it will download the model.
-    model = get_embedding_model()
-
     # It's more efficient to embed all texts at once
     texts_to_embed = [chunk['text'] for chunk in chunks]
 
     #print("Generating embeddings... This may take a moment.")
-    # Generate embeddings
-    embeddings = model.encode(texts_to_embed, show_progress_bar=True)
+    # Generate embeddings. Texts embedded before (re-ingests, repeated
+    # boilerplate pages) come from the embedding cache without touching the model.
+    embeddings = embed_texts(texts_to_embed)
 
     # Add the generated embedding to its corresponding chunk
     for i, chunk in enumerate(chunks):
-        chunk['embedding'] = embeddings[i].tolist()
+        chunk['embedding'] = embeddings[i]
     return chunks
 
-def create_vector_index(driver):
-    """Creates a vector index in Neo4j for the Chunk embeddings."""
-    index_query = """
-    CREATE VECTOR INDEX `chunk_embeddings` IF NOT EXISTS
-    FOR (c:Chunk) ON (c.embedding)
-    OPTIONS { indexConfig: {
-        `vector.dimensions`: 384,
-        `vector.similarity_function`: 'cosine'
-    }}
-    """
-    with driver.session() as session:
-        session.run(index_query)
-        #print("Vector index created or already exists.")
-
-def ingest_chunks_into_neo4j(driver, filename, chunks_with_embeddings):
+INGEST_CHUNKS_QUERY = """
+MERGE (d:Document {filename: $filename})
+WITH d
+UNWIND $chunks AS chunk_data
+MERGE (c:Chunk {chunk_id: chunk_data.chunk_id})
+SET c.text = chunk_data.text,
+    c.source = chunk_data.source,
+    c.page_number = chunk_data.page_number,
+    c.page_hash = chunk_data.page_hash,
+    c.chunk_on_page = chunk_data.chunk_on_page,
+    c.embedding = chunk_data.embedding
+
+// Connect the document to its chunk
+MERGE (d)-[:HAS_CHUNK]->(c)
+WITH c, chunk_data
+UNWIND chunk_data.entities AS entity_name
+MERGE (e:Entity {name: entity_name})
+ON CREATE SET e.created_at = timestamp()
+MERGE (c)-[:MENTIONS]->(e)
+"""
+
+def _write_chunk_batch(tx, filename, batch):
+    """Transaction function: writes one batch of chunks."""
+    # The driver cannot send numpy arrays; convert the batch's vectors in one go
+    embeddings = np.asarray([chunk['embedding'] for chunk in batch], dtype=np.float32).tolist()
+    batch = [dict(chunk, embedding=embedding) for chunk, embedding in zip(batch, embeddings)]
+    tx.run(INGEST_CHUNKS_QUERY, filename=filename, chunks=batch)
+
+def ingest_chunks_into_neo4j(driver, filename, chunks_with_embeddings, batch_size=None):
     """
     Ingests document and chunk data into Neo4j, ensuring each chunk
     is tagged with its source filename.
+
+    Chunks are sent in batches of batch_size (NEO4J_WRITE_BATCH_SIZE by
+    default), each in its own managed write transaction, which the driver
+    retries on transient errors such as deadlocks between parallel writers.
+    This keeps every Bolt message and transaction small.
+
+    Chunks are merged on their chunk_id, so writing the same chunk twice
+    updates it in place instead of duplicating it. If ingestion dies part way,
+    the committed batches stay in the database and the next run's page diff
+    (see process_and_ingest_pdf) only rewrites the pages that are incomplete.
+
+    Returns:
+        int: The number of chunks written.
+    """
+    batch_size = max(1, batch_size or NEO4J_WRITE_BATCH_SIZE)
+    written = 0
+
+    with driver.session(database="neo4j") as session: # It's good practice to specify the database
+        for start in range(0, len(chunks_with_embeddings), batch_size):
+            batch = chunks_with_embeddings[start:start + batch_size]
+            session.execute_write(_write_chunk_batch, filename, batch)
+            written += len(batch)
+            #print(f"Ingested {written}/{len(chunks_with_embeddings)} chunks for document '{filename}'.")
+
+    return written
+
+def find_document_by_hash(driver, content_hash):
+    """Returns the filename of an already ingested document with this content hash, or None."""
+    query = "MATCH (d:Document {content_hash: $content_hash}) RETURN d.filename AS filename LIMIT 1"
+    with driver.session(database="neo4j") as session:
+        record = session.run(query, content_hash=content_hash).single()
+        return record["filename"] if record else None
+
+def get_stored_pages(driver, filename):
+    """
+    Returns what is already stored for a document, page by page.
+
+    Returns:
+        dict: page_number -> (page_hash, number of chunks on that page)
+    """
+    query = """
+    MATCH (:Document {filename: $filename})-[:HAS_CHUNK]->(c:Chunk)
+    RETURN c.page_number AS page, c.page_hash AS page_hash, count(c) AS chunk_count
+    """
+    with driver.session(database="neo4j") as session:
+        results = session.run(query, filename=filename)
+        return {record["page"]: (record["page_hash"], record["chunk_count"]) for record in results}
+
+def delete_pages(driver, filename, page_numbers):
+    """Deletes the chunks (and their MENTIONS edges) of the given pages of a document."""
+    if not page_numbers:
+        return
+    query = """
+    MATCH (:Document {filename: $filename})-[:HAS_CHUNK]->(c:Chunk)
+    WHERE c.page_number IN $page_numbers
+    DETACH DELETE c
     """
-    ingest_query = """
+    with driver.session(database="neo4j") as session:
+        session.run(query, filename=filename, page_numbers=list(page_numbers))
+    get_vector_store().delete(filename, page_numbers)
+
+def finalize_document(driver, filename, content_hash, page_count):
+    """Marks a document as fully ingested by recording its content hash."""
+    query = """
     MERGE (d:Document {filename: $filename})
-    WITH d
-    UNWIND $chunks AS chunk_data
-    CREATE (c:Chunk {
-        text: chunk_data.text,
-        source: chunk_data.source, // <-- The new and important line
-        page_number: chunk_data.page_number,
-        chunk_on_page: chunk_data.chunk_on_page,
-        embedding: chunk_data.embedding
-    })
-    
-    // This part also remains the same: connect the document to its chunk
-    CREATE (d)-[:HAS_CHUNK]->(c)
-    WITH c, chunk_data
-    UNWIND chunk_data.entities AS entity_name
-    MERGE (e:Entity {name: entity_name})
-    CREATE (c)-[:MENTIONS]->(e)
+    SET d.content_hash = $content_hash, d.page_count = $page_count
     """
-    
-    # The session execution block remains the same
-    with driver.session(database="neo4j") as session: # It's good practice to specify the database
-        session.run(ingest_query, filename=filename, chunks=chunks_with_embeddings)
-        #print(f"Ingested {len(chunks_with_embeddings)} chunks for document '{filename}'.")
+    with driver.session(database="neo4j") as session:
+        session.run(query, filename=filename, content_hash=content_hash, page_count=page_count)
 
 def query_neo4j_for_chunks(driver, model, query_text, top_k=3):
-    """Finds the most relevant chunks in Neo4j for a given query."""
+    """Finds the most relevant chunks across all documents for a given query."""
     # First, create an embedding for the user's query
-    query_embedding = model.encode(query_text).tolist()
+    query_embedding = embed_query(query_text, model)
+
+    hits = get_vector_store().search(driver, query_embedding, None, top_k)
+    return fetch_chunk_texts(driver, hits)
+
+def fetch_chunk_texts(driver, hits):
+    """
+    Fills in text, page and chunk number for vector hits that only carry a
+    chunk_id (e.g. from FAISS), by looking the chunks up in Neo4j.
+    """
+    missing = [hit["chunk_id"] for hit in hits if "text" not in hit]
+    if not missing:
+        return hits
 
     query = """
-    CALL db.index.vector.queryNodes('chunk_embeddings', $top_k, $embedding) YIELD node, score
-    RETURN node.text AS text, node.page_number AS page, node.chunk_on_page AS chunkno, score
+    UNWIND $chunk_ids AS chunk_id
+    MATCH (c:Chunk {chunk_id: chunk_id})
+    RETURN c.chunk_id AS chunk_id, c.text AS text, c.page_number AS page, c.chunk_on_page AS chunkno
     """
+    with driver.session(database="neo4j") as session:
+        rows = {record["chunk_id"]: record for record in session.run(query, chunk_ids=missing)}
+
+    chunks = []
+    for hit in hits:
+        if "text" not in hit:
+            record = rows.get(hit["chunk_id"])
+            if record is None: # Deleted from the graph since the index was built
+                continue
+            hit = {**hit, "text": record["text"], "page": record["page"], "chunkno": record["chunkno"]}
+        chunks.append(hit)
+    return chunks
+
+def delete_document(driver, filename):
+    """Deletes a document and all of its chunks, and drops its cached retrieval results."""
+    query = """
+    MATCH (d:Document {filename: $filename})
+    OPTIONAL MATCH (d)-[:HAS_CHUNK]->(c:Chunk)
+    DETACH DELETE c, d
+    """
+    with driver.session(database="neo4j") as session:
+        session.run(query, filename=filename)
+    get_vector_store().delete(filename)
+    get_retrieval_cache().invalidate_document(filename)
 
-    with driver.session() as session:
-        results = session.run(query, top_k=top_k, embedding=query_embedding)
-        return [{"text": record["text"], "page": record["page"], "chunkno": record["chunkno"], "score": record["score"]} for record in results]
+def ingest_pdf_pages(driver, pdf_filepath, filename, stored_pages, first_page=1, last_page=None, timer=None):
+    """
+    Streams a range of PDF pages through convert -> chunk -> extract -> embed -> write.
 
-def process_and_ingest_pdf(driver, pdf_filepath):
+    Every stage runs on its own thread and passes one window of pages (see
+    iter_pdf_page_windows) to the next through a bounded queue. While one
+    window waits on the LLM, the next is being converted and the previous one
+    is being embedded or written, and memory use depends on the window size,
+    not on the document size.
 
-    """A single function that runs the entire ingestion pipeline for a given PDF."""
-    #print(f"--- Starting Ingestion Pipeline for: {pdf_filepath} ---")
-    filename = os.path.basename(pdf_filepath)
+    Pages whose hash and chunk count match stored_pages are skipped; the old
+    chunks of every other page are deleted before its new chunks are written.
+
+    Args:
+        driver: Neo4j driver instance
+        pdf_filepath: Path of the PDF
+        filename: Document name the chunks are stored under
+        stored_pages: What is already stored, from get_stored_pages()
+        first_page, last_page: Page range to ingest (1-based, inclusive).
+            last_page defaults to the last page of the PDF.
+        timer (StageTimer): Collects the time spent in each stage, if given.
+
+    Returns:
+        dict: The page numbers seen, the page numbers changed and the number
+        of chunks written.
+    """
+    timer = timer or StageTimer(INGEST_STAGE_SECONDS)
+    seen_pages = set()
+    changed_pages = set()
+
+    def chunk_stage(windows):
+        for window in windows:
+            chunks = []
+            window_changed = []
+            with timer.stage("chunking"):
+                for page_num, page_content in window:
+                    seen_pages.add(page_num)
+                    page_chunks = chunk_page_text(page_num, page_content, filename)
+                    if not page_chunks:
+                        continue
+                    if stored_pages.get(page_num) == (page_chunks[0]['page_hash'], len(page_chunks)):
+                        continue
+                    window_changed.append(page_num)
+                    chunks.extend(page_chunks)
+
+            # Drop what is stored for the pages about to be rewritten
+            stale_pages = [p for p in window_changed if p in stored_pages]
+            if stale_pages:
+                with timer.stage("neo4j_write"):
+                    delete_pages(driver, filename, stale_pages)
+                get_retrieval_cache().invalidate_document(filename)
+            changed_pages.update(window_changed)
+            if chunks:
+                yield chunks
+
+    def extract_stage(chunk_lists):
+        for chunks in chunk_lists:
+            # Extract entities for the window's chunks in batched, concurrent LLM calls
+            with timer.stage("entity_extraction"):
+                chunk_entities = extract_entities_from_chunks([chunk['text'] for chunk in chunks])
+
+            # Add source filename to each chunk. This is crucial.
+            for chunk, entities in zip(chunks, chunk_entities):
+
+                chunk['entities'] = entities
+
+                if 'metadata' not in chunk: # Make sure metadata key exists
+                    chunk['metadata'] = {}
+                chunk['metadata']['source'] = filename
+            yield chunks
+
+    def embed_stage(chunk_lists):
+        for chunks in chunk_lists:
+            with timer.stage("embedding"):
+                chunks = generate_embeddings(chunks)
+            yield chunks
+
+    def write_stage(chunk_lists):
+        vector_store = get_vector_store()
+        for chunks in chunk_lists:
+            with timer.stage("neo4j_write"):
+                written = ingest_chunks_into_neo4j(driver, filename, chunks)
+                vector_store.add(filename, [chunk['chunk_id'] for chunk in chunks],
+                                 np.stack([chunk['embedding'] for chunk in chunks]))
+            yield written
+
+    written = sum(run_pipeline(
+        timer.timed("docling", iter_pdf_page_windows(pdf_filepath, first_page, last_page)),
+        [
+            ("chunk", chunk_stage),
+            ("extract", extract_stage),
+            ("embed", embed_stage),
+            ("write", write_stage),
+        ],
+        buffer_size=PIPELINE_BUFFER_SIZE
+    ))
+
+    return {"pages_seen": seen_pages, "pages_changed": changed_pages, "chunks_written": written}
+
+def complete_ingestion(driver, filename, content_hash, stored_pages, pages_seen):
+    """
+    Finishes a document once all of its pages went through ingest_pdf_pages.
 
-    docling_output = process_pdf_with_docling(pdf_filepath)
+    Deletes the pages that are gone from the new version, builds the vector
+    index, records the content hash (which marks the document as complete)
+    and invalidates cached retrieval results.
 
-    if not docling_output:
-        raise ValueError("Docling failed to process the PDF.")
+    Args:
+        stored_pages: The pages stored before this ingestion: get_stored_pages(), or just its page numbers
+        pages_seen: Every page number of the new version
+    """
+    # Pages that no longer exist (or no longer have text) in the new version
+    delete_pages(driver, filename, [p for p in stored_pages if p not in pages_seen])
+
+    get_vector_store().commit(filename)
+    finalize_document(driver, filename, content_hash, len(pages_seen))
+    get_retrieval_cache().invalidate_document(filename)
+    # Pick up the new entities right away in this process; others refresh on their own
+    get_entity_dictionary().refresh(driver)
 
-    chunks = create_fixed_size_chunks(docling_output, filename)
+def process_and_ingest_pdf(driver, pdf_filepath, filename=None, timer=None):
 
-    # Add source filename to each chunk. This is crucial.
-    for chunk in chunks:
+    """
+    A single function that runs the entire ingestion pipeline for a given PDF.
 
-        chunk['entities'] = extract_entities_from_text(chunk['text'])
+    Uploads whose content hash is already in the database are skipped before
+    Docling or the LLM are touched. A revised version of an existing document
+    is diffed page by page, and only pages that changed are re-chunked,
+    re-embedded and re-written. The pages stream through the pipeline stages
+    concurrently (see ingest_pdf_pages).
 
-        if 'metadata' not in chunk: # Make sure metadata key exists
-            chunk['metadata'] = {}
-        chunk['metadata']['source'] = filename
+    Args:
+        driver: Neo4j driver instance
+        pdf_filepath: Path of the uploaded PDF
+        filename: Document name to store it under. Defaults to the file's basename.
+        timer (StageTimer): Collects the time spent in each stage, if given.
+
+    Returns:
+        A dict summarising what was done, including the stage timings.
+    """
+    #print(f"--- Starting Ingestion Pipeline for: {pdf_filepath} ---")
+    filename = filename or os.path.basename(pdf_filepath)
 
-    chunks_with_embeddings = generate_embeddings(chunks)
+    # Make sure the indexes and constraints exist before ingesting (once per process)
+    ensure_schema(driver)
 
-    # Make sure vector index exists before ingesting
-    create_vector_index(driver) # Assuming you have this function
+    content_hash = compute_content_hash(pdf_filepath)
+    existing = find_document_by_hash(driver, content_hash)
+    if existing:
+        print(f"--- '{filename}' is identical to already ingested '{existing}', skipping ---")
+        return {"status": "skipped", "filename": filename, "duplicate_of": existing}
 
-    ingest_chunks_into_neo4j(driver, filename, chunks_with_embeddings)
+    # Page-level diff against what is already stored under this filename
+    stored_pages = get_stored_pages(driver, filename)
+
+    timer = timer or StageTimer(INGEST_STAGE_SECONDS)
+    result = ingest_pdf_pages(driver, pdf_filepath, filename, stored_pages, timer=timer)
+
+    with timer.stage("neo4j_write"):
+        complete_ingestion(driver, filename, content_hash, stored_pages, result["pages_seen"])
 
     #print(f"--- Successfully Ingested: {filename} ---")
+    return {
+        "status": "ingested",
+        "filename": filename,
+        "pages": len(result["pages_seen"]),
+        "pages_changed": len(result["pages_changed"]),
+        "chunks_written": result["chunks_written"],
+        "timings": timer.as_dict(),
+    }
+
+def process_and_ingest_pdfs(driver, pdf_filepaths, max_workers=None):
+    """
+    Ingests several independent PDFs in parallel.
 
-def rerank_chunks(question, chunks):
-    """Re-ranks a list of chunks using a more powerful CrossEncoder model."""
-    #model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2', max_length=512)
+    Every document runs the full pipeline on its own thread, so their Neo4j
+    write batches (and LLM calls) overlap.
+
+    Args:
+        driver: Neo4j driver instance (thread-safe, shared by all documents)
+        pdf_filepaths: Paths of the PDFs to ingest
+        max_workers: Documents processed at once. Defaults to INGEST_MAX_PARALLEL_DOCUMENTS.
 
-    model = get_reranker_model()
+    Returns:
+        list: One summary dict per file, in order. A failed document has
+        status "failed" and does not stop the others.
+    """
+    max_workers = max(1, max_workers or INGEST_MAX_PARALLEL_DOCUMENTS)
+
+    def ingest_one(pdf_filepath):
+        try:
+            return process_and_ingest_pdf(driver, pdf_filepath)
+        except Exception as e:
+            print(f"--- Ingestion failed for '{pdf_filepath}': {e} ---")
+            return {"status": "failed", "filename": os.path.basename(pdf_filepath), "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(ingest_one, pdf_filepaths))
+
+def fused_scores_separate(chunks, top_k, ratio=None):
+    """
+    True if the fusion scores already clearly separate the top_k chunks from the rest.
 
-    # The model expects a list of [question, chunk_text] pairs
-    pairs = [[question, chunk['text']] for chunk in chunks]
+    That needs a candidate beyond rank top_k to compare with, and a real gap:
+    the top_k-th score must exceed the next one and be at least ratio times it.
+    """
+    ratio = RERANK_EARLY_EXIT_RATIO if ratio is None else ratio
+    if ratio <= 0 or len(chunks) <= top_k or any("fusion_score" not in c for c in chunks):
+        return False
+    ranked = sorted(chunks, key=lambda c: c["fusion_score"], reverse=True)
+    kth, next_score = ranked[top_k - 1]["fusion_score"], ranked[top_k]["fusion_score"]
+    return kth > next_score and kth >= ratio * next_score
+
+def rerank_chunks(question, chunks, top_k=None):
+    """
+    Re-ranks a list of chunks using a more powerful CrossEncoder model.
 
-    scores = model.predict(pairs)
+    Scores are cached per (question, chunk), so only pairs that were never
+    scored go through the model, in batches of RERANKER_BATCH_SIZE. If top_k is
+    given and the fused retrieval scores already separate the top_k candidates
+    clearly (see RERANK_EARLY_EXIT_RATIO), the model is skipped altogether and
+    the fusion order is kept, with 'rerank_score' set to the fusion score.
+    """
+    #model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2', max_length=512)
+    start = time.perf_counter()
+
+    if top_k and fused_scores_separate(chunks, top_k):
+        for chunk in chunks:
+            chunk['rerank_score'] = chunk['fusion_score']
+        RERANK_CANDIDATES.labels(scored_by="fusion").inc(len(chunks))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        observe_stage(QUERY_STAGE_SECONDS, "rerank", elapsed_ms / 1000)
+        print(f"--- [Rerank] Skipped: fused scores separate the top {top_k} of {len(chunks)} candidates "
+              f"({elapsed_ms:.1f} ms) ---")
+        return sorted(chunks, key=lambda x: x['rerank_score'], reverse=True)
+
+    score_cache = get_rerank_score_cache()
+    question_key = hashlib.sha1(normalize_question(question).encode('utf-8')).hexdigest()
+    keys = [(RERANKER_BACKEND, question_key, chunk.get('chunk_id'), hashlib.sha1(chunk['text'].encode('utf-8')).hexdigest())
+            for chunk in chunks]
+    scores = [score_cache.get(key) for key in keys]
+
+    to_score = [i for i, score in enumerate(scores) if score is None]
+    if to_score:
+        model = get_reranker_model()
+
+        # The model expects a list of [question, chunk_text] pairs
+        pairs = [[question, chunks[i]['text']] for i in to_score]
+
+        new_scores = model.predict(pairs, batch_size=RERANKER_BATCH_SIZE, show_progress_bar=False)
+        for i, score in zip(to_score, new_scores):
+            scores[i] = float(score)
+            score_cache.put(keys[i], scores[i])
 
     # Combine chunks with their new scores and sort
     for i, chunk in enumerate(chunks):
         chunk['rerank_score'] = scores[i]
 
+    record_cache_lookups("rerank_score", len(chunks) - len(to_score), len(to_score))
+    RERANK_CANDIDATES.labels(scored_by="cache").inc(len(chunks) - len(to_score))
+    RERANK_CANDIDATES.labels(scored_by="model").inc(len(to_score))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    observe_stage(QUERY_STAGE_SECONDS, "rerank", elapsed_ms / 1000)
+    print(f"--- [Rerank] {len(chunks)} candidates ({len(chunks) - len(to_score)} cached) in {elapsed_ms:.1f} ms ---")
+
     return sorted(chunks, key=lambda x: x['rerank_score'], reverse=True)
 
+def retrieve_context(driver, question, filename, top_k=3):
+    """
+    Runs retrieval for a question: hybrid search, reranking and the retrieval cache.
+
+    Returns:
+        list: The top_k chunks to answer from, best first. Empty if nothing relevant was found.
+    """
+    # Repeat questions about the same document reuse the reranked candidates
+    # and only pay for answer generation.
+    retrieval_cache = get_retrieval_cache()
+    retrieval_params = {
+        "retrieval": "hybrid",
+        "vector_top_k": HYBRID_VECTOR_TOP_K,
+        "graph_top_k": HYBRID_GRAPH_TOP_K,
+        "lexical_top_k": HYBRID_LEXICAL_TOP_K,
+        "candidates": HYBRID_CANDIDATES,
+        "fusion": HYBRID_FUSION,
+    }
+    reranked_chunks = None
+    if retrieval_cache.max_items > 0:
+        # Read before retrieving: a result is only cached if the document did not change meanwhile
+        document_stamp = retrieval_cache.document_stamp(filename)
+        reranked_chunks = retrieval_cache.get(question, filename, retrieval_params)
+        record_cache_lookups("retrieval", int(reranked_chunks is not None), int(reranked_chunks is None))
+
+    if reranked_chunks is None:
+        # The embedding model is only loaded if the question is not in the embedding cache
+        #relevant_chunks = query_neo4j_for_chunks(driver, None, question, top_k)
+        relevant_chunks = hybrid_retrieval(driver, None, question, filename)
+
+        if not relevant_chunks:
+            return []
+
+        #ic("CANDIDATE chunks from initial retrieval (Top 10):")
+        #for i, chunk in enumerate(relevant_chunks):
+            #print(f" {i+1}. Page {chunk.get('page', 'N/A')}, '{chunk['text'][:80]}...'")
+
+        reranked_chunks = rerank_chunks(question, relevant_chunks, top_k)
+
+        #ic("RE-RANKED chunks (sorted by new score):")
+        #for i, chunk in enumerate(reranked_chunks):
+            # We print the new rerank_score to see the new order
+            #print(f"  {i+1}. Page {chunk.get('page', 'N/A')}, Score: {chunk.get('rerank_score', 0):.4f}, '{chunk['text'][:80]}...'")
+
+        if retrieval_cache.max_items > 0:
+            retrieval_cache.put(question, filename, retrieval_params, reranked_chunks, document_stamp)
+
+    return reranked_chunks[:top_k]
+
+NO_CONTEXT_ANSWER = "I could not find any relevant information in the document to answer your question."
+
 def ask_question_to_rag(driver, question, filename, top_k=3):
 
     """A single function that runs the entire querying pipeline."""
     #print(f"--- Querying {filename} with question: '{question}' ---")
 
-    # This calls the query function you already wrote
-    EMBEDDING_MODEL = get_embedding_model()
+    with time_stage(QUERY_STAGE_SECONDS, "total"):
+        with time_stage(QUERY_STAGE_SECONDS, "retrieval"):
+            relevant_chunks = retrieve_context(driver, question, filename, top_k)
+        if not relevant_chunks:
+            return NO_CONTEXT_ANSWER
 
-    #relevant_chunks = query_neo4j_for_chunks(driver, EMBEDDING_MODEL, question, top_k)
-    relevant_chunks = hybrid_retrieval(driver, EMBEDDING_MODEL, question, filename)
+        # This calls the LLM function you already wrote
+        answer = generate_answer_with_context(question, relevant_chunks)
+    return answer
 
-    if not relevant_chunks:
-        return "I could not find any relevant information in the document to answer your question."
+def get_list_of_ingested_docs(driver):
+    """Queries Neo4j to get a list of all processed document filenames."""
+    query = "MATCH (d:Document) RETURN d.filename AS filename ORDER BY d.filename"
+    with driver.session(database="neo4j") as session:
+        results = session.run(query)
+        return [record["filename"] for record in results]
 
-    #ic("CANDIDATE chunks from initial retrieval (Top 10):")
-    #for i, chunk in enumerate(relevant_chunks):
-        #print(f" {i+1}. Page {chunk.get('page', 'N/A')}, '{chunk['text'][:80]}...'")
+def vector_search_in_document(driver, query_embedding, filename, top_k=5):
+    """
+    Vector similarity search restricted to the chunks of one document.
 
-    reranked_chunks = rerank_chunks(question, relevant_chunks)
+    Goes through the configured vector store (see get_vector_store). A
+    document that the FAISS store has no index for yet is searched in the
+    Neo4j vector index instead.
 
-    #ic("RE-RANKED chunks (sorted by new score):")
-    #for i, chunk in enumerate(reranked_chunks):
-        # We print the new rerank_score to see the new order
-        #print(f"  {i+1}. Page {chunk.get('page', 'N/A')}, Score: {chunk.get('rerank_score', 0):.4f}, '{chunk['text'][:80]}...'")
-    
-    relevant_chunks = reranked_chunks[:top_k]
+    Returns:
+        list: Up to top_k chunk dicts, best first, each with its vector 'score'.
+    """
+    vector_store = get_vector_store()
+    if vector_store.name == "faiss" and not vector_store.has_document(filename):
+        from .vector_store import Neo4jVectorStore
+        from .utils import VECTOR_OVERFETCH_FACTOR
+        print(f"--- No FAISS index for '{filename}' yet, searching Neo4j instead ---")
+        vector_store = Neo4jVectorStore(overfetch_factor=VECTOR_OVERFETCH_FACTOR)
 
-    # This calls the LLM function you already wrote
-    answer = generate_answer_with_context(question, relevant_chunks)
-    return answer
+    hits = vector_store.search(driver, query_embedding, filename, top_k)
+    return fetch_chunk_texts(driver, hits)
 
-def extract_entities_from_text(text: str) -> list:
-    """Uses the LLM to extract key entities from a text chunk."""
-    model = get_llm_model() # Your lazy-loader for Gemini
+def graph_search_in_document(driver, question_entities, filename, top_k=10):
+    """
+    Finds the chunks of a document that mention entities from the question.
 
-    prompt = (
-        "You are a helpful AI assistant for knowledge graph construction.\n"
-        "From the following text, extract the key entities (people, organizations, locations, technical concepts, projects).\n"
-        "Return the result as a JSON list of strings. Example: [\"NASA\", \"Aerojet Rocketdyne\", \"bipropellant valve\"]\n\n"
-        f"--- TEXT ---\n{text}\n\n"
-        "--- ENTITIES (JSON List) ---\n"
-    )
+    Starts from the (uniquely indexed) Entity nodes rather than scanning chunks,
+    and scores each chunk by how many distinct question entities it mentions.
 
-    try:
-        response = model.generate_content(prompt)
-        #ic(response.text)
-        # Clean up the response to get a valid JSON list
-        json_text = response.text.strip().replace("```json", "").replace("```", "")
-        entities = json.loads(json_text)
-        return entities
-    except (ValueError, json.JSONDecodeError) as e:
-        print(f"Could not parse entities from LLM response: {e}")
+    Returns:
+        list: Up to top_k chunk dicts, best first, each with its graph 'score'.
+    """
+    if not question_entities:
         return []
 
-def get_list_of_ingested_docs(driver):
-    """Queries Neo4j to get a list of all processed document filenames."""
-    query = "MATCH (d:Document) RETURN d.filename AS filename ORDER BY d.filename"
+    graph_query = """
+    UNWIND $question_entities AS entity_name
+    MATCH (entity:Entity {name: entity_name})<-[:MENTIONS]-(graph_node:Chunk)
+    WHERE graph_node.source = $filename
+    WITH graph_node, count(DISTINCT entity) AS score
+    RETURN graph_node.chunk_id AS chunk_id, graph_node.text AS text,
+           graph_node.page_number AS page, graph_node.chunk_on_page AS chunkno, score
+    ORDER BY score DESC, page, chunkno
+    LIMIT $top_k
+    """
     with driver.session(database="neo4j") as session:
-        results = session.run(query)
-        return [record["filename"] for record in results]
+        results = session.run(graph_query, filename=filename, question_entities=question_entities, top_k=top_k)
+        return [{"chunk_id": record["chunk_id"], "text": record["text"], "page": record["page"],
+                 "chunkno": record["chunkno"], "score": record["score"]} for record in results]
 
-def hybrid_retrieval(driver, model, question, filename, top_k=5):
-    """Performs a hybrid search using both vectors and graph entities."""
-    
-    # 1. Extract entities from the user's question
-    question_entities = extract_entities_from_text(question)
-    
-    # 2. Embed the user's question
-    query_embedding = model.encode(question).tolist()
+def _lucene_phrase(text):
+    """Quotes text as a Lucene phrase, escaping the characters that would end it."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
-    hybrid_query = """
-    // Part 1: Vector Search
-    CALL db.index.vector.queryNodes('chunk_embeddings', $top_k, $embedding) YIELD node AS vector_node, score
-    WHERE vector_node.source = $filename
-    
-    // Part 2: Graph Search (find chunks that mention entities from the question)
-    // Use OPTIONAL MATCH so we still get results if no entities are found
-    WITH vector_node, score
-    OPTIONAL MATCH (entity:Entity)<-[:MENTIONS]-(graph_node:Chunk)
-    WHERE entity.name IN $question_entities AND graph_node.source = $filename
-
-    // Collect all unique nodes from both searches
-    WITH collect(DISTINCT vector_node) + collect(DISTINCT graph_node) AS all_nodes
-    UNWIND all_nodes AS node
-    
-    // Return distinct nodes with their text and page number
-    RETURN DISTINCT node.text AS text, node.page_number AS page, node.chunk_on_page AS chunkno
-    LIMIT 10 // Return a larger set of candidates for re-ranking
+def build_fulltext_query(question, filename):
+    """
+    Turns a question into a Lucene query over the chunk_text full-text index.
+
+    Every non-stopword term is searched for (as a quoted phrase, so part
+    numbers like "XR-7" survive tokenization), and the search is restricted to
+    the document through its indexed source field. Returns None if the
+    question has no usable terms.
+    """
+    terms = []
+    for term in re.findall(r"[\w][\w.\-/]*", question):
+        term = term.strip(".-/")
+        if len(term) > 1 and term.lower() not in STOPWORDS and term.lower() not in terms:
+            terms.append(term.lower())
+    if not terms:
+        return None
+    return f"text:({' OR '.join(_lucene_phrase(term) for term in terms)}) AND source:{_lucene_phrase(filename)}"
+
+def lexical_search_in_document(driver, question, filename, top_k=10):
+    """
+    Keyword (BM25) search over the chunks of one document.
+
+    Catches what embeddings and the entity graph miss: part numbers, acronyms
+    and rare terms that appear verbatim in the question.
+
+    Returns:
+        list: Up to top_k chunk dicts, best first, each with its BM25 'score'.
+    """
+    lucene_query = build_fulltext_query(question, filename)
+    if not lucene_query:
+        return []
+
+    fulltext_query = """
+    CALL db.index.fulltext.queryNodes('chunk_text', $lucene_query, {limit: $fetch_k}) YIELD node, score
+    WHERE node.source = $filename
+    RETURN node.chunk_id AS chunk_id, node.text AS text, node.page_number AS page,
+           node.chunk_on_page AS chunkno, score
+    ORDER BY score DESC
+    LIMIT $top_k
     """
-    
     with driver.session(database="neo4j") as session:
-        results = session.run(
-            hybrid_query, 
-            top_k=top_k, 
-            embedding=query_embedding, 
-            filename=filename, 
-            question_entities=question_entities
-        )
-        return [{"text": record["text"], "page": record["page"], "chunkno": record["chunkno"]} for record in results]
+        # The source phrase in the Lucene query does most of the filtering; the
+        # exact WHERE only drops documents whose names contain this one's.
+        results = session.run(fulltext_query, lucene_query=lucene_query, filename=filename,
+                              fetch_k=top_k * 2, top_k=top_k)
+        return [{"chunk_id": record["chunk_id"], "text": record["text"], "page": record["page"],
+                 "chunkno": record["chunkno"], "score": record["score"]} for record in results]
+
+def fuse_ranked_lists(branches, limit, method=None, rrf_k=None, weights=None):
+    """
+    Fuses the ranked results of several retrieval branches into one list.
 
-def compare_documents_on_topic(driver, doc1_filename: str, doc2_filename: str, topic: str) -> str:
+    Args:
+        branches (dict): branch name -> list of chunk dicts, best first, each with a 'score'.
+        limit (int): How many fused candidates to return.
+        method (str): "rrf" (reciprocal rank fusion: sum of weight / (rrf_k + rank))
+            or "weighted" (weighted sum of min-max normalized scores).
+            Defaults to HYBRID_FUSION.
+        rrf_k (int): RRF smoothing constant. Defaults to HYBRID_RRF_K.
+        weights (dict): branch name -> weight. Defaults to HYBRID_WEIGHTS, 1.0 if missing.
+
+    Returns:
+        list: Chunks deduplicated by chunk_id and sorted by 'fusion_score'. Each
+        carries '<branch>_score' and '<branch>_rank' for the branches that found it.
+    """
+    method = method or HYBRID_FUSION
+    rrf_k = rrf_k or HYBRID_RRF_K
+    weights = weights or HYBRID_WEIGHTS
+
+    fused = {}
+    for branch, chunks in branches.items():
+        weight = weights.get(branch, 1.0)
+        scores = [chunk["score"] for chunk in chunks]
+        low, high = (min(scores), max(scores)) if scores else (0, 0)
+
+        for rank, chunk in enumerate(chunks, start=1):
+            key = chunk["chunk_id"] or chunk["text"]
+            entry = fused.get(key)
+            if entry is None:
+                entry = {k: v for k, v in chunk.items() if k != "score"}
+                entry["fusion_score"] = 0.0
+                fused[key] = entry
+            entry[f"{branch}_score"] = chunk["score"]
+            entry[f"{branch}_rank"] = rank
+
+            if method == "weighted":
+                normalized = (chunk["score"] - low) / (high - low) if high > low else 1.0
+                entry["fusion_score"] += weight * normalized
+            else:
+                entry["fusion_score"] += weight / (rrf_k + rank)
+
+    return sorted(fused.values(), key=lambda c: c["fusion_score"], reverse=True)[:limit]
+
+def hybrid_retrieval(driver, model, question, filename, top_k=None, candidates=None):
     """
-    Retrieves context about a topic from two different documents and uses an LLM
+    Performs a hybrid search using vectors, graph entities and keywords.
+
+    The vector, graph and lexical (full-text) branches run as separate scored
+    searches scoped to the document, and their results are fused (see
+    fuse_ranked_lists) into a budget of candidates for the reranker.
+
+    Args:
+        driver: Neo4j driver instance
+        model: Embedding model, or None to load it only on an embedding cache miss
+        question: The user's question
+        filename: The document to search within
+        top_k: Hits taken from the vector branch. Defaults to HYBRID_VECTOR_TOP_K.
+        candidates: Fused candidates returned. Defaults to HYBRID_CANDIDATES.
+
+    Returns:
+        list: Chunk dicts sorted by 'fusion_score', with per-branch scores and ranks.
+    """
+    top_k = top_k or HYBRID_VECTOR_TOP_K
+    candidates = candidates or HYBRID_CANDIDATES
+    
+    # 1. Find the known entities the question mentions (no LLM call by default)
+    with time_stage(QUERY_STAGE_SECONDS, "question_entities"):
+        question_entities = find_question_entities(driver, question)
+    
+    # 2. Embed the user's question (cached for repeat questions)
+    with time_stage(QUERY_STAGE_SECONDS, "query_embedding"):
+        query_embedding = embed_query(question, model)
+
+    # 3. Run each branch on its own, scoped to the document
+    branches = {}
+    with time_stage(QUERY_STAGE_SECONDS, "vector_search"):
+        branches["vector"] = vector_search_in_document(driver, query_embedding, filename, top_k)
+    with time_stage(QUERY_STAGE_SECONDS, "graph_search"):
+        branches["graph"] = graph_search_in_document(driver, question_entities, filename, HYBRID_GRAPH_TOP_K)
+    with time_stage(QUERY_STAGE_SECONDS, "lexical_search"):
+        branches["lexical"] = lexical_search_in_document(driver, question, filename, HYBRID_LEXICAL_TOP_K)
+
+    # 4. Fuse them into one ranked list of candidates for re-ranking
+    return fuse_ranked_lists(branches, candidates)
+
+def compare_documents(driver, filenames: List[str], topic: str, top_k: int = None) -> str:
+    """
+    Retrieves context about a topic from several documents and uses an LLM
     to generate a comparative summary.
 
+    Retrieval and reranking run for all documents concurrently, and the top
+    chunks of each go straight into a single synthesis prompt, so the whole
+    comparison costs one LLM call however many documents are compared.
+
     Args:
         driver: The active Neo4j driver instance.
-        doc1_filename: The filename of the first document.
-        doc2_filename: The filename of the second document.
-        topic: The topic to find and compare in both documents.
+        filenames: The documents to compare (two or more).
+        topic: The topic to find and compare in the documents.
+        top_k: Chunks per document to include. Defaults to COMPARE_TOP_K.
 
     Returns:
         A string containing the comparative summary.
     """
-    print(f"--- [Core Pipeline] Comparing '{doc1_filename}' and '{doc2_filename}' on topic: '{topic}' ---")
+    top_k = top_k or COMPARE_TOP_K
+    filenames = list(dict.fromkeys(filenames))
+    print(f"--- [Core Pipeline] Comparing {len(filenames)} documents on topic: '{topic}' ---")
 
-    # --- Step 1: Gather Context from Both Documents ---
-    # We will reuse our powerful ask_question_to_rag function to get the
-    # most relevant, re-ranked context for the topic from each document.
-    # The "question" we ask is simply the topic itself.
+    # --- Step 1: Gather Context from Every Document, Concurrently ---
+    # The "question" we retrieve for is simply the topic itself. Embed it and
+    # load the reranker once up front rather than racing to do it in every thread.
+    embed_query(topic)
+    get_reranker_model()
 
-    print(f"Gathering context from '{doc1_filename}'...")
-    context1 = ask_question_to_rag(driver, question=topic, filename=doc1_filename)
+    with ThreadPoolExecutor(max_workers=max(1, min(len(filenames), COMPARE_MAX_WORKERS))) as pool:
+        contexts = dict(zip(filenames, pool.map(
+            lambda filename: retrieve_context(driver, topic, filename, top_k), filenames
+        )))
 
-    print(f"Gathering context from '{doc2_filename}'...")
-    context2 = ask_question_to_rag(driver, question=topic, filename=doc2_filename)
+    if not any(contexts.values()):
+        return f"I could not find any information about '{topic}' in any of the documents."
 
     # --- Step 2: Synthesize a Comparison with the LLM ---
     # Now we build a new, specialized prompt for the comparison task.
     llm = get_llm_model() # Get the lazy-loaded Gemini model
 
-    # It's good practice to check if the context was found before calling the LLM
-    if "No relevant information found" in context1 and "No relevant information found" in context2:
-        return f"I could not find any information about '{topic}' in either document."
+    sections = []
+    for filename, chunks in contexts.items():
+        if chunks:
+            context = "\n\n".join(f"(Page {chunk['page']}, Chunk {chunk['chunkno']}):\n{chunk['text']}" for chunk in chunks)
+        else:
+            context = "No relevant information found in this document."
+        sections.append(f"--- CONTEXT FROM: {filename} ---\n{context}\n\n")
 
     comparison_prompt = (
         "You are a helpful summarization and analysis assistant.\n"
-        "Your task is to compare and contrast the information provided from two different documents about a specific topic.\n"
-        "Analyze the context from each document and provide a concise summary of the similarities and differences.\n"
-        "If information is only present in one document, state that clearly.\n\n"
+        f"Your task is to compare and contrast the information provided from {len(filenames)} different documents about a specific topic.\n"
+        "The context below is quoted directly from each document.\n"
+        "Analyze the context from each document and provide a concise summary of the similarities and differences, "
+        "citing the document and page for each point.\n"
+        "If information is only present in some of the documents, state that clearly.\n\n"
         f"--- TOPIC OF COMPARISON ---\n{topic}\n\n"
-        f"--- CONTEXT FROM: {doc1_filename} ---\n{context1}\n\n"
-        f"--- CONTEXT FROM: {doc2_filename} ---\n{context2}\n\n"
+        + "".join(sections) +
         "--- COMPARATIVE SUMMARY ---\n"
     )
 
     try:
+        from google.generativeai.types import GenerationConfig
+
         # Use a generation config for better control
         generation_config = GenerationConfig(
             temperature=0.2 # Factual and concise
         )
-        response = llm.generate_content(comparison_prompt, generation_config=generation_config)
+        with time_stage(QUERY_STAGE_SECONDS, "comparison"):
+            response = llm.generate_content(comparison_prompt, generation_config=generation_config,
+                                            purpose="compare")
         return response.text
     except Exception as e:
         print(f"An error occurred during LLM comparison: {e}")
         return "There was an error while generating the comparison."
+
+def compare_documents_on_topic(driver, doc1_filename: str, doc2_filename: str, topic: str) -> str:
+    """Compares two documents on a topic. See compare_documents."""
+    return compare_documents(driver, [doc1_filename, doc2_filename], topic)
@@ -0,0 +1,176 @@
+# rag_pipeline/embedding_cache.py
+
+import fcntl
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Each cached text is identified by the SHA-1 digest of its UTF-8 bytes.
+KEY_SIZE = 20
+
+
+class EmbeddingCache:
+    """
+    A two-level cache of text embeddings for a single embedding model.
+
+    Level 1 is an in-process LRU of recently used vectors. Level 2 is an
+    append-only store on disk that every process pointing at the same
+    directory shares (the web server and the Django-Q worker):
+
+        keys.bin     - one 20-byte text digest per row
+        vectors.f32  - the matching float32 rows, memory-mapped for reads
+
+    Writers hold an exclusive file lock and write the vector row before its
+    key, so a key that is visible to a reader always has its vector on disk.
+    """
+
+    def __init__(self, model_name, dimensions, cache_dir=None, max_memory_items=20000):
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.max_memory_items = max_memory_items
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._index = {}
+        self._rows = 0
+        self._vectors = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self.directory = None
+        if cache_dir:
+            safe_name = model_name.replace("/", "__")
+            self.directory = os.path.join(cache_dir, f"{safe_name}-{dimensions}")
+            os.makedirs(self.directory, exist_ok=True)
+            self._keys_path = os.path.join(self.directory, "keys.bin")
+            self._vectors_path = os.path.join(self.directory, "vectors.f32")
+            for path in (self._keys_path, self._vectors_path):
+                open(path, "ab").close()
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    # --- Disk layer ---
+
+    def _refresh_index(self):
+        """Picks up rows appended by this or any other process since the last look."""
+        rows_on_disk = os.path.getsize(self._keys_path) // KEY_SIZE
+        if rows_on_disk <= self._rows:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._rows * KEY_SIZE)
+            data = f.read((rows_on_disk - self._rows) * KEY_SIZE)
+        for offset in range(0, len(data), KEY_SIZE):
+            self._index.setdefault(data[offset:offset + KEY_SIZE], self._rows + offset // KEY_SIZE)
+        self._rows = rows_on_disk
+        # The memory map only covers the rows that existed when it was opened
+        self._vectors = None
+
+    def _read_rows(self, rows):
+        if self._vectors is None:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                      shape=(self._rows, self.dimensions))
+        return np.array(self._vectors[rows], dtype=np.float32)
+
+    def _append(self, keys, vectors):
+        with open(self._keys_path, "r+b") as keys_file:
+            fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                new = [i for i, key in enumerate(keys) if key not in self._index]
+                if not new:
+                    return
+                # Rows are addressed by key position; anything past the last key is
+                # left over from an interrupted write and is safe to overwrite.
+                with open(self._vectors_path, "r+b") as vectors_file:
+                    vectors_file.seek(self._rows * self.dimensions * 4)
+                    vectors_file.write(np.ascontiguousarray(vectors[new], dtype=np.float32).tobytes())
+                    vectors_file.flush()
+                keys_file.seek(self._rows * KEY_SIZE)
+                keys_file.write(b"".join(keys[i] for i in new))
+                keys_file.flush()
+                self._refresh_index()
+            finally:
+                fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    # --- Memory layer ---
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    # --- Public API ---
+
+    def get_many(self, texts):
+        """Returns a list with the cached vector for each text, or None where missing."""
+        keys = [self.text_key(text) for text in texts]
+        found = [None] * len(texts)
+        with self._lock:
+            disk_lookups = []
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                else:
+                    disk_lookups.append(i)
+
+            if disk_lookups and self.directory:
+                self._refresh_index()
+                on_disk = [i for i in disk_lookups if keys[i] in self._index]
+                if on_disk:
+                    rows = self._read_rows([self._index[keys[i]] for i in on_disk])
+                    for i, vector in zip(on_disk, rows):
+                        found[i] = vector
+                        self._remember(keys[i], vector)
+        return found
+
+    def put_many(self, texts, vectors):
+        keys = [self.text_key(text) for text in texts]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            if self.directory:
+                self._append(keys, vectors)
+
+    def encode(self, texts, encoder):
+        """
+        Returns embeddings for texts, calling encoder only for the cache misses.
+
+        Args:
+            texts (list): Texts to embed.
+            encoder (callable): Takes a list of texts and returns their embeddings.
+                It is not called at all when every text is cached.
+
+        Returns:
+            numpy.ndarray: A (len(texts), dimensions) float32 array.
+        """
+        result = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        cached = self.get_many(texts)
+
+        missing = {}
+        for i, (text, vector) in enumerate(zip(texts, cached)):
+            if vector is None:
+                missing.setdefault(text, []).append(i)
+            else:
+                result[i] = vector
+
+        self.hits += len(texts) - sum(len(rows) for rows in missing.values())
+        self.misses += len(missing)
+
+        if missing:
+            missing_texts = list(missing)
+            new_vectors = np.asarray(encoder(missing_texts), dtype=np.float32)
+            self.put_many(missing_texts, new_vectors)
+            for text, vector in zip(missing_texts, new_vectors):
+                result[missing[text]] = vector
+
+        return result
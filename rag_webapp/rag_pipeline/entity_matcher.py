@@ -0,0 +1,206 @@
+# rag_pipeline/entity_matcher.py
+
+import re
+import threading
+import time
+from collections import deque
+
+
+def normalize_entity(text):
+    """Case-folds a name or question and collapses runs of whitespace."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class EntityMatcher:
+    """
+    An Aho-Corasick automaton over normalized entity names.
+
+    match() finds every known name that occurs in a text as whole words, in a
+    single pass over the text, no matter how many names are loaded.
+    """
+
+    def __init__(self):
+        # Trie: per state, a dict of char -> next state
+        self._goto = [{}]
+        # The normalized names that end at each state
+        self._terminal = [[]]
+        # Failure links and (failure-link merged) outputs, rebuilt lazily
+        self._fail = [0]
+        self._outputs = [[]]
+        self._dirty = False
+        # normalized name -> original spellings as stored in the graph
+        self.names = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def copy(self):
+        """Returns an independent copy, which can be added to while this one keeps serving matches."""
+        clone = EntityMatcher()
+        clone._goto = [dict(edges) for edges in self._goto]
+        clone._terminal = [list(terminal) for terminal in self._terminal]
+        clone._fail = list(self._fail)
+        clone._outputs = [list(outputs) for outputs in self._outputs]
+        clone._dirty = self._dirty
+        clone.names = {key: list(spellings) for key, spellings in self.names.items()}
+        return clone
+
+    def add(self, names):
+        """Adds entity names. The automaton is rebuilt on the next match()."""
+        for name in names:
+            key = normalize_entity(name)
+            if len(key) < 2:
+                continue
+            spellings = self.names.setdefault(key, [])
+            if name in spellings:
+                continue
+            spellings.append(name)
+            if len(spellings) > 1:
+                continue
+
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._terminal.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._terminal[state].append(key)
+            self._dirty = True
+
+    def _build(self):
+        """Computes failure links breadth-first, merging each state's outputs with its fallback's."""
+        self._fail = [0] * len(self._goto)
+        self._outputs = [list(terminal) for terminal in self._terminal]
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+                queue.append(next_state)
+        self._dirty = False
+
+    def match(self, text):
+        """Returns the original names of every entity that occurs in text as whole words."""
+        if self._dirty:
+            self._build()
+
+        text = normalize_entity(text)
+        found = []
+        seen = set()
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+
+            for key in self._outputs[state]:
+                start = end - len(key) + 1
+                if key in seen:
+                    continue
+                # Only accept whole-word matches ("ai" must not match inside "said")
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if end + 1 < len(text) and text[end + 1].isalnum():
+                    continue
+                seen.add(key)
+                found.extend(self.names[key])
+        return found
+
+
+class EntityDictionary:
+    """
+    The in-process dictionary of every Entity name in Neo4j.
+
+    The first use loads all names; after that, refresh() only fetches
+    entities created since the newest one already loaded. Lookups refresh
+    automatically once the dictionary is older than refresh_seconds, so
+    entities added by an ingestion in another process show up shortly after.
+
+    A refresh queries Neo4j and builds the new automaton on a copy without
+    holding the lookup lock; lookups keep using the current automaton and
+    only wait for the swap. A published automaton is never changed again.
+    """
+
+    # Entities are stamped with the database clock when they are created. A
+    # transaction that commits late can carry an older stamp than entities
+    # already loaded, so every refresh looks back this far.
+    OVERLAP_MS = 60_000
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self.matcher = EntityMatcher()
+        # Guards the matcher swap and the refresh bookkeeping, never a query
+        self._lock = threading.Lock()
+        # Serializes refreshes, so two of them cannot build on the same base
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._newest_created_at = 0
+        self._refreshed_at = 0.0
+
+    def refresh(self, driver, blocking=True):
+        """
+        Loads all entity names on first use, then only the ones created since.
+
+        Args:
+            driver: The Neo4j driver.
+            blocking: Whether to wait for a refresh already under way in
+                another thread. If False, that refresh is left to finish
+                and nothing is fetched.
+
+        Returns:
+            int: The number of entity records fetched.
+        """
+        if not self._refresh_lock.acquire(blocking):
+            return 0
+        try:
+            with self._lock:
+                loaded, since = self._loaded, self._newest_created_at - self.OVERLAP_MS
+                matcher = self.matcher
+
+            if not loaded:
+                query = "MATCH (e:Entity) RETURN e.name AS name, e.created_at AS created_at"
+                params = {}
+            else:
+                query = """
+                MATCH (e:Entity) WHERE e.created_at >= $since
+                RETURN e.name AS name, e.created_at AS created_at
+                """
+                params = {"since": since}
+
+            with driver.session(database="neo4j") as session:
+                records = [(record["name"], record["created_at"]) for record in session.run(query, **params)]
+
+            names = [name for name, _ in records if name]
+            if names:
+                matcher = matcher.copy()
+                matcher.add(names)
+                if matcher._dirty:
+                    matcher._build()
+            stamps = [created_at for _, created_at in records if created_at]
+
+            with self._lock:
+                self.matcher = matcher
+                if stamps:
+                    self._newest_created_at = max(self._newest_created_at, max(stamps))
+                self._loaded = True
+                self._refreshed_at = time.monotonic()
+            return len(records)
+        finally:
+            self._refresh_lock.release()
+
+    def match(self, driver, question):
+        """Returns the names of the known entities mentioned in question."""
+        if not self._loaded or time.monotonic() - self._refreshed_at > self.refresh_seconds:
+            # Once loaded, a stale dictionary still answers while another thread refreshes it
+            self.refresh(driver, blocking=not self._loaded)
+        with self._lock:
+            matcher = self.matcher
+        return matcher.match(question)
@@ -0,0 +1,283 @@
+# rag_pipeline/extractors.py
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import get_llm_model
+
+# --- Batched entity extraction settings (Gemini backend) ---
+# How many chunks are packed into a single LLM prompt, how many of those
+# prompts may be in flight at once, and how many times chunks whose output
+# could not be parsed are retried (each retry halves the batch size).
+ENTITY_BATCH_SIZE = int(os.getenv("ENTITY_BATCH_SIZE", "8"))
+ENTITY_MAX_WORKERS = int(os.getenv("ENTITY_MAX_WORKERS", "4"))
+ENTITY_MAX_RETRIES = int(os.getenv("ENTITY_MAX_RETRIES", "2"))
+
+
+class EntityExtractionError(RuntimeError):
+    """Raised when the LLM keeps failing for some chunks, so their entities are unknown."""
+
+
+class EntityExtractor:
+    """
+    Base class for entity extractors.
+
+    Subclasses implement extract_batch(); extract() is a convenience wrapper
+    for a single text (e.g. a user's question).
+    """
+
+    name = "base"
+
+    def extract(self, text: str) -> list:
+        return self.extract_batch([text])[0]
+
+    def extract_batch(self, texts: list) -> list:
+        """Returns one list of entity strings per input text, in the same order."""
+        raise NotImplementedError
+
+
+def _parse_json_response(response_text):
+    """Strips markdown code fences from an LLM response and parses it as JSON."""
+    json_text = response_text.strip().replace("```json", "").replace("```", "")
+    return json.loads(json_text)
+
+
+class GeminiEntityExtractor(EntityExtractor):
+    """Extracts entities with the Gemini LLM."""
+
+    name = "gemini"
+
+    def __init__(self, batch_size=None, max_workers=None, max_retries=None):
+        self.batch_size = max(1, batch_size or ENTITY_BATCH_SIZE)
+        self.max_workers = max(1, max_workers or ENTITY_MAX_WORKERS)
+        self.max_retries = ENTITY_MAX_RETRIES if max_retries is None else max_retries
+
+    def extract(self, text: str) -> list:
+        """Uses the LLM to extract key entities from a text chunk."""
+        from google.generativeai.types import GenerationConfig
+
+        model = get_llm_model() # Your lazy-loader for Gemini
+
+        generation_config = GenerationConfig(
+                max_output_tokens=4096,
+                temperature=0.0
+                )
+
+        prompt = (
+            "You are a helpful AI assistant for knowledge graph construction.\n"
+            "From the following text, extract the key entities (people, organizations, locations, technical concepts, projects).\n"
+            "Return the result as a JSON list of strings. Example: [\"NASA\", \"Aerojet Rocketdyne\", \"bipropellant valve\"]\n\n"
+            f"--- TEXT ---\n{text}\n\n"
+            "--- ENTITIES (JSON List) ---\n"
+        )
+
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config,
+                                              purpose="entity_extraction")
+            # Clean up the response to get a valid JSON list
+            entities = _parse_json_response(response.text)
+            return entities
+        except (ValueError, json.JSONDecodeError) as e:
+            print(f"Could not parse entities from LLM response: {e}")
+            return []
+
+    def _extract_group(self, group):
+        """
+        Extracts entities for several chunks with a single LLM call.
+
+        Args:
+            group (list): (chunk_id, text) tuples.
+
+        Returns:
+            tuple: (results, error). results maps chunk_id -> list of entities,
+            only for the chunks whose output could be parsed; missing ids are
+            left for the caller to retry. error is the exception if the LLM
+            call itself failed (after the client's own retries), else None.
+        """
+        from google.generativeai.types import GenerationConfig
+
+        model = get_llm_model()
+
+        generation_config = GenerationConfig(
+                max_output_tokens=8192,
+                temperature=0.0,
+                response_mime_type="application/json"
+                )
+
+        chunk_blocks = "\n\n".join(
+            f"--- CHUNK {chunk_id} ---\n{text}" for chunk_id, text in group
+        )
+        prompt = (
+            "You are a helpful AI assistant for knowledge graph construction.\n"
+            "For each of the following text chunks, extract the key entities (people, organizations, locations, technical concepts, projects).\n"
+            "Return a single JSON object that maps every chunk id to a JSON list of strings.\n"
+            "Example: {\"0\": [\"NASA\", \"Aerojet Rocketdyne\"], \"1\": [\"bipropellant valve\"]}\n\n"
+            f"{chunk_blocks}\n\n"
+            "--- ENTITIES (JSON Object) ---\n"
+        )
+
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config,
+                                              purpose="entity_extraction")
+        except Exception as e:
+            # Counted as a failed call by the LLM client; only this group's chunks are affected
+            print(f"Entity extraction call failed for {len(group)} chunk(s): {type(e).__name__}: {e}")
+            return {}, e
+        try:
+            parsed = _parse_json_response(response.text)
+        except (ValueError, json.JSONDecodeError) as e:
+            print(f"Could not parse batched entities from LLM response: {e}")
+            return {}, None
+
+        if not isinstance(parsed, dict):
+            return {}, None
+
+        results = {}
+        for chunk_id, _ in group:
+            entities = parsed.get(str(chunk_id))
+            if isinstance(entities, list):
+                results[chunk_id] = [e.strip() for e in entities if isinstance(e, str) and e.strip()]
+        return results, None
+
+    def extract_batch(self, texts: list) -> list:
+        """
+        Extracts entities for many chunks at once.
+
+        Chunks are packed several to a prompt and the prompts are sent on a
+        bounded thread pool. Only the chunks whose call failed or whose output
+        failed to parse are retried, in progressively smaller batches.
+
+        Chunks whose output still cannot be parsed get no entities. If the
+        LLM call itself still fails for some chunks (e.g. the quota stays
+        exhausted), EntityExtractionError is raised rather than storing
+        them without entities.
+        """
+        batch_size = self.batch_size
+        results = {}
+        pending = list(enumerate(texts))
+        failed = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for attempt in range(self.max_retries + 1):
+                if not pending:
+                    break
+                groups = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+                failed = {}
+                for group, (parsed, error) in zip(groups, pool.map(self._extract_group, groups)):
+                    results.update(parsed)
+                    if error is not None:
+                        failed.update((chunk_id, error) for chunk_id, _ in group)
+
+                pending = [(chunk_id, text) for chunk_id, text in pending if chunk_id not in results]
+                batch_size = max(1, batch_size // 2)
+
+        call_failures = [failed[chunk_id] for chunk_id, _ in pending if chunk_id in failed]
+        if call_failures:
+            error = call_failures[-1]
+            raise EntityExtractionError(
+                f"Entity extraction failed for {len(call_failures)} chunk(s) after {self.max_retries} retries: "
+                f"{type(error).__name__}: {error}"
+            ) from error
+        if pending:
+            print(f"Could not extract entities for {len(pending)} chunk(s) after {self.max_retries} retries.")
+
+        return [results.get(chunk_id, []) for chunk_id in range(len(texts))]
+
+
+# --- Local heuristic extractor ---
+
+# Words that start sentences or headings in title case but are not entities.
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his how i if in into is it its
+more most no not of on or our she so such than that the their them then there these
+they this those to was we were what when where which while who why will with you your
+also however although after before during figure table page chapter section see
+""".split())
+
+# Lowercase words allowed inside a capitalized span, e.g. "Bank of America".
+_CONNECTORS = frozenset(["of", "for", "de", "la", "du", "von", "van", "&"])
+
+# Abbreviations whose full stop does not end a sentence, e.g. "the U.S. Army".
+_ABBREVIATIONS = frozenset(["u.s", "u.k", "u.n", "inc", "corp", "ltd", "co", "dr", "mr", "mrs", "ms", "st", "vs"])
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9&.\-/']*")
+_ACRONYM_RE = re.compile(r"^[A-Z][A-Z0-9&\-]{1,}s?$")
+_CODE_RE = re.compile(r"^(?=.*\d)(?=.*[A-Za-z])[A-Za-z0-9][A-Za-z0-9.\-/]*$")
+
+
+def _is_capitalized(token):
+    return token[0].isupper() and token.lower() not in STOPWORDS
+
+
+class LocalEntityExtractor(EntityExtractor):
+    """
+    Extracts entities with fast, offline heuristics. No LLM calls are made.
+
+    Picks up:
+      - capitalized spans ("European Commission", "Bank of America")
+      - acronyms ("NASA", "EU", "LLMs")
+      - alphanumeric codes and part numbers ("ISO-9001", "XR-7", "H100")
+    """
+
+    name = "local"
+
+    def __init__(self, max_span_words=6):
+        self.max_span_words = max_span_words
+
+    def extract(self, text: str) -> list:
+        entities = []
+        seen = set()
+
+        def add(entity):
+            key = entity.lower()
+            if len(entity) > 1 and key not in STOPWORDS and key not in seen:
+                seen.add(key)
+                entities.append(entity)
+
+        def flush(span, at_sentence_start):
+            # Drop trailing connectors ("Bank of" -> "Bank")
+            while span and span[-1].lower() in _CONNECTORS:
+                span.pop()
+            # A lone capitalized word opening a sentence is usually not a name
+            if len(span) > 1 or (span and not at_sentence_start):
+                add(" ".join(span[:self.max_span_words]))
+
+        for line in text.splitlines():
+            span = []
+            span_at_start = sentence_start = True
+            for token in _TOKEN_RE.findall(line):
+                bare = token.rstrip(".")
+                if not bare:
+                    continue
+
+                if _is_capitalized(bare) or (span and bare.lower() in _CONNECTORS):
+                    if not span:
+                        span_at_start = sentence_start
+                    span.append(bare)
+                else:
+                    flush(span, span_at_start)
+                    span = []
+
+                if _ACRONYM_RE.match(bare) or _CODE_RE.match(bare):
+                    add(bare)
+
+                # A full stop always ends the current span, and the next word
+                # opens a sentence unless the stop belongs to a known abbreviation.
+                if token.endswith("."):
+                    flush(span, span_at_start)
+                    span = []
+                sentence_start = token.endswith(".") and bare.lower() not in _ABBREVIATIONS
+            flush(span, span_at_start)
+
+        return entities
+
+    def extract_batch(self, texts: list) -> list:
+        return [self.extract(text) for text in texts]
+
+
+ENTITY_EXTRACTORS = {
+    GeminiEntityExtractor.name: GeminiEntityExtractor,
+    LocalEntityExtractor.name: LocalEntityExtractor,
+}
@@ -0,0 +1,235 @@
+# rag_pipeline/llm_client.py
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from .metrics import LLM_COALESCED, LLM_RATE_LIMIT_WAIT_SECONDS, LLM_RETRIES, record_llm_call
+
+# Errors worth retrying: quota exhaustion and transient server-side failures.
+# Matched by class name and HTTP status so google.api_core is not imported here.
+RETRYABLE_ERRORS = frozenset([
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+])
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+def is_retryable(error):
+    return (
+        type(error).__name__ in RETRYABLE_ERRORS
+        or getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+        or isinstance(error, (ConnectionError, TimeoutError))
+    )
+
+
+def estimate_tokens(prompt):
+    # Roughly four characters per token on English text
+    return max(1, len(prompt) // 4)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at rate_per_minute, holding at most capacity tokens.
+
+    Callers reserve tokens up front: if the bucket runs short its balance goes
+    negative and each caller waits for its own share to refill, so waiting
+    callers are served in the order they arrived.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Takes amount tokens and returns how many seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A request larger than the bucket would never fit; let it through once the bucket is full
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, amount=1):
+        wait = self.reserve(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, amount=1):
+        wait = self.reserve(amount)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class _RecordedStream:
+    """A streamed response that counts its call, and the tokens it used, once it has been consumed."""
+
+    def __init__(self, response, purpose):
+        self.response = response
+        self.purpose = purpose
+
+    def __getattr__(self, name):
+        if name == "response":
+            raise AttributeError(name)
+        return getattr(self.response, name)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        error = None
+        try:
+            async for chunk in self.response:
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Usage is only reported once the stream is done
+            record_llm_call(self.purpose, None if error else self.response, error)
+
+
+class LLMClient:
+    """
+    Wraps a generative model (Gemini or the stub) with rate limiting, retries and request coalescing.
+
+    Exposes the generate_content / generate_content_async calls of the model
+    it wraps, so call sites do not change:
+
+      - Every call first takes one request and its estimated prompt tokens
+        from per-minute token buckets, so a process stays under the quota
+        instead of running into it. 0 disables a limit.
+      - Quota errors and transient server errors are retried with full-jitter
+        exponential backoff; other errors, or running out of retries, raise.
+      - Identical prompts (with the same generation config) that are already
+        in flight are not sent again: later callers wait for the first call
+        and get its response. Streamed calls are never coalesced.
+      - Each call actually sent to the provider is counted once, with its
+        tokens, under the purpose label the caller passes (see
+        metrics.record_llm_call); coalesced callers are counted in
+        rag_llm_coalesced_total instead.
+
+    The limits apply per process; size them to the quota divided by the
+    number of processes calling the LLM.
+    """
+
+    def __init__(self, model, requests_per_minute=0, tokens_per_minute=0,
+                 max_retries=4, retry_base_seconds=1.0, retry_max_seconds=30.0):
+        self.model = model
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Anything else (model_name, count_tokens, ...) is the wrapped model's
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    # --- Rate limiting and retries ---
+
+    def _reservations(self, prompt):
+        reservations = []
+        if self.request_bucket:
+            reservations.append((self.request_bucket, 1))
+        if self.token_bucket:
+            reservations.append((self.token_bucket, estimate_tokens(str(prompt))))
+        return reservations
+
+    def _backoff(self, attempt, error):
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+        LLM_RETRIES.labels(error=type(error).__name__).inc()
+        print(f"--- [LLM] {type(error).__name__}: {error}; retry {attempt + 1}/{self.max_retries} in {delay:.1f} s ---")
+        return delay
+
+    def _call(self, prompt, generation_config, kwargs):
+        for attempt in range(self.max_retries + 1):
+            for bucket, amount in self._reservations(prompt):
+                LLM_RATE_LIMIT_WAIT_SECONDS.inc(bucket.acquire(amount))
+            try:
+                return self.model.generate_content(prompt, generation_config=generation_config, **kwargs)
+            except Exception as e:
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def _call_async(self, prompt, generation_config, kwargs):
+        for attempt in range(self.max_retries + 1):
+            for bucket, amount in self._reservations(prompt):
+                LLM_RATE_LIMIT_WAIT_SECONDS.inc(await bucket.acquire_async(amount))
+            try:
+                return await self.model.generate_content_async(prompt, generation_config=generation_config, **kwargs)
+            except Exception as e:
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    # --- Model API ---
+
+    def _recorded_call(self, purpose, prompt, generation_config, kwargs):
+        try:
+            response = self._call(prompt, generation_config, kwargs)
+        except Exception as e:
+            record_llm_call(purpose, error=e)
+            raise
+        record_llm_call(purpose, response)
+        return response
+
+    def generate_content(self, prompt, generation_config=None, purpose="other", **kwargs):
+        if kwargs.get("stream"):
+            return self._recorded_call(purpose, prompt, generation_config, kwargs)
+
+        key = hashlib.sha1(repr((prompt, generation_config, sorted(kwargs.items()))).encode("utf-8")).digest()
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            LLM_COALESCED.inc()
+            return future.result()
+
+        try:
+            response = self._recorded_call(purpose, prompt, generation_config, kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    async def generate_content_async(self, prompt, generation_config=None, purpose="other", **kwargs):
+        """
+        The async call, e.g. for streaming. Rate limited and retried like
+        generate_content; a stream is only retried until it is opened, not
+        once chunks have started to arrive.
+        """
+        try:
+            response = await self._call_async(prompt, generation_config, kwargs)
+        except Exception as e:
+            record_llm_call(purpose, error=e)
+            raise
+        if kwargs.get("stream"):
+            return _RecordedStream(response, purpose)
+        record_llm_call(purpose, response)
+        return response
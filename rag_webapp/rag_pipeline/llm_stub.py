@@ -0,0 +1,124 @@
+# rag_pipeline/llm_stub.py
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# "--- CHUNK 3 ---" blocks of a batched entity-extraction prompt
+_CHUNK_BLOCK_RE = re.compile(r"^--- CHUNK (\S+) ---\n(.*?)(?=\n\n--- )", re.S | re.M)
+_TEXT_BLOCK_RE = re.compile(r"--- TEXT ---\n(.*?)\n\n--- ENTITIES", re.S)
+
+
+class StubQuotaError(Exception):
+    """A simulated quota error (HTTP 429), retried by LLMClient like the real one."""
+
+    code = 429
+
+
+class StubResponse:
+    """The parts of a Gemini response the pipeline reads: text and usage_metadata."""
+
+    def __init__(self, text, prompt):
+        self.text = text
+        # Roughly four characters per token, like the Gemini tokenizer on English text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(text) // 4,
+        )
+
+
+class _StubStream:
+    """Async iterator over the pieces of a streamed stub answer."""
+
+    def __init__(self, model, text, prompt):
+        self.model = model
+        self.pieces = model._split(text)
+        self.usage_metadata = StubResponse(text, prompt).usage_metadata
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for piece in self.pieces:
+            await asyncio.sleep(self.model._generation_seconds(piece))
+            yield SimpleNamespace(text=piece)
+
+
+class StubGenerativeModel:
+    """
+    A deterministic, offline stand-in for the Gemini GenerativeModel.
+
+    Answers entity-extraction prompts with the local heuristic extractor (in
+    the JSON shape the prompt asks for) and any other prompt with words drawn
+    from the prompt itself, seeded by its hash, so the same prompt always gets
+    the same answer. Latency is simulated: latency_ms before the first token,
+    then tokens_per_second (0 for no generation delay). A fraction
+    error_rate of the calls fail with StubQuotaError, from a fixed seed.
+
+    Used for benchmarks and load tests (LLM_PROVIDER=stub); no API key or
+    network access is needed.
+    """
+
+    def __init__(self, latency_ms=0, tokens_per_second=0, answer_words=120, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.answer_words = answer_words
+        self.error_rate = error_rate
+        self._errors = random.Random(0)
+        self._errors_lock = threading.Lock()
+
+    def _maybe_fail(self):
+        if self.error_rate:
+            with self._errors_lock:
+                fail = self._errors.random() < self.error_rate
+            if fail:
+                raise StubQuotaError("Simulated quota exhausted (429)")
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self._maybe_fail()
+        text = self._respond(prompt)
+        time.sleep(self.latency_ms / 1000 + self._generation_seconds(text))
+        return StubResponse(text, prompt)
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self._maybe_fail()
+        text = self._respond(prompt)
+        await asyncio.sleep(self.latency_ms / 1000)
+        if stream:
+            return _StubStream(self, text, prompt)
+        await asyncio.sleep(self._generation_seconds(text))
+        return StubResponse(text, prompt)
+
+    def _generation_seconds(self, text):
+        if not self.tokens_per_second:
+            return 0.0
+        return (len(text) / 4) / self.tokens_per_second
+
+    @staticmethod
+    def _split(text, words_per_piece=8):
+        words = text.split(" ")
+        return [" ".join(words[i:i + words_per_piece]) + (" " if i + words_per_piece < len(words) else "")
+                for i in range(0, len(words), words_per_piece)]
+
+    def _respond(self, prompt):
+        if "--- ENTITIES (JSON Object) ---" in prompt:
+            from .extractors import LocalEntityExtractor
+
+            extractor = LocalEntityExtractor()
+            return json.dumps({chunk_id: extractor.extract(text)
+                               for chunk_id, text in _CHUNK_BLOCK_RE.findall(prompt)})
+        if "--- ENTITIES (JSON List) ---" in prompt:
+            from .extractors import LocalEntityExtractor
+
+            match = _TEXT_BLOCK_RE.search(prompt)
+            return json.dumps(LocalEntityExtractor().extract(match.group(1) if match else ""))
+
+        words = prompt.split()
+        seed = int.from_bytes(hashlib.sha1(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        return " ".join(rng.choice(words) for _ in range(self.answer_words)) if words else ""
@@ -0,0 +1,152 @@
+# rag_pipeline/metrics.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST  # noqa: F401  (re-exported for the views)
+
+# With PROMETHEUS_MULTIPROC_DIR set, every process (gunicorn workers,
+# Django-Q workers) writes its samples to files there and /metrics adds them
+# up. The directory must exist and be emptied when the server starts.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Covers a cached lookup (~1 ms) up to a slow LLM call (~1 min)
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Latency of each stage of answering a question.",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "rag_ingest_stage_seconds",
+    "Busy time of each ingestion stage, per window of pages.",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_CALLS = Counter(
+    "rag_llm_calls_total",
+    "Gemini calls made by the pipeline.",
+    ["purpose", "status"],
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "Gemini tokens used, as reported by the API.",
+    ["purpose", "direction"],
+)
+LLM_RETRIES = Counter(
+    "rag_llm_retries_total",
+    "Gemini calls retried after a quota or transient error.",
+    ["error"],
+)
+LLM_COALESCED = Counter(
+    "rag_llm_coalesced_total",
+    "Gemini calls answered by an identical call that was already in flight.",
+)
+LLM_RATE_LIMIT_WAIT_SECONDS = Counter(
+    "rag_llm_rate_limit_wait_seconds_total",
+    "Time spent waiting for the LLM rate limiter.",
+)
+CACHE_LOOKUPS = Counter(
+    "rag_cache_lookups_total",
+    "Lookups in the pipeline's caches.",
+    ["cache", "result"],
+)
+RERANK_CANDIDATES = Counter(
+    "rag_rerank_candidates_total",
+    "Candidate chunks passed to the reranker, by whether the CrossEncoder scored them.",
+    ["scored_by"],
+)
+
+# Open collect_stage_samples() blocks; each gets every stage observation as well
+_sample_collectors = []
+_sample_collectors_lock = threading.Lock()
+
+
+def observe_stage(histogram, stage, seconds):
+    """Observes a stage's duration in a histogram, and in any open collect_stage_samples() block."""
+    histogram.labels(stage=stage).observe(seconds)
+    for collector in list(_sample_collectors):
+        collector(histogram, stage, seconds)
+
+
+@contextmanager
+def time_stage(histogram, stage):
+    """Observes the duration of a with block in a histogram, under the given stage label."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(histogram, stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_stage_samples(histogram):
+    """
+    Keeps the raw durations observed in a histogram during a with block.
+
+    Histograms only keep bucket counts; benchmarks use this to compute exact
+    percentiles.
+
+    Yields:
+        dict: stage -> list of seconds, filled in as stages are observed.
+    """
+    samples = {}
+
+    def collect(observed_histogram, stage, seconds):
+        if observed_histogram is histogram:
+            samples.setdefault(stage, []).append(seconds)
+
+    with _sample_collectors_lock:
+        _sample_collectors.append(collect)
+    try:
+        yield samples
+    finally:
+        with _sample_collectors_lock:
+            _sample_collectors.remove(collect)
+
+
+def record_cache_lookups(cache, hits, misses):
+    if hits:
+        CACHE_LOOKUPS.labels(cache=cache, result="hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache=cache, result="miss").inc(misses)
+
+
+def record_llm_call(purpose, response=None, error=None):
+    """Counts one Gemini call, and its tokens if the response reports usage."""
+    LLM_CALLS.labels(purpose=purpose, status="error" if error else "ok").inc()
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        LLM_TOKENS.labels(purpose=purpose, direction="prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+        LLM_TOKENS.labels(purpose=purpose, direction="completion").inc(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def render_metrics():
+    """Returns the metrics in the Prometheus text format, summed over all processes in multiprocess mode."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def start_metrics_server(port):
+    """Serves /metrics on its own port from a background thread, e.g. in the qcluster process."""
+    from prometheus_client import start_http_server
+
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+    print(f"--- [Metrics] Serving Prometheus metrics on port {port} ---")
@@ -0,0 +1,91 @@
+# rag_pipeline/pipeline.py
+
+import queue
+import threading
+
+# Marks the end of a stage's output
+_DONE = object()
+
+# How long a blocked stage waits before checking whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+def run_pipeline(source, stages, buffer_size=2):
+    """
+    Runs a chain of stages concurrently, connected by bounded queues.
+
+    The source and every stage get their own thread, so a slow stage (an LLM
+    call, a database write) overlaps with the work of the others. Each queue
+    holds at most buffer_size items, so a fast stage blocks instead of
+    piling results up in memory.
+
+    Args:
+        source (iterable): Produces the pipeline's input items.
+        stages (list): (name, function) pairs. Each function takes an iterator
+            of input items and yields output items, so a stage can drop,
+            split or regroup items as it likes.
+        buffer_size (int): Capacity of each queue between stages.
+
+    Yields:
+        The items produced by the last stage.
+
+    Raises:
+        The first exception raised by the source or any stage. The remaining
+        stages are stopped.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=buffer_size) for _ in range(len(stages) + 1)]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def drain(q):
+        while True:
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def run(name, items, out):
+        try:
+            for item in items:
+                if not put(out, item):
+                    break
+        except BaseException as e:
+            errors.append((name, e))
+            stop.set()
+        finally:
+            put(out, _DONE)
+
+    threads = [threading.Thread(target=run, args=("source", iter(source), queues[0]), daemon=True)]
+    for i, (name, function) in enumerate(stages):
+        threads.append(threading.Thread(
+            target=lambda name=name, function=function, i=i: run(name, function(drain(queues[i])), queues[i + 1]),
+            daemon=True
+        ))
+
+    for thread in threads:
+        thread.start()
+    try:
+        yield from drain(queues[-1])
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        name, error = errors[0]
+        print(f"--- Pipeline stage '{name}' failed: {error} ---")
+        raise error
@@ -0,0 +1,131 @@
+# rag_pipeline/retrieval_cache.py
+
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_question(question):
+    """Lower-cases a question, collapses whitespace and drops trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().casefold().rstrip("?!. ")
+
+
+class RetrievalCache:
+    """
+    Caches reranked candidate chunks per (normalized question, filename, retrieval params).
+
+    Entries are evicted least-recently-used once max_items is reached, and
+    expire after ttl_seconds. Each document also has a stamp file on disk;
+    invalidate_document() rewrites it, and any entry stored under an older
+    stamp is dropped on its next lookup. Because the stamp lives on the
+    filesystem, an ingestion finishing in the Django-Q worker invalidates the
+    entries cached by the web processes too.
+
+    Callers read document_stamp() before retrieving and pass it to put(), so
+    a result computed while the document was being rewritten is not stored.
+    """
+
+    def __init__(self, max_items=512, ttl_seconds=3600, stamp_dir=None):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.stamp_dir = stamp_dir
+        if stamp_dir:
+            os.makedirs(stamp_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._local_stamps = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp_path(self, filename):
+        return os.path.join(self.stamp_dir, hashlib.sha1(filename.encode("utf-8")).hexdigest())
+
+    def document_stamp(self, filename):
+        """Returns the document's current stamp; it changes whenever the document is invalidated."""
+        if not self.stamp_dir:
+            return self._local_stamps.get(filename, 0)
+        try:
+            return os.stat(self._stamp_path(filename)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _key(question, filename, params):
+        return (normalize_question(question), filename, tuple(sorted(params.items())))
+
+    def get(self, question, filename, params):
+        """Returns a copy of the cached candidate list, or None."""
+        key = self._key(question, filename, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, stamp, chunks = entry
+                if expires_at > time.monotonic() and stamp == self.document_stamp(filename):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(chunks)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, question, filename, params, chunks, stamp):
+        """
+        Stores a result computed from the document as it was at stamp (read
+        with document_stamp() before retrieval started). Nothing is stored if
+        the document was invalidated since.
+        """
+        key = self._key(question, filename, params)
+        with self._lock:
+            if stamp != self.document_stamp(filename):
+                return
+            self._entries[key] = (
+                time.monotonic() + self.ttl_seconds,
+                stamp,
+                copy.deepcopy(chunks),
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate_document(self, filename):
+        """Drops every cached result for a document, in this and every other process."""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == filename]:
+                del self._entries[key]
+            if self.stamp_dir:
+                with open(self._stamp_path(filename), "w") as f:
+                    f.write(filename)
+                # Make sure the stamp changes even within the filesystem's timestamp resolution
+                stamp = time.time_ns()
+                os.utime(self._stamp_path(filename), ns=(stamp, stamp))
+            else:
+                self._local_stamps[filename] = time.time_ns()
+
+
+class ScoreCache:
+    """A small thread-safe LRU of scores, e.g. reranker scores per (question, chunk)."""
+
+    def __init__(self, max_items=50000):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def put(self, key, score):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_items:
+                self._scores.popitem(last=False)
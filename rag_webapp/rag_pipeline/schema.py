@@ -0,0 +1,109 @@
+# rag_pipeline/schema.py
+
+import threading
+
+from .utils import EMBEDDING_DIMENSIONS
+
+# --- Versioned Neo4j schema ---
+# Each migration is (version, description, statements). Statements must be
+# idempotent (IF NOT EXISTS) so two processes starting at once are harmless.
+# Append new migrations at the end; never edit one that has shipped.
+SCHEMA_MIGRATIONS = [
+    (1, "Vector index on chunk embeddings", [
+        f"""
+        CREATE VECTOR INDEX `chunk_embeddings` IF NOT EXISTS
+        FOR (c:Chunk) ON (c.embedding)
+        OPTIONS {{ indexConfig: {{
+            `vector.dimensions`: {EMBEDDING_DIMENSIONS},
+            `vector.similarity_function`: 'cosine'
+        }}}}
+        """,
+    ]),
+    (2, "Uniqueness constraints and lookup indexes", [
+        "CREATE CONSTRAINT entity_name_unique IF NOT EXISTS FOR (e:Entity) REQUIRE e.name IS UNIQUE",
+        "CREATE CONSTRAINT document_filename_unique IF NOT EXISTS FOR (d:Document) REQUIRE d.filename IS UNIQUE",
+        "CREATE CONSTRAINT chunk_id_unique IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE",
+        "CREATE INDEX chunk_source IF NOT EXISTS FOR (c:Chunk) ON (c.source)",
+        "CREATE INDEX document_content_hash IF NOT EXISTS FOR (d:Document) ON (d.content_hash)",
+    ]),
+    (3, "Index on entity creation time for incremental dictionary refresh", [
+        "CREATE INDEX entity_created_at IF NOT EXISTS FOR (e:Entity) ON (e.created_at)",
+    ]),
+    (4, "Full-text index on chunk text for keyword retrieval", [
+        # source is indexed too, so a search can be restricted to one document inside Lucene
+        "CREATE FULLTEXT INDEX chunk_text IF NOT EXISTS FOR (c:Chunk) ON EACH [c.text, c.source]",
+    ]),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+# Every schema object the code relies on, by name, for check_schema()
+EXPECTED_INDEXES = ["chunk_embeddings", "chunk_source", "document_content_hash", "entity_created_at",
+                    "chunk_text"]
+EXPECTED_CONSTRAINTS = ["entity_name_unique", "document_filename_unique", "chunk_id_unique"]
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def get_schema_version(driver):
+    """Returns the schema version recorded in the database (0 if none)."""
+    query = "MATCH (v:SchemaVersion {id: 'schema'}) RETURN v.version AS version"
+    with driver.session(database="neo4j") as session:
+        record = session.run(query).single()
+        return record["version"] if record else 0
+
+
+def apply_schema(driver):
+    """
+    Applies every migration newer than the recorded schema version.
+
+    Returns:
+        list: The (version, description) of each migration that was applied.
+    """
+    current = get_schema_version(driver)
+    applied = []
+    with driver.session(database="neo4j") as session:
+        for version, description, statements in SCHEMA_MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                session.run(statement)
+            session.run(
+                "MERGE (v:SchemaVersion {id: 'schema'}) SET v.version = $version, v.applied_at = datetime()",
+                version=version
+            )
+            print(f"--- [Schema] Applied migration {version}: {description} ---")
+            applied.append((version, description))
+    return applied
+
+
+def check_schema(driver):
+    """
+    Compares the database against the schema the code expects.
+
+    Returns:
+        dict: The recorded and expected versions plus the names of any
+        missing indexes and constraints.
+    """
+    with driver.session(database="neo4j") as session:
+        indexes = {record["name"] for record in session.run("SHOW INDEXES YIELD name")}
+        constraints = {record["name"] for record in session.run("SHOW CONSTRAINTS YIELD name")}
+
+    return {
+        "version": get_schema_version(driver),
+        "expected_version": SCHEMA_VERSION,
+        "missing_indexes": [name for name in EXPECTED_INDEXES if name not in indexes],
+        "missing_constraints": [name for name in EXPECTED_CONSTRAINTS if name not in constraints],
+    }
+
+
+def ensure_schema(driver):
+    """Applies pending migrations once per process; later calls return immediately."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            apply_schema(driver)
+            _schema_ready = True
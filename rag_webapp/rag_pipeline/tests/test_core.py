@@ -0,0 +1,90 @@
+from unittest import TestCase, mock
+
+from rag_pipeline import core
+from rag_pipeline.core import fuse_ranked_lists, fused_scores_separate, rerank_chunks
+from rag_pipeline.metrics import QUERY_STAGE_SECONDS, collect_stage_samples
+from rag_pipeline.retrieval_cache import ScoreCache
+
+
+def chunk(chunk_id, score=0.0, text=None):
+    return {"chunk_id": chunk_id, "text": text or f"text of {chunk_id}", "score": score}
+
+
+class FuseRankedListsTests(TestCase):
+    equal_weights = {"vector": 1.0, "graph": 1.0, "lexical": 1.0}
+    branches = {
+        "vector": [chunk("a", 0.9), chunk("b", 0.8), chunk("c", 0.1)],
+        "graph": [chunk("b", 5.0), chunk("d", 1.0)],
+    }
+
+    def test_rrf_rewards_chunks_found_by_several_branches(self):
+        fused = fuse_ranked_lists(self.branches, limit=10, method="rrf", rrf_k=60, weights=self.equal_weights)
+
+        self.assertEqual([c["chunk_id"] for c in fused], ["b", "a", "d", "c"])
+        self.assertAlmostEqual(fused[0]["fusion_score"], 1 / 62 + 1 / 61)
+        self.assertEqual((fused[0]["vector_rank"], fused[0]["graph_rank"]), (2, 1))
+        self.assertEqual((fused[0]["vector_score"], fused[0]["graph_score"]), (0.8, 5.0))
+        self.assertNotIn("graph_rank", fused[1])
+        self.assertNotIn("score", fused[0])
+
+    def test_weighted_sums_normalized_scores(self):
+        fused = fuse_ranked_lists(self.branches, limit=10, method="weighted", weights={"vector": 1.0, "graph": 0.5})
+        scores = {c["chunk_id"]: c["fusion_score"] for c in fused}
+
+        self.assertAlmostEqual(scores["a"], 1.0)
+        self.assertAlmostEqual(scores["b"], 0.7 / 0.8 + 0.5)
+        self.assertAlmostEqual(scores["c"], 0.0)
+        self.assertAlmostEqual(scores["d"], 0.0)
+
+    def test_limit_and_deduplication_by_text(self):
+        branches = {
+            "vector": [chunk(None, 0.9, "same text"), chunk("x", 0.5)],
+            "lexical": [chunk(None, 3.0, "same text")],
+        }
+
+        fused = fuse_ranked_lists(branches, limit=1, method="rrf", rrf_k=60, weights=self.equal_weights)
+
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(fused[0]["text"], "same text")
+        self.assertEqual(fused[0]["lexical_rank"], 1)
+
+
+class RerankTests(TestCase):
+    def fused(self, *scores):
+        return [{"chunk_id": str(i), "text": f"chunk {i}", "fusion_score": score} for i, score in enumerate(scores)]
+
+    def test_fused_scores_separate(self):
+        self.assertTrue(fused_scores_separate(self.fused(0.9, 0.8, 0.2), top_k=2, ratio=2))
+        self.assertFalse(fused_scores_separate(self.fused(0.9, 0.8, 0.5), top_k=2, ratio=2))
+        # Disabled, ties and no candidate past top_k never count as separated
+        self.assertFalse(fused_scores_separate(self.fused(0.9, 0.8, 0.2), top_k=2, ratio=0))
+        self.assertFalse(fused_scores_separate(self.fused(0.9, 0.0, 0.0), top_k=2, ratio=2))
+        self.assertFalse(fused_scores_separate(self.fused(0.9, 0.8), top_k=2, ratio=2))
+
+    def test_early_exit_keeps_the_fusion_order_and_is_timed(self):
+        chunks = self.fused(0.2, 0.9, 0.01)
+
+        with mock.patch.object(core, "RERANK_EARLY_EXIT_RATIO", 2), \
+                mock.patch.object(core, "get_reranker_model") as get_reranker_model, \
+                collect_stage_samples(QUERY_STAGE_SECONDS) as samples:
+            ranked = rerank_chunks("question", chunks, top_k=2)
+
+        get_reranker_model.assert_not_called()
+        self.assertEqual([c["chunk_id"] for c in ranked], ["1", "0", "2"])
+        self.assertEqual([c["rerank_score"] for c in ranked], [0.9, 0.2, 0.01])
+        self.assertEqual(len(samples["rerank"]), 1)
+
+    def test_model_only_scores_uncached_pairs(self):
+        model = mock.Mock()
+        model.predict.side_effect = lambda pairs, **kwargs: [len(text) for _, text in pairs]
+
+        with mock.patch.object(core, "RERANK_EARLY_EXIT_RATIO", 0), \
+                mock.patch.object(core, "get_reranker_model", return_value=model), \
+                mock.patch.object(core, "get_rerank_score_cache", return_value=ScoreCache()), \
+                collect_stage_samples(QUERY_STAGE_SECONDS) as samples:
+            first = rerank_chunks("question", self.fused(0.5, 0.4) + [{"chunk_id": "x", "text": "a longer chunk"}])
+            rerank_chunks("question", self.fused(0.5, 0.4))
+
+        self.assertEqual(first[0]["chunk_id"], "x")
+        self.assertEqual(model.predict.call_count, 1)
+        self.assertEqual(len(samples["rerank"]), 2)
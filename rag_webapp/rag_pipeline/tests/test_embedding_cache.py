@@ -0,0 +1,75 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from rag_pipeline.embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    """Embeds each text as [len(text), 1, 2, 3] and remembers what it was asked to embed."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[len(text), 1, 2, 3] for text in texts]
+
+
+class EmbeddingCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def test_encoder_only_sees_misses(self):
+        cache = EmbeddingCache("test/model", 4)
+        encoder = CountingEncoder()
+
+        first = cache.encode(["alpha", "beta"], encoder)
+        second = cache.encode(["beta", "gamma", "alpha"], encoder)
+
+        self.assertEqual(encoder.calls, [["alpha", "beta"], ["gamma"]])
+        np.testing.assert_array_equal(second[0], first[1])
+        np.testing.assert_array_equal(second[2], first[0])
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def test_duplicate_texts_are_encoded_once(self):
+        cache = EmbeddingCache("test/model", 4)
+        encoder = CountingEncoder()
+
+        result = cache.encode(["same", "same", "other"], encoder)
+
+        self.assertEqual(encoder.calls, [["same", "other"]])
+        self.assertEqual(result.shape, (3, 4))
+        np.testing.assert_array_equal(result[0], result[1])
+
+    def test_no_encoder_call_when_everything_is_cached(self):
+        cache = EmbeddingCache("test/model", 4)
+        cache.put_many(["alpha"], [[1, 2, 3, 4]])
+
+        def encoder(texts):
+            self.fail("the encoder should not be called")
+
+        np.testing.assert_array_equal(cache.encode(["alpha"], encoder), [[1, 2, 3, 4]])
+
+    def test_disk_layer_is_shared_between_instances(self):
+        writer = EmbeddingCache("test/model", 4, cache_dir=self.cache_dir.name)
+        reader = EmbeddingCache("test/model", 4, cache_dir=self.cache_dir.name)
+        # The reader looks first, so it has to pick up rows appended later
+        self.assertEqual(reader.get_many(["alpha"]), [None])
+
+        writer.put_many(["alpha", "beta"], [[1, 2, 3, 4], [5, 6, 7, 8]])
+        writer.put_many(["beta", "gamma"], [[5, 6, 7, 8], [9, 10, 11, 12]])
+
+        found = reader.get_many(["gamma", "alpha", "delta"])
+        np.testing.assert_array_equal(found[0], [9, 10, 11, 12])
+        np.testing.assert_array_equal(found[1], [1, 2, 3, 4])
+        self.assertIsNone(found[2])
+
+    def test_memory_layer_is_bounded(self):
+        cache = EmbeddingCache("test/model", 4, max_memory_items=2)
+        cache.put_many(["a", "b", "c"], np.eye(3, 4))
+
+        self.assertEqual(len(cache._memory), 2)
+        self.assertIsNone(cache.get_many(["a"])[0])
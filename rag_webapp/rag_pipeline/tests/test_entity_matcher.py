@@ -0,0 +1,117 @@
+import threading
+import time
+from unittest import TestCase
+
+from rag_pipeline.entity_matcher import EntityDictionary, EntityMatcher, normalize_entity
+
+
+class FakeDriver:
+    """Answers the EntityDictionary queries from a list of (name, created_at) rows."""
+
+    def __init__(self, rows, delay=0.0):
+        self.rows = list(rows)
+        self.delay = delay
+        self.queries = []
+
+    def session(self, database=None):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, since=None):
+        self.driver.queries.append(since)
+        time.sleep(self.driver.delay)
+        return [{"name": name, "created_at": created_at} for name, created_at in self.driver.rows
+                if since is None or created_at >= since]
+
+
+class EntityMatcherTests(TestCase):
+    def setUp(self):
+        self.matcher = EntityMatcher()
+        self.matcher.add(["NASA", "European Commission", "AI", "Bank of America", "America"])
+
+    def test_normalize_entity(self):
+        self.assertEqual(normalize_entity("  European\n Commission "), "european commission")
+
+    def test_finds_names_case_insensitively(self):
+        self.assertEqual(self.matcher.match("What did the european  COMMISSION ask nasa?"),
+                         ["European Commission", "NASA"])
+
+    def test_only_whole_words_match(self):
+        self.assertEqual(self.matcher.match("She said the banana was fine"), [])
+        self.assertEqual(self.matcher.match("AI, said NASA."), ["AI", "NASA"])
+
+    def test_overlapping_names_all_match(self):
+        self.assertEqual(sorted(self.matcher.match("Bank of America results")),
+                         ["America", "Bank of America"])
+
+    def test_each_name_is_reported_once_with_every_spelling(self):
+        self.matcher.add(["Nasa"])
+
+        self.assertEqual(self.matcher.match("NASA and nasa"), ["NASA", "Nasa"])
+        self.assertEqual(len(self.matcher), 5)
+
+    def test_names_added_after_a_match_are_found(self):
+        self.matcher.match("NASA")
+        self.matcher.add(["Gemini"])
+
+        self.assertEqual(self.matcher.match("gemini"), ["Gemini"])
+
+    def test_copy_is_independent(self):
+        clone = self.matcher.copy()
+        clone.add(["Gemini"])
+
+        self.assertEqual(clone.match("NASA and Gemini"), ["NASA", "Gemini"])
+        self.assertEqual(self.matcher.match("NASA and Gemini"), ["NASA"])
+
+
+class EntityDictionaryTests(TestCase):
+    def test_loads_everything_then_only_new_entities(self):
+        driver = FakeDriver([("NASA", 1_000_000), ("OpenAI", 1_000_100)])
+        dictionary = EntityDictionary(refresh_seconds=3600)
+
+        self.assertEqual(dictionary.match(driver, "Did NASA use OpenAI?"), ["NASA", "OpenAI"])
+        driver.rows.append(("Gemini", 1_000_200))
+        dictionary.refresh(driver)
+
+        self.assertEqual(dictionary.match(driver, "gemini"), ["Gemini"])
+        self.assertEqual(driver.queries, [None, 1_000_100 - EntityDictionary.OVERLAP_MS])
+
+    def test_lookups_are_not_refreshed_until_stale(self):
+        driver = FakeDriver([("NASA", 1)])
+        dictionary = EntityDictionary(refresh_seconds=3600)
+
+        dictionary.match(driver, "NASA")
+        dictionary.match(driver, "NASA")
+
+        self.assertEqual(len(driver.queries), 1)
+
+    def test_lookups_do_not_wait_for_a_refresh(self):
+        driver = FakeDriver([("NASA", 1)])
+        dictionary = EntityDictionary(refresh_seconds=3600)
+        dictionary.refresh(driver)
+
+        driver.rows.append(("Gemini", 2))
+        driver.delay = 0.5
+        refresh = threading.Thread(target=dictionary.refresh, args=(driver,))
+        refresh.start()
+        time.sleep(0.1)
+
+        start = time.perf_counter()
+        found = dictionary.match(driver, "NASA and Gemini")
+        elapsed = time.perf_counter() - start
+        refresh.join()
+
+        # The old dictionary answers while the refresh is still querying
+        self.assertEqual(found, ["NASA"])
+        self.assertLess(elapsed, 0.2)
+        self.assertEqual(dictionary.match(driver, "NASA and Gemini"), ["NASA", "Gemini"])
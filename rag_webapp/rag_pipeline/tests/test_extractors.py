@@ -0,0 +1,63 @@
+import importlib.util
+from unittest import TestCase, mock, skipUnless
+
+from rag_pipeline.extractors import EntityExtractionError, GeminiEntityExtractor, LocalEntityExtractor
+from rag_pipeline.llm_client import LLMClient
+from rag_pipeline.llm_stub import StubGenerativeModel
+
+
+class LocalEntityExtractorTests(TestCase):
+    def setUp(self):
+        self.extractor = LocalEntityExtractor()
+
+    def test_capitalized_spans_with_connectors(self):
+        self.assertEqual(self.extractor.extract("The European Commission fined Bank of America."),
+                         ["European Commission", "Bank of America"])
+
+    def test_acronyms_and_codes(self):
+        self.assertEqual(self.extractor.extract("NASA and the EU signed ISO-9001 with XR-7 parts."),
+                         ["NASA", "EU", "ISO-9001", "XR-7"])
+
+    def test_lone_capitalized_word_opening_a_sentence_is_dropped(self):
+        self.assertEqual(self.extractor.extract("However, the plan failed."), [])
+
+    def test_full_stop_after_an_acronym_ends_the_sentence(self):
+        # "Humanoid" opens a new sentence: it is neither glued onto "H100 GPUs" nor a name
+        self.assertEqual(self.extractor.extract("Nvidia ships H100 GPUs. Humanoid robots use them."),
+                         ["H100", "GPUs", "H100 GPUs"])
+
+    def test_full_stop_of_an_abbreviation_does_not_end_the_sentence(self):
+        self.assertEqual(self.extractor.extract("They work with the U.S. Army."), ["U.S", "Army"])
+
+    def test_extract_batch_keeps_the_order(self):
+        self.assertEqual(self.extractor.extract_batch(["NASA", "the plan", "XR-7"]),
+                         [["NASA"], [], ["XR-7"]])
+
+
+@skipUnless(importlib.util.find_spec("google.generativeai"), "google-generativeai is not installed")
+class GeminiEntityExtractorTests(TestCase):
+    texts = [
+        "The European Commission fined Bank of America.",
+        "NASA and the EU signed ISO-9001.",
+        "Nvidia ships H100 GPUs.",
+    ]
+
+    def extract_batch(self, model, **kwargs):
+        client = LLMClient(model, max_retries=1, retry_base_seconds=0)
+        with mock.patch("rag_pipeline.extractors.get_llm_model", return_value=client):
+            return GeminiEntityExtractor(**kwargs).extract_batch(self.texts)
+
+    def test_batched_extraction_with_the_stub_provider(self):
+        entities = self.extract_batch(StubGenerativeModel(), batch_size=2)
+
+        self.assertEqual(entities, LocalEntityExtractor().extract_batch(self.texts))
+
+    def test_unparsable_output_gives_no_entities(self):
+        model = StubGenerativeModel()
+        model._respond = lambda prompt: "not json"
+
+        self.assertEqual(self.extract_batch(model, max_retries=1), [[], [], []])
+
+    def test_failing_calls_raise_after_retries(self):
+        with self.assertRaises(EntityExtractionError):
+            self.extract_batch(StubGenerativeModel(error_rate=1.0), max_retries=1)
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from unittest import TestCase, mock
+
+from rag_pipeline.llm_client import LLMClient, TokenBucket, is_retryable
+from rag_pipeline.llm_stub import StubGenerativeModel, StubQuotaError
+
+
+class CountingModel(StubGenerativeModel):
+    """A stub model that counts the calls reaching it and can fail the first few."""
+
+    def __init__(self, failures=0, error=StubQuotaError, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _count(self):
+        with self._calls_lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise self.error("simulated failure")
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self._count()
+        return super().generate_content(prompt, generation_config, stream)
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self._count()
+        return await super().generate_content_async(prompt, generation_config, stream)
+
+
+class TokenBucketTests(TestCase):
+    def test_callers_past_the_capacity_wait_in_turn(self):
+        # One token per second, two in the bucket
+        bucket = TokenBucket(60, capacity=2)
+
+        waits = [bucket.reserve() for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 1.0, places=1)
+        self.assertAlmostEqual(waits[3], 2.0, places=1)
+
+    def test_bucket_refills_over_time(self):
+        with mock.patch("rag_pipeline.llm_client.time.monotonic", side_effect=[100.0, 100.0, 100.5, 102.0]):
+            bucket = TokenBucket(60, capacity=1)
+            self.assertEqual(bucket.reserve(), 0.0)
+            self.assertAlmostEqual(bucket.reserve(), 0.5)
+            self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_request_larger_than_the_bucket_goes_through_when_full(self):
+        bucket = TokenBucket(60, capacity=10)
+
+        self.assertEqual(bucket.reserve(100), 0.0)
+        self.assertGreater(bucket.reserve(1), 0.0)
+
+
+class LLMClientTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("rag_pipeline.llm_client.record_llm_call")
+        self.record_llm_call = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self, model, **kwargs):
+        kwargs.setdefault("retry_base_seconds", 0)
+        return LLMClient(model, **kwargs)
+
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(StubQuotaError()))
+        self.assertTrue(is_retryable(ConnectionError()))
+        self.assertFalse(is_retryable(ValueError()))
+
+    def test_call_is_recorded_once_with_its_purpose(self):
+        model = CountingModel()
+
+        response = self.client(model).generate_content("What is NASA?", purpose="answer")
+
+        self.assertEqual(model.calls, 1)
+        self.record_llm_call.assert_called_once_with("answer", response)
+
+    def test_identical_prompts_in_flight_are_sent_once(self):
+        model = CountingModel(latency_ms=200)
+        client = self.client(model)
+        responses = [None] * 5
+
+        def ask(i):
+            responses[i] = client.generate_content("What is NASA?", purpose="answer")
+
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(self.record_llm_call.call_count, 1)
+        self.assertTrue(all(response is responses[0] for response in responses))
+
+    def test_quota_errors_are_retried(self):
+        model = CountingModel(failures=2)
+
+        response = self.client(model, max_retries=4).generate_content("What is NASA?")
+
+        self.assertEqual(model.calls, 3)
+        self.record_llm_call.assert_called_once_with("other", response)
+
+    def test_error_is_raised_and_recorded_after_the_last_retry(self):
+        model = CountingModel(error_rate=1.0)
+
+        with self.assertRaises(StubQuotaError) as raised:
+            self.client(model, max_retries=2).generate_content("What is NASA?", purpose="compare")
+
+        self.assertEqual(model.calls, 3)
+        self.record_llm_call.assert_called_once_with("compare", error=raised.exception)
+
+    def test_other_errors_are_not_retried(self):
+        model = CountingModel(failures=1, error=ValueError)
+
+        with self.assertRaises(ValueError):
+            self.client(model, max_retries=4).generate_content("What is NASA?")
+
+        self.assertEqual(model.calls, 1)
+
+    def test_async_call_is_retried_and_recorded(self):
+        model = CountingModel(failures=1)
+
+        response = asyncio.run(self.client(model).generate_content_async("What is NASA?", purpose="answer"))
+
+        self.assertEqual(model.calls, 2)
+        self.record_llm_call.assert_called_once_with("answer", response)
+
+    def test_stream_is_recorded_once_consumed(self):
+        model = CountingModel(answer_words=30)
+        client = self.client(model)
+
+        async def stream():
+            response = await client.generate_content_async("What is NASA?", stream=True, purpose="answer_stream")
+            self.record_llm_call.assert_not_called()
+            return response, [chunk.text async for chunk in response]
+
+        response, pieces = asyncio.run(stream())
+
+        self.assertEqual(len("".join(pieces).split()), 30)
+        self.record_llm_call.assert_called_once_with("answer_stream", response.response, None)
@@ -0,0 +1,70 @@
+import time
+from unittest import TestCase
+
+from rag_pipeline.pipeline import run_pipeline
+
+
+def doubled(items):
+    for item in items:
+        yield item * 2
+
+
+def in_pairs(items):
+    pair = []
+    for item in items:
+        pair.append(item)
+        if len(pair) == 2:
+            yield tuple(pair)
+            pair = []
+    if pair:
+        yield tuple(pair)
+
+
+class RunPipelineTests(TestCase):
+    def test_items_pass_through_every_stage_in_order(self):
+        result = list(run_pipeline(range(5), [("double", doubled), ("pair", in_pairs)]))
+        self.assertEqual(result, [(0, 2), (4, 6), (8,)])
+
+    def test_no_stages_yields_the_source(self):
+        self.assertEqual(list(run_pipeline(iter("abc"), [])), ["a", "b", "c"])
+
+    def test_stage_error_is_raised_and_stops_the_source(self):
+        produced = []
+
+        def source():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        def failing(items):
+            for item in items:
+                if item == 3:
+                    raise ValueError("bad item")
+                yield item
+
+        with self.assertRaises(ValueError):
+            list(run_pipeline(source(), [("fail", failing)], buffer_size=1))
+        # Bounded queues: the source was stopped long before it ran out
+        self.assertLess(len(produced), 1000)
+
+    def test_source_error_is_raised(self):
+        def source():
+            yield 1
+            raise RuntimeError("source broke")
+
+        with self.assertRaises(RuntimeError):
+            list(run_pipeline(source(), [("double", doubled)]))
+
+    def test_stages_overlap(self):
+        def slow(items):
+            for item in items:
+                time.sleep(0.05)
+                yield item
+
+        start = time.perf_counter()
+        result = list(run_pipeline(range(6), [("a", slow), ("b", slow)]))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(result, list(range(6)))
+        # Run one after the other, the two slow stages would take 0.6 s
+        self.assertLess(elapsed, 0.55)
@@ -0,0 +1,95 @@
+import tempfile
+import time
+from unittest import TestCase
+
+from rag_pipeline.retrieval_cache import RetrievalCache, ScoreCache, normalize_question
+
+
+class RetrievalCacheTests(TestCase):
+    params = {"top_k": 5}
+
+    def setUp(self):
+        self.stamp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.stamp_dir.cleanup)
+
+    def store(self, cache, question="What is NASA?", filename="report.pdf", chunks=None):
+        chunks = chunks if chunks is not None else [{"chunk_id": "report.pdf:1:0", "text": "NASA"}]
+        cache.put(question, filename, self.params, chunks, cache.document_stamp(filename))
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  What  is\tNASA?? "), "what is nasa")
+
+    def test_hit_after_put_with_a_normalized_question(self):
+        cache = RetrievalCache()
+        self.store(cache)
+
+        self.assertEqual(cache.get("what is NASA", "report.pdf", self.params),
+                         [{"chunk_id": "report.pdf:1:0", "text": "NASA"}])
+        self.assertIsNone(cache.get("What is NASA?", "report.pdf", {"top_k": 10}))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_get_returns_a_copy(self):
+        cache = RetrievalCache()
+        self.store(cache)
+
+        cache.get("What is NASA?", "report.pdf", self.params)[0]["text"] = "changed"
+
+        self.assertEqual(cache.get("What is NASA?", "report.pdf", self.params)[0]["text"], "NASA")
+
+    def test_entries_expire(self):
+        cache = RetrievalCache(ttl_seconds=0)
+        self.store(cache)
+        time.sleep(0.01)
+
+        self.assertIsNone(cache.get("What is NASA?", "report.pdf", self.params))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = RetrievalCache(max_items=2)
+        self.store(cache, "first")
+        self.store(cache, "second")
+        cache.get("first", "report.pdf", self.params)
+        self.store(cache, "third")
+
+        self.assertIsNotNone(cache.get("first", "report.pdf", self.params))
+        self.assertIsNone(cache.get("second", "report.pdf", self.params))
+
+    def test_invalidate_document_only_drops_that_document(self):
+        cache = RetrievalCache()
+        self.store(cache, filename="report.pdf")
+        self.store(cache, filename="other.pdf")
+
+        cache.invalidate_document("report.pdf")
+
+        self.assertIsNone(cache.get("What is NASA?", "report.pdf", self.params))
+        self.assertIsNotNone(cache.get("What is NASA?", "other.pdf", self.params))
+
+    def test_invalidation_reaches_other_processes_through_the_stamp_dir(self):
+        web = RetrievalCache(stamp_dir=self.stamp_dir.name)
+        worker = RetrievalCache(stamp_dir=self.stamp_dir.name)
+        self.store(web)
+
+        worker.invalidate_document("report.pdf")
+
+        self.assertIsNone(web.get("What is NASA?", "report.pdf", self.params))
+
+    def test_result_computed_during_a_rewrite_is_not_stored(self):
+        for stamp_dir in (None, self.stamp_dir.name):
+            with self.subTest(stamp_dir=stamp_dir):
+                cache = RetrievalCache(stamp_dir=stamp_dir)
+                stamp = cache.document_stamp("report.pdf")
+                # The document is re-ingested while the old chunks are being retrieved
+                cache.invalidate_document("report.pdf")
+                cache.put("What is NASA?", "report.pdf", self.params, [{"text": "stale"}], stamp)
+
+                self.assertIsNone(cache.get("What is NASA?", "report.pdf", self.params))
+
+
+class ScoreCacheTests(TestCase):
+    def test_least_recently_used_score_is_evicted(self):
+        cache = ScoreCache(max_items=2)
+        cache.put("a", 0.1)
+        cache.put("b", 0.2)
+        cache.get("a")
+        cache.put("c", 0.3)
+
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (0.1, None, 0.3))
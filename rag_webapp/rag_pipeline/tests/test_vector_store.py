@@ -0,0 +1,218 @@
+import importlib.util
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+from rag_pipeline.vector_store import FaissVectorStore, Neo4jVectorStore
+
+
+def one_hot(position, dimensions=8):
+    vector = np.zeros(dimensions, dtype=np.float32)
+    vector[position] = 1.0
+    return vector
+
+
+class FakeResult(list):
+    def single(self):
+        return self[0]
+
+
+class FakeNeo4j:
+    """Answers Neo4jVectorStore's queries for a corpus where the document's chunks rank last in the index."""
+
+    def __init__(self, total, in_document):
+        self.total = total
+        self.in_document = in_document
+        self.queries = []
+
+    def session(self, database=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, **params):
+        if "count(c)" in query:
+            return FakeResult([{"total": self.total, "in_document": self.in_document}])
+        if "queryNodes" in query:
+            self.queries.append(("index", params["fetch_k"]))
+            found = max(0, params["fetch_k"] - (self.total - self.in_document))
+        else:
+            self.queries.append(("exact", None))
+            found = self.in_document
+        return FakeResult({"chunk_id": f"a.pdf:{i}:0", "text": "", "page": i, "chunkno": 0, "score": 1.0}
+                          for i in range(min(found, params["top_k"])))
+
+
+class Neo4jVectorStoreTests(TestCase):
+    def search(self, driver, **kwargs):
+        store = Neo4jVectorStore(overfetch_factor=1.5, **kwargs)
+        return store.search(driver, [0.1] * 8, "a.pdf", top_k=5)
+
+    def test_small_document_is_scanned_exactly(self):
+        driver = FakeNeo4j(total=1_000_000, in_document=40)
+
+        hits = self.search(driver, exact_scan_max_chunks=100)
+
+        self.assertEqual(len(hits), 5)
+        self.assertEqual(driver.queries, [("exact", None)])
+
+    def test_large_document_over_fetches_from_the_index(self):
+        driver = FakeNeo4j(total=2000, in_document=1000)
+
+        hits = self.search(driver, exact_scan_max_chunks=100, max_fetch_k=5000)
+
+        self.assertEqual(len(hits), 5)
+        self.assertEqual(driver.queries, [("index", 15), ("index", 30), ("index", 60), ("index", 120),
+                                          ("index", 240), ("index", 480), ("index", 960), ("index", 1920)])
+
+    def test_index_requests_are_capped_then_fall_back_to_an_exact_scan(self):
+        driver = FakeNeo4j(total=2000, in_document=1000)
+
+        hits = self.search(driver, exact_scan_max_chunks=100, max_fetch_k=100)
+
+        self.assertEqual(len(hits), 5)
+        self.assertEqual(driver.queries, [("index", 15), ("index", 30), ("index", 60), ("index", 100),
+                                          ("exact", None)])
+
+    def test_first_request_above_the_cap_scans_exactly(self):
+        driver = FakeNeo4j(total=1_000_000, in_document=500)
+
+        self.search(driver, exact_scan_max_chunks=100, max_fetch_k=1000)
+
+        self.assertEqual(driver.queries, [("exact", None)])
+
+
+@skipUnless(importlib.util.find_spec("faiss"), "faiss is not installed")
+class FaissVectorStoreTests(TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.index_dir.cleanup)
+        self.store = FaissVectorStore(dimensions=8, index_dir=self.index_dir.name)
+
+    def add_pages(self, filename, pages, store=None):
+        """Adds one chunk per page, chunk "<filename>:<page>:0" pointing along axis page."""
+        (store or self.store).add(filename, [f"{filename}:{page}:0" for page in pages],
+                                  [one_hot(page) for page in pages])
+
+    def test_search_finds_the_nearest_chunk(self):
+        self.add_pages("a.pdf", [1, 2, 3])
+        self.store.commit("a.pdf")
+
+        hits = self.store.search(None, one_hot(2) + 0.1 * one_hot(3), "a.pdf", top_k=2)
+
+        self.assertEqual([hit["chunk_id"] for hit in hits], ["a.pdf:2:0", "a.pdf:3:0"])
+        self.assertAlmostEqual(hits[0]["score"], 1 / np.sqrt(1.01), places=5)
+
+    def test_nothing_is_searchable_before_commit(self):
+        self.add_pages("a.pdf", [1])
+
+        self.assertFalse(self.store.has_document("a.pdf"))
+        self.assertEqual(self.store.search(None, one_hot(1), "a.pdf"), [])
+
+    def test_search_during_reingestion_uses_the_committed_ids(self):
+        self.add_pages("a.pdf", [1, 2, 3])
+        self.store.commit("a.pdf")
+        self.store.search(None, one_hot(3), "a.pdf")
+
+        # A re-ingestion rewrites page 1, which moves its row to the end, but
+        # has not committed yet; another process loads the index meanwhile.
+        self.store.delete("a.pdf", page_numbers=[1])
+        self.add_pages("a.pdf", [1])
+        other_process = FaissVectorStore(dimensions=8, index_dir=self.index_dir.name)
+
+        for store in (self.store, other_process):
+            hits = store.search(None, one_hot(3), "a.pdf", top_k=1)
+            self.assertEqual(hits[0]["chunk_id"], "a.pdf:3:0")
+
+        self.store.commit("a.pdf")
+        hits = other_process.search(None, one_hot(1), "a.pdf", top_k=1)
+        self.assertEqual(hits[0]["chunk_id"], "a.pdf:1:0")
+
+    def test_delete_pages_then_commit(self):
+        self.add_pages("a.pdf", [1, 2, 3])
+        self.store.delete("a.pdf", page_numbers=[2])
+        self.store.commit("a.pdf")
+
+        hits = self.store.search(None, one_hot(2), "a.pdf", top_k=5)
+
+        self.assertEqual(sorted(hit["chunk_id"] for hit in hits), ["a.pdf:1:0", "a.pdf:3:0"])
+
+    def test_delete_document(self):
+        self.add_pages("a.pdf", [1])
+        self.store.commit("a.pdf")
+        self.store.search(None, one_hot(1), "a.pdf")
+
+        self.store.delete("a.pdf")
+
+        self.assertFalse(self.store.has_document("a.pdf"))
+        self.assertEqual(self.store.search(None, one_hot(1), "a.pdf"), [])
+        self.assertEqual(self.store.search(None, one_hot(1)), [])
+
+    def test_global_search_merges_documents(self):
+        self.add_pages("a.pdf", [1, 2])
+        self.add_pages("b.pdf", [3])
+        self.store.commit("a.pdf")
+        self.store.commit("b.pdf")
+
+        hits = self.store.search(None, one_hot(3) + 0.5 * one_hot(1), top_k=2)
+
+        self.assertEqual([hit["chunk_id"] for hit in hits], ["b.pdf:3:0", "a.pdf:1:0"])
+
+    def test_readded_chunks_replace_their_rows_and_commit_compacts(self):
+        self.add_pages("a.pdf", [1, 2])
+        self.store.add("a.pdf", ["a.pdf:1:0"], [one_hot(5)])
+        self.store.delete("a.pdf", page_numbers=[2])
+        self.store.commit("a.pdf")
+
+        hits = self.store.search(None, one_hot(5), "a.pdf", top_k=5)
+
+        self.assertEqual([(hit["chunk_id"], round(hit["score"], 3)) for hit in hits], [("a.pdf:1:0", 1.0)])
+        self.assertEqual(self.store._written("a.pdf")[0], 1)
+        self.assertFalse(os.path.exists(self.store._path("a.pdf", ".deletes.jsonl")))
+
+    def test_pages_added_after_a_delete_survive_it(self):
+        self.add_pages("a.pdf", [1, 2])
+        self.store.delete("a.pdf", page_numbers=[1])
+        self.add_pages("a.pdf", [1])
+        self.store.commit("a.pdf")
+
+        hits = self.store.search(None, one_hot(1), "a.pdf", top_k=5)
+
+        self.assertEqual(sorted(hit["chunk_id"] for hit in hits), ["a.pdf:1:0", "a.pdf:2:0"])
+
+    def test_add_appends_and_skips_leftovers_of_an_interrupted_write(self):
+        self.add_pages("a.pdf", [1])
+        with open(self.store._path("a.pdf", ".f32"), "rb") as f:
+            first_row = f.read()
+        # A crashed add() left a partial row and id behind, never counted in .rows
+        for suffix, garbage in ((".f32", b"\xff" * 20), (".ids.jsonl", b'"a.pdf:9')):
+            with open(self.store._path("a.pdf", suffix), "ab") as f:
+                f.write(garbage)
+
+        self.add_pages("a.pdf", [2])
+        self.store.commit("a.pdf")
+
+        with open(self.store._path("a.pdf", ".f32"), "rb") as f:
+            self.assertEqual(f.read(len(first_row)), first_row)
+        hits = self.store.search(None, one_hot(2), "a.pdf", top_k=5)
+        self.assertEqual([hit["chunk_id"] for hit in hits], ["a.pdf:2:0", "a.pdf:1:0"])
+
+    def test_large_documents_get_an_ivf_index(self):
+        import faiss
+
+        store = FaissVectorStore(dimensions=8, index_dir=self.index_dir.name, ivf_min_vectors=80)
+        vectors = np.random.default_rng(0).normal(size=(80, 8)).astype(np.float32)
+        store.add("a.pdf", [f"a.pdf:{page}:0" for page in range(80)], vectors)
+        store.commit("a.pdf")
+
+        index, _ = store._load("a.pdf")
+        hits = store.search(None, vectors[42], "a.pdf", top_k=1)
+
+        self.assertIsInstance(faiss.downcast_index(index), faiss.IndexIVFFlat)
+        self.assertEqual(hits[0]["chunk_id"], "a.pdf:42:0")
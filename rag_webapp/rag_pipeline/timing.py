@@ -0,0 +1,71 @@
+# rag_pipeline/timing.py
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Ingestion stages, in pipeline order
+INGESTION_STAGES = ["docling", "chunking", "entity_extraction", "embedding", "neo4j_write"]
+
+
+class StageTimer:
+    """
+    Adds up the time spent in each named stage.
+
+    Safe to use from several threads at once, as the pipeline stages do. A
+    stage's total is its busy time: time spent waiting for input from the
+    previous stage is not counted, so the totals show where the work goes
+    even though the stages overlap in wall-clock time.
+
+    If a histogram (labelled by 'stage') is given, every timed piece of work
+    is also observed in it.
+    """
+
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self._lock = threading.Lock()
+        self._seconds = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+        if self.histogram is not None:
+            from .metrics import observe_stage
+
+            observe_stage(self.histogram, name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Times the body of a with block as part of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def timed(self, name, iterable):
+        """Yields from iterable, timing how long each item takes to produce."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def as_dict(self):
+        """Returns {stage: seconds}, rounded to milliseconds."""
+        with self._lock:
+            return {name: round(seconds, 3) for name, seconds in self._seconds.items()}
+
+
+def merge_timings(*timings):
+    """Adds up several {stage: seconds} dicts, e.g. from the shards of one document."""
+    merged = {}
+    for timing in timings:
+        for name, seconds in (timing or {}).items():
+            merged[name] = round(merged.get(name, 0.0) + seconds, 3)
+    return merged
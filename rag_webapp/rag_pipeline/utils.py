@@ -1,14 +1,11 @@
 # rag_pipeline/utils.py
 
 import json
-from google.generativeai import configure, GenerativeModel
-from google.generativeai.types import GenerationConfig
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.cross_encoder import CrossEncoder
-from docling.document_converter import DocumentConverter
 from icecream import ic
 import os
 
+import numpy as np
+
 ic.configureOutput(prefix=f'Debug | ', includeContext=True)
 
 # --- This file is now the home for all lazy-loaded models ---
@@ -17,24 +14,313 @@ EMBEDDING_MODEL = None
 DOCLING_CONVERTER = None
 RERANKER_MODEL = None
 GEMINI_API_KEY = None
+ENTITY_EXTRACTOR = None
+EMBEDDING_CACHE = None
+RETRIEVAL_CACHE = None
+VECTOR_STORE = None
+ENTITY_DICTIONARY = None
+RERANK_SCORE_CACHE = None
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSIONS = 384
+
+# Embedding inference: "torch" (full precision), "onnx" (ONNX Runtime;
+# EMBEDDING_ONNX_FILE can pick a quantized export such as
+# onnx/model_qint8_avx512_vnni.onnx) or "int8" (PyTorch dynamic int8
+# quantization of the linear layers). EMBEDDING_THREADS=0 keeps the runtime's default.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Shared on-disk embedding cache. The default lives inside the project folder,
+# which docker-compose mounts into both the web app and the worker.
+# Set EMBEDDING_CACHE_DIR to an empty string to keep the cache in memory only.
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(CACHE_ROOT, "embeddings"))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "20000"))
+
+# Reranked retrieval results, invalidated per document through stamp files
+# in RETRIEVAL_CACHE_DIR. Set RETRIEVAL_CACHE_MAX_ITEMS=0 to disable.
+RETRIEVAL_CACHE_DIR = os.getenv("RETRIEVAL_CACHE_DIR", os.path.join(CACHE_ROOT, "retrieval"))
+RETRIEVAL_CACHE_MAX_ITEMS = int(os.getenv("RETRIEVAL_CACHE_MAX_ITEMS", "512"))
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600"))
+
+# Vector search backend: "neo4j" (the chunk_embeddings index) or "faiss"
+# (per-document indexes on local disk, searched in-process).
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE", "neo4j").lower()
+FAISS_INDEX_DIR = os.getenv(
+    "FAISS_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "faiss")
+)
+# When searching the Neo4j vector index for one document, ask for this much
+# more than the document's expected share of the results.
+VECTOR_OVERFETCH_FACTOR = float(os.getenv("VECTOR_OVERFETCH_FACTOR", "1.5"))
+# Requests to the vector index stop at VECTOR_MAX_FETCH_K; documents of up to
+# VECTOR_EXACT_SCAN_MAX_CHUNKS chunks (or needing more than that) are scored
+# exactly, chunk by chunk, instead.
+VECTOR_MAX_FETCH_K = int(os.getenv("VECTOR_MAX_FETCH_K", "1000"))
+VECTOR_EXACT_SCAN_MAX_CHUNKS = int(os.getenv("VECTOR_EXACT_SCAN_MAX_CHUNKS", "2000"))
+
+# How question entities are found at query time: "dictionary" matches the
+# question against every Entity name in the graph, in-process; "extractor"
+# runs the configured ENTITY_EXTRACTOR on it (an LLM call with Gemini).
+QUESTION_ENTITY_SOURCE = os.getenv("QUESTION_ENTITY_SOURCE", "dictionary").lower()
+ENTITY_DICTIONARY_REFRESH_SECONDS = int(os.getenv("ENTITY_DICTIONARY_REFRESH_SECONDS", "30"))
+
+# Models to load at startup instead of on first use: a comma-separated list
+# of "embedding", "reranker" and "docling", or "all". Empty (the default)
+# keeps everything lazy. See rag_pipeline/warmup.py.
+PRELOAD_MODELS = [name.strip().lower() for name in os.getenv("PRELOAD_MODELS", "").split(",") if name.strip()]
+if "all" in PRELOAD_MODELS:
+    PRELOAD_MODELS = ["embedding", "reranker", "docling"]
+
+# LLM provider: "gemini" (default) or "stub", a deterministic offline
+# stand-in with a simulated latency, for benchmarks and load tests.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+LLM_STUB_TOKENS_PER_SECOND = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", "0"))
+# Fraction of stub calls that fail with a simulated quota error, to exercise retries
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+
+# Client-side limits for the LLM, per process (0 disables a limit): requests
+# and estimated prompt tokens per minute. Size them to the API quota divided
+# by the number of processes calling the LLM (web and Django-Q workers); the
+# defaults are a quarter of the paid tier 1 quota of gemini-2.5-flash-lite.
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "1000"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+# Retries of quota and transient errors, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+
+# Reranker: "torch" (full precision), "onnx" (ONNX Runtime; RERANKER_ONNX_FILE
+# can pick a quantized export such as onnx/model_qint8_avx512_vnni.onnx) or
+# "int8" (PyTorch dynamic int8 quantization of the linear layers).
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "torch").lower()
+RERANKER_ONNX_FILE = os.getenv("RERANKER_ONNX_FILE", "")
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+RERANK_SCORE_CACHE_ITEMS = int(os.getenv("RERANK_SCORE_CACHE_ITEMS", "50000"))
+
+def create_neo4j_driver():
+    """Creates a Neo4j driver from the NEO4J_URI / NEO4J_PASSWORD environment variables."""
+    from neo4j import GraphDatabase
+
+    NEO4J_URI = os.getenv("NEO4J_URI")
+    NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+    NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+    if not all([NEO4J_URI, NEO4J_PASSWORD]):
+        raise ValueError("NEO4J_URI or NEO4J_PASSWORD secrets are not set.")
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    driver.verify_connectivity()
+    return driver
+
+def load_embedding_model(backend=None, threads=None):
+    """
+    Loads the embedding model with the given inference backend.
+
+    Args:
+        backend (str): "torch", "onnx" or "int8". Defaults to EMBEDDING_BACKEND.
+        threads (int): CPU threads for inference, 0 for the runtime's default.
+            Defaults to EMBEDDING_THREADS.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or EMBEDDING_BACKEND
+    threads = EMBEDDING_THREADS if threads is None else threads
+
+    if backend == "onnx":
+        import onnxruntime
+
+        model_kwargs = {}
+        if EMBEDDING_ONNX_FILE:
+            model_kwargs["file_name"] = EMBEDDING_ONNX_FILE
+        if threads:
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            model_kwargs["session_options"] = session_options
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx", model_kwargs=model_kwargs or None)
+
+    if backend not in ("torch", "int8"):
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Choose 'torch', 'onnx' or 'int8'.")
+
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    if backend == "torch":
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
 
 def get_embedding_model():
     """Loads the embedding model if it hasn't been loaded yet."""
     global EMBEDDING_MODEL
     if EMBEDDING_MODEL is None:
         #print("Lazy loading embedding model for the first time...")
-        EMBEDDING_MODEL = SentenceTransformer('all-MiniLM-L6-v2')
+        EMBEDDING_MODEL = load_embedding_model()
     return EMBEDDING_MODEL
 
+def get_embedding_cache():
+    """Loads the embedding cache for the current embedding model."""
+    global EMBEDDING_CACHE
+    if EMBEDDING_CACHE is None:
+        from .embedding_cache import EmbeddingCache
+
+        # Quantized backends give slightly different vectors, so each backend gets its own cache
+        model_name = EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL_NAME}-{EMBEDDING_BACKEND}"
+        EMBEDDING_CACHE = EmbeddingCache(
+            model_name,
+            EMBEDDING_DIMENSIONS,
+            cache_dir=EMBEDDING_CACHE_DIR,
+            max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS
+        )
+    return EMBEDDING_CACHE
+
+def get_retrieval_cache():
+    """Loads the cache of reranked retrieval results."""
+    global RETRIEVAL_CACHE
+    if RETRIEVAL_CACHE is None:
+        from .retrieval_cache import RetrievalCache
+
+        RETRIEVAL_CACHE = RetrievalCache(
+            max_items=RETRIEVAL_CACHE_MAX_ITEMS,
+            ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS,
+            stamp_dir=RETRIEVAL_CACHE_DIR
+        )
+    return RETRIEVAL_CACHE
+
+def get_vector_store():
+    """Loads the vector store selected by the VECTOR_STORE setting."""
+    global VECTOR_STORE
+    if VECTOR_STORE is None:
+        from .vector_store import Neo4jVectorStore, FaissVectorStore
+
+        if VECTOR_STORE_BACKEND == "faiss":
+            VECTOR_STORE = FaissVectorStore(EMBEDDING_DIMENSIONS, FAISS_INDEX_DIR)
+        elif VECTOR_STORE_BACKEND == "neo4j":
+            VECTOR_STORE = Neo4jVectorStore(
+                overfetch_factor=VECTOR_OVERFETCH_FACTOR,
+                max_fetch_k=VECTOR_MAX_FETCH_K,
+                exact_scan_max_chunks=VECTOR_EXACT_SCAN_MAX_CHUNKS
+            )
+        else:
+            raise ValueError(f"Unknown VECTOR_STORE '{VECTOR_STORE_BACKEND}'. Choose 'neo4j' or 'faiss'.")
+    return VECTOR_STORE
+
+def embed_texts(texts, model=None):
+    """
+    Embeds a list of texts, going through the embedding cache.
+
+    The embedding model is only loaded and called for texts that are not
+    cached yet. Returns a (len(texts), EMBEDDING_DIMENSIONS) float32 array.
+    """
+    from .metrics import record_cache_lookups
+
+    misses = []
+
+    def encode_misses(missing_texts):
+        misses.append(len(missing_texts))
+        return encode_texts(model or get_embedding_model(), missing_texts)
+
+    embeddings = get_embedding_cache().encode(texts, encode_misses)
+    record_cache_lookups("embedding", len(texts) - sum(misses), sum(misses))
+    return embeddings
+
+def encode_texts(model, texts, batch_size=None):
+    """
+    Runs the embedding model over texts, bypassing the cache.
+
+    Texts are encoded longest first, so each batch holds texts of similar
+    length and little compute goes into padding.
+
+    Returns:
+        np.ndarray: A C-contiguous (len(texts), EMBEDDING_DIMENSIONS) float32 array, in input order.
+    """
+    if not texts:
+        return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    vectors = model.encode(
+        [texts[i] for i in order],
+        batch_size=batch_size or EMBEDDING_BATCH_SIZE,
+        show_progress_bar=False,
+        convert_to_numpy=True
+    )
+    result = np.empty((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    result[order] = vectors
+    return result
+
+def embed_query(text, model=None):
+    """Embeds a single query text, going through the embedding cache."""
+    return embed_texts([text], model)[0]
+
+def _load_gemini_model():
+    # Ensure your API key is set as an environment variable in your Space
+    from google.generativeai import configure, GenerativeModel
+
+    configure(api_key=os.getenv("GEMINI_API_KEY"))
+    #return GenerativeModel("gemini-2.5-pro")
+    return GenerativeModel("gemini-2.5-flash-lite")
+
+def _load_stub_model():
+    from .llm_stub import StubGenerativeModel
+
+    return StubGenerativeModel(
+        latency_ms=LLM_STUB_LATENCY_MS,
+        tokens_per_second=LLM_STUB_TOKENS_PER_SECOND,
+        error_rate=LLM_STUB_ERROR_RATE
+    )
+
+# LLM_PROVIDER name -> function returning a model with Gemini's
+# generate_content / generate_content_async API
+LLM_PROVIDERS = {
+    "gemini": _load_gemini_model,
+    "stub": _load_stub_model,
+}
+
+def load_llm_model(provider=None):
+    """
+    Loads the bare generative model for the given provider (LLM_PROVIDER by default).
+
+    "gemini" calls the Gemini API; "stub" is a deterministic offline stand-in
+    (see llm_stub.StubGenerativeModel) for benchmarks and load tests.
+    """
+    provider = (provider or LLM_PROVIDER).lower()
+    if provider not in LLM_PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER '{provider}'. Choose one of: {', '.join(LLM_PROVIDERS)}")
+    return LLM_PROVIDERS[provider]()
+
+def create_llm_client(model):
+    """Wraps a model in an LLMClient with the configured rate limits and retries."""
+    from .llm_client import LLMClient
+
+    return LLMClient(
+        model,
+        requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+        max_retries=LLM_MAX_RETRIES,
+        retry_base_seconds=LLM_RETRY_BASE_SECONDS,
+        retry_max_seconds=LLM_RETRY_MAX_SECONDS
+    )
+
 def get_llm_model():
-    """Loads the LLM if it hasn't been loaded yet."""
+    """
+    Loads the LLM if it hasn't been loaded yet.
+
+    Every call site goes through the returned LLMClient, which rate limits,
+    retries and coalesces the calls of this process (see llm_client.py).
+    """
     global LLM_MODEL
     if LLM_MODEL is None:
         #print("Lazy loading Generative Model for the first time...")
-        # Ensure your API key is set as an environment variable in your Space
-        configure(api_key=os.getenv("GEMINI_API_KEY"))
-        #LLM_MODEL = GenerativeModel("gemini-2.5-pro")
-        LLM_MODEL = GenerativeModel("gemini-2.5-flash-lite")
+        LLM_MODEL = create_llm_client(load_llm_model())
     return LLM_MODEL
 
 def get_docling_converter():
@@ -42,6 +328,8 @@ def get_docling_converter():
     global DOCLING_CONVERTER
     if DOCLING_CONVERTER is None:
         #print("Lazy loading Docling converter for the first time...")
+        from docling.document_converter import DocumentConverter
+
         DOCLING_CONVERTER = DocumentConverter()
     return DOCLING_CONVERTER
 
@@ -49,36 +337,70 @@ def get_reranker_model():
     """Loads and caches the CrossEncoder re-ranking model."""
     global RERANKER_MODEL
     if RERANKER_MODEL is None:
-        print("--- LAZY LOADING: CrossEncoder model ---")
-        RERANKER_MODEL = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2', max_length=512)
-    return RERANKER_MODEL
+        from sentence_transformers.cross_encoder import CrossEncoder
 
-def extract_entities_from_text(text: str) -> list:
-    """Uses the LLM to extract key entities from a text chunk."""
-    model = get_llm_model() # Your lazy-loader for Gemini
+        print(f"--- LAZY LOADING: CrossEncoder model ({RERANKER_BACKEND}) ---")
+        if RERANKER_BACKEND == "onnx":
+            model_kwargs = {"file_name": RERANKER_ONNX_FILE} if RERANKER_ONNX_FILE else None
+            RERANKER_MODEL = CrossEncoder(RERANKER_MODEL_NAME, max_length=512, backend="onnx", model_kwargs=model_kwargs)
+        elif RERANKER_BACKEND == "int8":
+            import torch
 
-    generation_config = GenerationConfig(
-            max_output_tokens=4096,
-            temperature=0.0
+            RERANKER_MODEL = CrossEncoder(RERANKER_MODEL_NAME, max_length=512, device="cpu")
+            RERANKER_MODEL.model = torch.quantization.quantize_dynamic(
+                RERANKER_MODEL.model, {torch.nn.Linear}, dtype=torch.qint8
             )
+        elif RERANKER_BACKEND == "torch":
+            RERANKER_MODEL = CrossEncoder(RERANKER_MODEL_NAME, max_length=512)
+        else:
+            raise ValueError(f"Unknown RERANKER_BACKEND '{RERANKER_BACKEND}'. Choose 'torch', 'onnx' or 'int8'.")
+    return RERANKER_MODEL
 
-    prompt = (
-        "You are a helpful AI assistant for knowledge graph construction.\n"
-        "From the following text, extract the key entities (people, organizations, locations, technical concepts, projects).\n"
-        "Return the result as a JSON list of strings. Example: [\"NASA\", \"Aerojet Rocketdyne\", \"bipropellant valve\"]\n\n"
-        f"--- TEXT ---\n{text}\n\n"
-        "--- ENTITIES (JSON List) ---\n"
-    )
+def get_rerank_score_cache():
+    """Loads the LRU of reranker scores per (question, chunk)."""
+    global RERANK_SCORE_CACHE
+    if RERANK_SCORE_CACHE is None:
+        from .retrieval_cache import ScoreCache
+
+        RERANK_SCORE_CACHE = ScoreCache(max_items=RERANK_SCORE_CACHE_ITEMS)
+    return RERANK_SCORE_CACHE
+
+def get_entity_extractor():
+    """
+    Loads the entity extractor selected by the ENTITY_EXTRACTOR setting.
+
+    "gemini" (default) asks the LLM; "local" uses fast offline heuristics and
+    makes no API calls at all.
+    """
+    global ENTITY_EXTRACTOR
+    if ENTITY_EXTRACTOR is None:
+        from .extractors import ENTITY_EXTRACTORS
 
-    try:
-        response = model.generate_content(prompt, generation_config=generation_config)
-        ic(response.text)
-        # Clean up the response to get a valid JSON list
-        json_text = response.text.strip().replace("```json", "").replace("```", "")
-        entities = json.loads(json_text)
-        return entities
-    except (ValueError, json.JSONDecodeError) as e:
-        print(f"Could not parse entities from LLM response: {e}")
-        return []
+        backend = os.getenv("ENTITY_EXTRACTOR", "gemini").lower()
+        if backend not in ENTITY_EXTRACTORS:
+            raise ValueError(f"Unknown ENTITY_EXTRACTOR '{backend}'. Choose one of: {', '.join(ENTITY_EXTRACTORS)}")
+        ENTITY_EXTRACTOR = ENTITY_EXTRACTORS[backend]()
+    return ENTITY_EXTRACTOR
 
+def get_entity_dictionary():
+    """Loads the (initially empty) in-process dictionary of known entity names."""
+    global ENTITY_DICTIONARY
+    if ENTITY_DICTIONARY is None:
+        from .entity_matcher import EntityDictionary
+
+        ENTITY_DICTIONARY = EntityDictionary(refresh_seconds=ENTITY_DICTIONARY_REFRESH_SECONDS)
+    return ENTITY_DICTIONARY
+
+def find_question_entities(driver, question: str) -> list:
+    """Finds the entities a question mentions, as selected by QUESTION_ENTITY_SOURCE."""
+    if QUESTION_ENTITY_SOURCE == "extractor":
+        return extract_entities_from_text(question)
+    return get_entity_dictionary().match(driver, question)
+
+def extract_entities_from_text(text: str) -> list:
+    """Extracts key entities from a single text (a chunk or a question)."""
+    return get_entity_extractor().extract(text)
 
+def extract_entities_from_chunks(texts: list) -> list:
+    """Extracts entities for many chunks at once, one list per text, in order."""
+    return get_entity_extractor().extract_batch(texts)
@@ -0,0 +1,409 @@
+# rag_pipeline/vector_store.py
+
+import fcntl
+import hashlib
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+
+class VectorStore:
+    """
+    Where chunk embeddings are searched.
+
+    search() returns hits as dicts with at least 'chunk_id' and 'score'
+    (cosine similarity, higher is better). Chunk ids are the same ids the
+    Chunk nodes in Neo4j are keyed on, so the graph side can always look a hit
+    up. Stores that keep their own copy of the vectors are told about writes
+    and deletes through add(), delete() and commit().
+    """
+
+    name = "base"
+
+    def search(self, driver, query_embedding, filename=None, top_k=5):
+        """Returns the top_k nearest chunks, within one document if filename is given."""
+        raise NotImplementedError
+
+    def add(self, filename, chunk_ids, embeddings):
+        """Adds or replaces the vectors of these chunks."""
+
+    def delete(self, filename, page_numbers=None):
+        """Removes the vectors of some pages of a document, or of the whole document."""
+
+    def commit(self, filename):
+        """Called once a document's ingestion is complete."""
+
+
+class Neo4jVectorStore(VectorStore):
+    """Searches the `chunk_embeddings` vector index in Neo4j. The ingest query writes the vectors."""
+
+    name = "neo4j"
+
+    def __init__(self, overfetch_factor=1.5, max_fetch_k=1000, exact_scan_max_chunks=2000):
+        self.overfetch_factor = overfetch_factor
+        self.max_fetch_k = max_fetch_k
+        self.exact_scan_max_chunks = exact_scan_max_chunks
+
+    def search(self, driver, query_embedding, filename=None, top_k=5):
+        """
+        Vector similarity search, optionally restricted to the chunks of one document.
+
+        The vector index only returns the global nearest neighbours, so asking it
+        for top_k and then filtering by source returns nothing for most documents
+        once the corpus grows. Documents of up to exact_scan_max_chunks chunks are
+        therefore scanned exactly: only their own chunks (found through the
+        chunk_source index) are scored, so the cost follows the document's size,
+        not the corpus'. Larger documents over-fetch from the vector index: the
+        first request is sized so that top_k in-document hits would come back if
+        the document's chunks were spread evenly through the results, and it
+        doubles until enough in-document hits are found. Requests never exceed
+        max_fetch_k; if that is not enough, the document is scanned exactly.
+        """
+        query_embedding = [float(x) for x in query_embedding]
+
+        global_query = """
+        CALL db.index.vector.queryNodes('chunk_embeddings', $top_k, $embedding) YIELD node, score
+        RETURN node.chunk_id AS chunk_id, node.text AS text, node.page_number AS page,
+               node.chunk_on_page AS chunkno, score
+        """
+        count_query = """
+        MATCH (c:Chunk)
+        WITH count(c) AS total
+        OPTIONAL MATCH (dc:Chunk {source: $filename})
+        RETURN total, count(dc) AS in_document
+        """
+        search_query = """
+        CALL db.index.vector.queryNodes('chunk_embeddings', $fetch_k, $embedding) YIELD node, score
+        WHERE node.source = $filename
+        RETURN node.chunk_id AS chunk_id, node.text AS text, node.page_number AS page,
+               node.chunk_on_page AS chunkno, score
+        ORDER BY score DESC
+        LIMIT $top_k
+        """
+        exact_query = """
+        MATCH (c:Chunk {source: $filename})
+        WHERE c.embedding IS NOT NULL
+        WITH c, vector.similarity.cosine(c.embedding, $embedding) AS score
+        RETURN c.chunk_id AS chunk_id, c.text AS text, c.page_number AS page,
+               c.chunk_on_page AS chunkno, score
+        ORDER BY score DESC
+        LIMIT $top_k
+        """
+
+        def to_hits(results):
+            return [{"chunk_id": record["chunk_id"], "text": record["text"], "page": record["page"],
+                     "chunkno": record["chunkno"], "score": record["score"]} for record in results]
+
+        with driver.session(database="neo4j") as session:
+            if filename is None:
+                return to_hits(session.run(global_query, top_k=top_k, embedding=query_embedding))
+
+            counts = session.run(count_query, filename=filename).single()
+            total, in_document = counts["total"], counts["in_document"]
+            if not in_document:
+                return []
+
+            def exact_scan():
+                return to_hits(session.run(exact_query, top_k=top_k, embedding=query_embedding, filename=filename))
+
+            fetch_k = min(total, math.ceil(top_k * self.overfetch_factor * total / in_document))
+            if in_document <= self.exact_scan_max_chunks or fetch_k > self.max_fetch_k:
+                return exact_scan()
+
+            wanted = min(top_k, in_document)
+            while True:
+                hits = to_hits(session.run(
+                    search_query,
+                    fetch_k=fetch_k,
+                    top_k=top_k,
+                    embedding=query_embedding,
+                    filename=filename
+                ))
+                if len(hits) >= wanted or fetch_k >= total:
+                    return hits
+                if fetch_k >= self.max_fetch_k:
+                    return exact_scan()
+                fetch_k = min(total, self.max_fetch_k, fetch_k * 2)
+
+
+class FaissVectorStore(VectorStore):
+    """
+    In-process vector search with one FAISS index per document.
+
+    For each document the directory holds:
+
+        <key>.f32             - float32 vectors, one row per added chunk, appended to
+        <key>.ids.jsonl       - the matching chunk ids, one JSON string per line
+        <key>.rows            - how many rows (and id bytes) have been fully written
+        <key>.deletes.jsonl   - page deletes, each applying to the rows written before it
+        <key>.index           - the FAISS index built from the live rows by commit()
+        <key>.index.ids.json  - the chunk ids of the index's rows, written with it
+
+    add() and delete() only append, so each ingestion batch costs the same
+    however large the document already is. Re-added chunk ids replace their
+    earlier rows. commit() resolves deletes and replacements, builds the
+    index, and compacts the files once. Searches keep using the last
+    committed index and its own id list until commit() replaces both.
+
+    Small documents get an exact inner-product index; larger ones an IVF-Flat
+    index probing ivf_nprobe of its lists. Both can be memory-mapped on load,
+    so several processes share one copy of a document's vectors. Vectors are
+    L2-normalized, so inner product equals cosine similarity, as in the Neo4j
+    index. Indexes are reloaded when another process rewrites them.
+    """
+
+    name = "faiss"
+
+    def __init__(self, dimensions, index_dir, ivf_min_vectors=2000, ivf_nprobe=16):
+        self.dimensions = dimensions
+        self.index_dir = index_dir
+        self.ivf_min_vectors = ivf_min_vectors
+        self.ivf_nprobe = ivf_nprobe
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # filename -> (index mtime, faiss index, chunk ids)
+        self._loaded = {}
+
+    def _path(self, filename, suffix):
+        key = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, key + suffix)
+
+    # --- Vectors on disk ---
+
+    def _locked(self, filename, shared=False):
+        """
+        Returns an open lock file, locked exclusively while modifying a
+        document, or shared while reading its index and id snapshot.
+        """
+        lock_file = open(self._path(filename, ".lock"), "a")
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return lock_file
+
+    def _written(self, filename):
+        """Returns (rows, id bytes) fully written; anything past them is left over from an interrupted add()."""
+        try:
+            with open(self._path(filename, ".rows")) as f:
+                rows, id_bytes = json.load(f)
+            return rows, id_bytes
+        except FileNotFoundError:
+            return 0, 0
+
+    def _set_written(self, filename, rows, id_bytes):
+        rows_path = self._path(filename, ".rows")
+        with open(rows_path + ".tmp", "w") as f:
+            json.dump([rows, id_bytes], f)
+        os.replace(rows_path + ".tmp", rows_path)
+
+    def _append(self, filename, chunk_ids, vectors):
+        rows, id_bytes = self._written(filename)
+        ids_data = "".join(json.dumps(chunk_id) + "\n" for chunk_id in chunk_ids).encode("utf-8")
+        for suffix, offset, data in ((".f32", rows * self.dimensions * 4, vectors.tobytes()),
+                                     (".ids.jsonl", id_bytes, ids_data)):
+            with open(self._path(filename, suffix), "ab+") as f:
+                f.truncate(offset)
+                f.write(data)
+        # Written last: until then readers ignore the new rows
+        self._set_written(filename, rows + len(chunk_ids), id_bytes + len(ids_data))
+
+    def _read_live(self, filename):
+        """Returns (chunk ids, vectors, whether any rows are dead) after deletes and replacements."""
+        rows, id_bytes = self._written(filename)
+        if not rows:
+            return [], np.empty((0, self.dimensions), dtype=np.float32), False
+        with open(self._path(filename, ".ids.jsonl"), "rb") as f:
+            chunk_ids = [json.loads(line) for line in f.read(id_bytes).splitlines()]
+        vectors = np.fromfile(self._path(filename, ".f32"), dtype=np.float32,
+                              count=rows * self.dimensions).reshape(rows, self.dimensions)
+
+        # page -> rows written before its latest delete
+        deleted_before = {}
+        if os.path.exists(self._path(filename, ".deletes.jsonl")):
+            with open(self._path(filename, ".deletes.jsonl")) as f:
+                for line in f:
+                    delete = json.loads(line)
+                    for page in delete["pages"]:
+                        deleted_before[page] = max(deleted_before.get(page, 0), delete["rows"])
+
+        # The last row of a chunk id wins, unless a later delete covers its page.
+        # Chunk ids are "<filename>:<page>:<position>".
+        live, seen = [], set()
+        for row in range(rows - 1, -1, -1):
+            chunk_id = chunk_ids[row]
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            if row >= deleted_before.get(chunk_id.rsplit(":", 2)[-2], 0):
+                live.append(row)
+        live.reverse()
+        return [chunk_ids[row] for row in live], vectors[live], len(live) != rows
+
+    def _compact(self, filename, chunk_ids, vectors):
+        """Rewrites the document's files with only its live rows."""
+        ids_data = "".join(json.dumps(chunk_id) + "\n" for chunk_id in chunk_ids).encode("utf-8")
+        for suffix, data in ((".f32", np.ascontiguousarray(vectors, dtype=np.float32).tobytes()),
+                             (".ids.jsonl", ids_data)):
+            path = self._path(filename, suffix)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        self._set_written(filename, len(chunk_ids), len(ids_data))
+        if os.path.exists(self._path(filename, ".deletes.jsonl")):
+            os.remove(self._path(filename, ".deletes.jsonl"))
+
+    def add(self, filename, chunk_ids, embeddings):
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dimensions)
+        lock_file = self._locked(filename)
+        try:
+            self._append(filename, list(chunk_ids), vectors)
+        finally:
+            lock_file.close()
+
+    def delete(self, filename, page_numbers=None):
+        lock_file = self._locked(filename)
+        try:
+            if page_numbers is None:
+                for suffix in (".f32", ".ids.jsonl", ".rows", ".deletes.jsonl", ".index", ".index.ids.json"):
+                    if os.path.exists(self._path(filename, suffix)):
+                        os.remove(self._path(filename, suffix))
+                return
+
+            rows, _ = self._written(filename)
+            if rows:
+                with open(self._path(filename, ".deletes.jsonl"), "a") as f:
+                    f.write(json.dumps({"rows": rows, "pages": sorted({str(p) for p in page_numbers})}) + "\n")
+        finally:
+            lock_file.close()
+            if page_numbers is None:
+                with self._lock:
+                    self._loaded.pop(filename, None)
+
+    def _build_index(self, vectors):
+        import faiss
+
+        if len(vectors) < self.ivf_min_vectors:
+            index = faiss.IndexFlatIP(self.dimensions)
+        else:
+            # About 4 * sqrt(n) lists, with enough training points per list
+            nlist = max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // 39))
+            quantizer = faiss.IndexFlatIP(self.dimensions)
+            index = faiss.IndexIVFFlat(quantizer, self.dimensions, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+        index.add(vectors)
+        return index
+
+    def commit(self, filename):
+        """(Re)builds and saves the FAISS index of a document from its stored vectors."""
+        import faiss
+
+        lock_file = self._locked(filename)
+        try:
+            chunk_ids, vectors, has_dead_rows = self._read_live(filename)
+            if has_dead_rows:
+                self._compact(filename, chunk_ids, vectors)
+
+            index_path = self._path(filename, ".index")
+            snapshot_path = self._path(filename, ".index.ids.json")
+            if not chunk_ids:
+                for path in (index_path, snapshot_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+
+            vectors = np.ascontiguousarray(vectors)
+            faiss.normalize_L2(vectors)
+            faiss.write_index(self._build_index(vectors), index_path + ".tmp")
+            with open(snapshot_path + ".tmp", "w") as f:
+                json.dump(chunk_ids, f)
+            # Readers take the shared lock, so they see both files replaced or neither
+            os.replace(snapshot_path + ".tmp", snapshot_path)
+            os.replace(index_path + ".tmp", index_path)
+        finally:
+            lock_file.close()
+
+    # --- Search ---
+
+    def _load(self, filename):
+        """Returns (index, chunk ids) for a document, or None if it has no index yet."""
+        import faiss
+
+        index_path = self._path(filename, ".index")
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            loaded = self._loaded.get(filename)
+            if loaded and loaded[0] == mtime:
+                return loaded[1], loaded[2]
+
+            lock_file = self._locked(filename, shared=True)
+            try:
+                try:
+                    mtime = os.stat(index_path).st_mtime_ns
+                    try:
+                        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                    except RuntimeError:
+                        # Not every index type can be memory-mapped
+                        index = faiss.read_index(index_path)
+                    # The ids the index was built from, not the (possibly newer) ones being ingested
+                    with open(self._path(filename, ".index.ids.json")) as f:
+                        chunk_ids = json.load(f)
+                except FileNotFoundError:
+                    return None
+            finally:
+                lock_file.close()
+            if hasattr(index, "nprobe"):
+                index.nprobe = self.ivf_nprobe
+
+            self._loaded[filename] = (mtime, index, chunk_ids)
+            return index, chunk_ids
+
+    def has_document(self, filename):
+        return os.path.exists(self._path(filename, ".index"))
+
+    def search(self, driver, query_embedding, filename=None, top_k=5):
+        import faiss
+
+        if filename is None:
+            # Global search: merge the best hits of every document
+            hits = []
+            for ids_file in os.listdir(self.index_dir):
+                if ids_file.endswith(".index.ids.json"):
+                    with open(os.path.join(self.index_dir, ids_file)) as f:
+                        chunk_ids = json.load(f)
+                    if chunk_ids:
+                        hits.extend(self.search(driver, query_embedding, chunk_ids[0].rsplit(":", 2)[0], top_k))
+            return sorted(hits, key=lambda hit: hit["score"], reverse=True)[:top_k]
+
+        loaded = self._load(filename)
+        if loaded is None:
+            return []
+        index, chunk_ids = loaded
+
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(query)
+        scores, rows = index.search(query, min(top_k, len(chunk_ids)))
+        return [{"chunk_id": chunk_ids[row], "score": float(score)}
+                for score, row in zip(scores[0], rows[0]) if row >= 0]
+
+    def sync_from_neo4j(self, driver, filename):
+        """Rebuilds a document's index from the embeddings stored in Neo4j."""
+        query = """
+        MATCH (:Document {filename: $filename})-[:HAS_CHUNK]->(c:Chunk)
+        WHERE c.chunk_id IS NOT NULL AND c.embedding IS NOT NULL
+        RETURN c.chunk_id AS chunk_id, c.embedding AS embedding
+        """
+        with driver.session(database="neo4j") as session:
+            records = list(session.run(query, filename=filename))
+
+        self.delete(filename)
+        if records:
+            self.add(filename, [record["chunk_id"] for record in records],
+                     [record["embedding"] for record in records])
+        self.commit(filename)
+        return len(records)
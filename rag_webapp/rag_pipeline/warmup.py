@@ -0,0 +1,87 @@
+# rag_pipeline/warmup.py
+
+import gc
+import os
+import time
+
+from . import utils
+
+# Model name -> (loader, attribute of rag_pipeline.utils holding the loaded model)
+MODELS = {
+    "embedding": (utils.get_embedding_model, "EMBEDDING_MODEL"),
+    "reranker": (utils.get_reranker_model, "RERANKER_MODEL"),
+    "docling": (utils.get_docling_converter, "DOCLING_CONVERTER"),
+}
+
+
+def preload_models(names=None):
+    """
+    Loads models in the current process, meant to run before it forks workers.
+
+    The weights are loaded but not run: the inference thread pools are not
+    fork-safe, so warm_models() does the first inference in each worker.
+    Afterwards every surviving object is moved out of the garbage
+    collector's reach with gc.freeze(), so collections in the forked workers
+    do not write to (and thereby copy) the pages holding the shared weights.
+
+    Args:
+        names (list): Models to load. Defaults to the PRELOAD_MODELS setting.
+
+    Returns:
+        list: The names of the models that were loaded.
+    """
+    names = utils.PRELOAD_MODELS if names is None else names
+    loaded = []
+    for name in names:
+        if name not in MODELS:
+            raise ValueError(f"Unknown model '{name}' in PRELOAD_MODELS. Choose from {', '.join(MODELS)} or 'all'.")
+        start = time.perf_counter()
+        model = MODELS[name][0]()
+        if name == "docling" and hasattr(model, "initialize_pipeline"):
+            # Load the layout and table models now rather than on the first conversion
+            from docling.datamodel.base_models import InputFormat
+
+            model.initialize_pipeline(InputFormat.PDF)
+        print(f"--- [Warmup] Loaded {name} model in {time.perf_counter() - start:.1f} s ---")
+        loaded.append(name)
+
+    if loaded:
+        gc.collect()
+        gc.freeze()
+    return loaded
+
+
+def warm_models():
+    """Runs one tiny inference through every resident model, so the first real request does not pay for it."""
+    if utils.EMBEDDING_MODEL is not None:
+        utils.encode_texts(utils.EMBEDDING_MODEL, ["warmup"])
+    if utils.RERANKER_MODEL is not None:
+        utils.RERANKER_MODEL.predict([["warmup", "warmup"]], show_progress_bar=False)
+
+
+def resident_set_size_mb():
+    """Current resident memory of this process in MB, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def model_status():
+    """
+    Reports which models are loaded in this process.
+
+    Returns:
+        dict: 'ready' (every model in PRELOAD_MODELS is loaded), the loaded
+        state of each model, the preload list, the process id and its RSS.
+    """
+    resident = {name: getattr(utils, attribute) is not None for name, (_, attribute) in MODELS.items()}
+    return {
+        "ready": all(resident[name] for name in utils.PRELOAD_MODELS if name in resident),
+        "models": resident,
+        "preload": utils.PRELOAD_MODELS,
+        "pid": os.getpid(),
+        "rss_mb": resident_set_size_mb(),
+    }
@@ -129,12 +129,19 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Django-Q runs on the Redis broker. Each cluster process serves one queue,
+# picked with Q_CLUSTER_NAME: "interactive" (uploads, finalize steps; short
+# tasks) or "bulk" (page-range shards of large PDFs). Run one qcluster per
+# queue, each with as many workers as it has cores to spare.
+Q_INTERACTIVE_QUEUE = 'interactive'
+Q_BULK_QUEUE = 'bulk'
+
 Q_CLUSTER = {
-    'name': 'DjangORM',
-    'workers': 1,  # Start with one worker, perfect for local dev
-    'timeout': 600, # Give tasks up to 10 minutes to complete (for large PDFs)
-    'retry': 720,   # Retry failed tasks after 12 minutes
+    'name': os.getenv('Q_CLUSTER_NAME', Q_INTERACTIVE_QUEUE),
+    'workers': int(os.getenv('Q_WORKERS', os.cpu_count() or 2)),
+    'timeout': int(os.getenv('Q_TIMEOUT', '600')), # Seconds a task may run
+    'retry': int(os.getenv('Q_TIMEOUT', '600')) + 120, # Retry unacknowledged tasks after this
     'queue_limit': 50,
     'bulk': 10,
-    'orm': 'default' # Use the default Django database to store tasks
+    'redis': os.getenv('Q_REDIS_URL', 'redis://redis:6379/0'),
 }